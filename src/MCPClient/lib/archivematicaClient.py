@@ -45,7 +45,13 @@ import traceback
 
 
 config = ConfigParser.SafeConfigParser(
-    defaults={'django_settings_module': 'settings.common'})
+    defaults={'django_settings_module': 'settings.common',
+              'taskOutputSpoolDirectory': '',
+              'taskOutputHeadSize': '65536',
+              'taskOutputTailSize': '65536',
+              'taskOutputRetentionDays': '7',
+              'metricsListen': '',
+              'pythonScriptPool': 'false'})
 config.read("/etc/archivematica/MCPClient/clientConfig.conf")
 
 os.environ['DJANGO_SETTINGS_MODULE'] = config.get('MCPClient', 'django_settings_module')
@@ -61,7 +67,9 @@ sys.path.append("/usr/lib/archivematica/archivematicaCommon")
 from django_mysqlpool import auto_close_db
 from custom_handlers import GroupWriteRotatingFileHandler
 import databaseFunctions
-from executeOrRunSubProcess import executeOrRun
+from executeOrRunSubProcess import executeOrRun, removeOldSpools
+import metrics
+import scriptPool
 
 
 LOGGING_CONFIG = {
@@ -137,6 +145,7 @@ def executeCommand(gearman_worker, gearman_job):
     try:
         execute = gearman_job.task
         logger.info('Executing %s (%s)', execute, gearman_job.unique)
+        metrics.job_received(execute)
         data = cPickle.loads(gearman_job.data)
         utcDate = databaseFunctions.getUTCDate()
         arguments = data["arguments"]#.encode("utf-8")
@@ -163,6 +172,7 @@ Unable to determine if it completed successfully."""
             exitCode = -1
             return cPickle.dumps({"exitCode" : exitCode, "stdOut": output[0], "stdError": output[1]})
         command = supportedModules[execute]
+        script = command.strip()
 
         replacementDic["%date%"] = utcDate.isoformat()
         replacementDic["%jobCreatedDate%"] = data["createdDate"]
@@ -185,7 +195,24 @@ Unable to determine if it completed successfully."""
         # Execute command
         command += " " + arguments
         logger.info('<processingCommand>{%s}%s</processingCommand>', gearman_job.unique, command)
-        exitCode, stdOut, stdError = executeOrRun("command", command, sInput, printing=False, env_updates=env_updates)
+        capture = {}
+        spoolDirectory = config.get('MCPClient', 'taskOutputSpoolDirectory')
+        if spoolDirectory:
+            capture = {
+                'spool_path': os.path.join(spoolDirectory, gearman_job.unique),
+                'head_size': config.getint('MCPClient', 'taskOutputHeadSize'),
+                'tail_size': config.getint('MCPClient', 'taskOutputTailSize'),
+                'rusage_callback': metrics.rusage_recorder(execute),
+            }
+            if data.get("fullOutput"):
+                # The server keeps or parses this output, so it is sent whole
+                capture['head_size'] = capture['tail_size'] = sys.maxsize
+        started = time.time()
+        if scriptPool.handles(script):
+            exitCode, stdOut, stdError = scriptPool.run(command, env_updates=env_updates, **capture)
+        else:
+            exitCode, stdOut, stdError = executeOrRun("command", command, sInput, printing=False, env_updates=env_updates, **capture)
+        metrics.job_finished(execute, exitCode, time.time() - started)
         return cPickle.dumps({"exitCode": exitCode, "stdOut": stdOut, "stdError": stdError})
     except OSError as ose:
         logger.exception('Execution failed')
@@ -221,11 +248,41 @@ def startThread(threadNumber):
                 failSleep += failSleepIncrementor
 
 
-def startThreads(t=1):
-    """Start a processing thread for each core (t=0), or a specified number of threads."""
+def sweepSpoolDirectory(directory, max_age, interval=3600):
+    """Remove spooled task output older than max_age seconds every interval seconds."""
+    while True:
+        try:
+            if os.path.isdir(directory):
+                removed = removeOldSpools(directory, max_age)
+                if removed:
+                    logger.info('Removed %d old task output files from %s', removed, directory)
+        except Exception:
+            logger.exception('Unable to remove old task output from %s', directory)
+        time.sleep(interval)
+
+
+def startSpoolSweeper():
+    """Start a thread removing old spooled task output, if it is kept."""
+    directory = config.get('MCPClient', 'taskOutputSpoolDirectory')
+    retention_days = config.getfloat('MCPClient', 'taskOutputRetentionDays')
+    if not directory or retention_days <= 0:
+        return
+    t = threading.Thread(target=sweepSpoolDirectory, args=(directory, retention_days * 24 * 60 * 60))
+    t.daemon = True
+    t.start()
+
+
+def threadCount():
+    """Number of processing threads: numberOfTasks, or one per core if that is 0."""
+    t = config.getint('MCPClient', "numberOfTasks")
     if t == 0:
         from externals.detectCores import detectCPUs
         t = detectCPUs()
+    return t
+
+
+def startThreads(t=1):
+    """Start a specified number of processing threads."""
     for i in range(t):
         t = threading.Thread(target=startThread, args=(i+1, ))
         t.daemon = True
@@ -235,7 +292,13 @@ def startThreads(t=1):
 if __name__ == '__main__':
     try:
         loadSupportedModules(config.get('MCPClient', "archivematicaClientModules"))
-        startThreads(config.getint('MCPClient', "numberOfTasks"))
+        threads = threadCount()
+        # Workers are forked, so before any thread is started
+        if config.getboolean('MCPClient', 'pythonScriptPool'):
+            scriptPool.start(threads)
+        metrics.start(config.get('MCPClient', 'metricsListen'))
+        startSpoolSweeper()
+        startThreads(threads)
         while True:
             time.sleep(100)
     except (KeyboardInterrupt, SystemExit):
@@ -24,6 +24,7 @@
 from __future__ import print_function
 import os
 import sys
+from optparse import OptionParser
 import uuid
 
 import django
@@ -32,19 +33,27 @@ django.setup()
 from main.models import Event
 
 # archivematicaCommon
+from archivematicaFunctions import unicodeToStr
+import clamdScanner
 from custom_handlers import get_script_logger
 from executeOrRunSubProcess import executeOrRun
+import databaseFunctions
 from databaseFunctions import insertIntoEvents
 
-if __name__ == '__main__':
-    logger = get_script_logger("archivematica.mcp.client.clamscan")
-    fileUUID = sys.argv[1]
-    target = sys.argv[2]
-    date = sys.argv[3]
+# Virus check events written at a time when scanning a whole unit
+EVENT_BATCH_SIZE = 100
+
+
+def eventDetail(version):
+    """Returns the event detail of a scan by the clamd version string "ClamAV 0.99.2/22345/Tue Oct 18 09:55:11 2016"."""
+    version, virusDefs, virusDefsDate = version.strip().split("/")
+    virusDefs = virusDefs + "/" + virusDefsDate
+    return 'program="Clam AV"; version="' + version + '"; virusDefinitions="' + virusDefs + '"'
 
+
+def scanFile(fileUUID, target, date):
     # Check if scan event already exists for this file - if so abort early
-    count = Event.objects.filter(file_uuid_id=fileUUID, event_type='virus check').count()
-    if count >= 1:
+    if Event.objects.filter(file_uuid_id=fileUUID, event_type='virus check').exists():
         print('Virus scan already performed, not running scan again')
         sys.exit(0)
 
@@ -75,12 +84,88 @@ if __name__ == '__main__':
         print('Clamscan Standard output:', scan_stdout, file=sys.stderr)
         print('Clamscan Standard error:', scan_stderr, file=sys.stderr)
 
-    version, virusDefs, virusDefsDate = version_stdout.split("/")
-    virusDefs = virusDefs + "/" + virusDefsDate
-    eventDetailText = 'program="Clam AV"; version="' + version + '"; virusDefinitions="' + virusDefs + '"'
+    eventDetailText = eventDetail(version_stdout)
 
     print('Event outcome:', eventOutcome)
     if fileUUID != "None":
         insertIntoEvents(fileUUID=fileUUID, eventIdentifierUUID=str(uuid.uuid4()), eventType="virus check", eventDateTime=date, eventDetail=eventDetailText, eventOutcome=eventOutcome, eventOutcomeDetailNote="")
     if eventOutcome != "Pass":
         sys.exit(3)
+
+
+def scanUnit(unitUUID, unitType, unitDirectory, subdirectory, date):
+    """
+    Scan every file in subdirectory of the unit with clamd, several at a
+    time, skipping those already scanned, and write their virus check events
+    in bulk. Returns the exit code.
+    """
+    dbFiles = databaseFunctions.getUnitFiles(unitUUID, unitType, unitDirectory)
+    scanned = databaseFunctions.getUnitFilesWithEvent(unitUUID, unitType, 'virus check')
+
+    files = []
+    for dirpath, _, filenames in os.walk(os.path.join(unicodeToStr(unitDirectory), subdirectory)):
+        for filename in filenames:
+            filePath = os.path.join(dirpath, filename)
+            fileUUID = dbFiles.get(filePath, (None,))[0]
+            if fileUUID in scanned:
+                continue
+            # Files not in the database are scanned, but have no event
+            files.append((fileUUID, filePath))
+    print('Scanning', len(files), 'files;', len(scanned), 'already scanned')
+    if not files:
+        return 0
+
+    def record(results):
+        databaseFunctions.bulkInsertIntoEvents([{
+            'fileUUID': result.key,
+            'eventType': 'virus check',
+            'eventDateTime': date,
+            'eventDetail': eventDetailText,
+            'eventOutcome': 'Pass' if clamdScanner.result_passed(result) else 'Fail',
+        } for result in results if result.key is not None])
+
+    scanner = clamdScanner.from_client_config()
+    try:
+        try:
+            eventDetailText = eventDetail(scanner.version())
+        except Exception as e:
+            print('Error determining version, aborting:', e, file=sys.stderr)
+            return 2
+
+        exitCode = 0
+        # Events are written as files are scanned, so those scanned before
+        # an interruption are skipped when the unit is scanned again
+        batch = []
+        for result in scanner.scan(files):
+            if not clamdScanner.result_passed(result):
+                exitCode = 3
+                print('Scan failed for file', result.key, " - ", os.path.basename(result.path), file=sys.stderr)
+                if result.virus:
+                    print('Virus found:', result.virus, file=sys.stderr)
+                else:
+                    print('Error:', result.error, file=sys.stderr)
+            batch.append(result)
+            if len(batch) >= EVENT_BATCH_SIZE:
+                record(batch)
+                batch = []
+        record(batch)
+    finally:
+        scanner.close()
+    return exitCode
+
+
+if __name__ == '__main__':
+    logger = get_script_logger("archivematica.mcp.client.clamscan")
+
+    parser = OptionParser()
+    parser.add_option('-u', '--unitUUID', action='store', dest='unitUUID', default='')
+    parser.add_option('-t', '--unitType', action='store', dest='unitType', default='')
+    parser.add_option('-D', '--unitDirectory', action='store', dest='unitDirectory', default='')
+    parser.add_option('-s', '--subdirectory', action='store', dest='subdirectory', default='')
+    parser.add_option('-d', '--date', action='store', dest='date', default='')
+    (opts, args) = parser.parse_args()
+
+    if opts.unitUUID:
+        sys.exit(scanUnit(opts.unitUUID, opts.unitType, opts.unitDirectory, opts.subdirectory, opts.date))
+    # One file: fileUUID target date [taskUUID]
+    scanFile(args[0], args[1], args[2])
@@ -6,6 +6,9 @@
 #
 # If a tool has no defined characterization commands, then the default
 # will be run instead (currently FITS).
+#
+# XML output is cached by the file's checksum and extension, and reused for
+# identical files.
 from __future__ import print_function
 import sys
 
@@ -14,10 +17,11 @@ from lxml import etree
 import django
 django.setup()
 # dashboard
-from main.models import FPCommandOutput
+from main.models import File, FPCommandOutput
 from fpr.models import FPRule, FormatVersion
 
 # archivematicaCommon
+import characterizationCache
 from custom_handlers import get_script_logger
 from executeOrRunSubProcess import executeOrRun
 from databaseFunctions import insertIntoFPCommandOutput
@@ -29,9 +33,13 @@ def main(file_path, file_uuid, sip_uuid):
 
     # Check to see whether the file has already been characterized; don't try
     # to characterize it a second time if so.
-    if FPCommandOutput.objects.filter(file_id=file_uuid).count() > 0:
+    if FPCommandOutput.objects.filter(file_id=file_uuid).exists():
         return 0
 
+    checksum_type, checksum = File.objects.filter(uuid=file_uuid).values_list('checksumtype', 'checksum').first() or (None, None)
+    cache_size = characterizationCache.max_size_from_client_config()
+    cacheable = cache_size > 0 and checksum_type and checksum and checksum != 'None'
+
     try:
         format = FormatVersion.active.get(fileformatversion__file_uuid=file_uuid)
     except FormatVersion.DoesNotExist:
@@ -47,6 +55,19 @@ def main(file_path, file_uuid, sip_uuid):
         rules = FPRule.active.filter(purpose='default_characterization')
 
     for rule in rules:
+        # fmt/101 is XML - we want to collect and package any XML output, while
+        # allowing other commands to execute without actually collecting their
+        # output in the event that they are writing their output to disk.
+        xml_output = rule.command.output_format and rule.command.output_format.pronom_id == 'fmt/101'
+        if cacheable and xml_output:
+            cache_key = (checksum_type, checksum, rule.uuid,
+                         rule.command.tool.version[:64] if rule.command.tool else '')
+            cached = characterizationCache.get(*cache_key, file_path=file_path)
+            if cached is not None:
+                insertIntoFPCommandOutput(file_uuid, cached, rule.uuid)
+                print('Saved cached XML output for command "{}" ({}) of an identical file'.format(rule.command.description, rule.command.uuid))
+                continue
+
         if rule.command.script_type == 'bashScript' or rule.command.script_type == 'command':
             args = []
             command_to_execute = replace_string_values(rule.command.command,
@@ -65,16 +86,15 @@ def main(file_path, file_uuid, sip_uuid):
                 stderr, file=sys.stderr)
             failed = True
             continue
-        # fmt/101 is XML - we want to collect and package any XML output, while
-        # allowing other commands to execute without actually collecting their
-        # output in the event that they are writing their output to disk.
         # FPCommandOutput can have multiple rows for a given file,
         # distinguished by the rule that produced it.
-        if rule.command.output_format and rule.command.output_format.pronom_id == 'fmt/101':
+        if xml_output:
             try:
                 etree.fromstring(stdout)
                 insertIntoFPCommandOutput(file_uuid, stdout, rule.uuid)
                 print('Saved XML output for command "{}" ({})'.format(rule.command.description, rule.command.uuid))
+                if cacheable:
+                    characterizationCache.put(*cache_key, file_path=file_path, output=stdout, max_size=cache_size)
             except etree.XMLSyntaxError:
                 failed = True
                 print('XML output for command "{}" ({}) was not valid XML; not saving to database'.format(rule.command.description, rule.command.uuid), file=sys.stderr)
@@ -28,8 +28,9 @@ import shutil
 
 import django
 django.setup()
+from django.utils import timezone
 # dashboard
-from main.models import Job, SIP
+from main.models import Job, SIP, UnitStatus
 
 # archivematicaCommon
 from custom_handlers import get_script_logger
@@ -70,8 +71,11 @@ if __name__ == '__main__':
         # otherwise doesn't appear in dashboard
         createSIP(unitPath, UUID=originalSIPUUID)
         Job.objects.create(jobtype="Hack to make DIP Jobs appear",
+                           createdtime=timezone.now(),
                            directory=unitPath,
-                           sip_id=originalSIPUUID,
+                           sipuuid=originalSIPUUID,
                            currentstep="Completed successfully",
                            unittype="unitSIP",
                            microservicegroup="Upload DIP")
+        # The dashboard lists units from their status
+        UnitStatus.objects.refresh(originalSIPUUID, 'unitSIP')
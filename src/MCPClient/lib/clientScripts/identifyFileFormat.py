@@ -2,22 +2,34 @@
 
 from __future__ import print_function
 import argparse
+from multiprocessing.pool import ThreadPool
+import os
 import sys
 import uuid
 
 import django
 django.setup()
+from django.db import IntegrityError, transaction
 # dashboard
 from fpr.models import IDCommand, IDRule, FormatVersion
-from main.models import FileFormatVersion, File, FileID, UnitVariable
+from main.models import FileFormatVersion, File, FileID, FormatIdentificationCache, UnitVariable
 
 # archivematicaCommon
+from archivematicaFunctions import unicodeToStr
 from custom_handlers import get_script_logger
 from executeOrRunSubProcess import executeOrRun
+import databaseFunctions
 from databaseFunctions import getUTCDate, insertIntoEvents
+from env_configparser import read_client_config
 
+# Most values in one IN query, or rows in one INSERT
+BATCH_SIZE = 500
+DEFAULT_WORKERS = 4
+# Longest extension, lower cased, which is cached
+EXTENSION_MAX_LENGTH = 32
 
-def save_idtool(file_, value):
+
+def save_idtool(unit_uuid, value):
     """
     Saves the chosen ID tool's UUID in a unit variable, which allows it to be
     refetched by a later chain.
@@ -27,21 +39,15 @@ def save_idtool(file_, value):
     variable, which will be transformed back into a passVar when a new chain in
     the same unit is begun.
     """
-
-    # The unit_uuid foreign key can point to a transfer or SIP, and this tool
-    # runs in both.
-    # Check the SIP first - if it hasn't been assigned yet, then this is being
-    # run during the transfer.
-    unit = file_.sip or file_.transfer
-
     rd = {
         "%IDCommand%": value
     }
 
-    UnitVariable.objects.create(unituuid=unit.pk, variable='replacementDict', variablevalue=str(rd))
+    UnitVariable.objects.create(unituuid=unit_uuid, variable='replacementDict', variablevalue=str(rd))
 
 
-def write_identification_event(file_uuid, command, format=None, success=True):
+def identification_event(file_uuid, command, format=None, success=True):
+    """Returns the insertIntoEvents keyword arguments of an identification event."""
     event_detail_text = 'program="{}"; version="{}"'.format(
         command.tool.description, command.tool.version)
     if success:
@@ -52,20 +58,24 @@ def write_identification_event(file_uuid, command, format=None, success=True):
     if not format:
         format = 'No Matching Format'
 
-    date = getUTCDate()
+    return {
+        'fileUUID': file_uuid,
+        'eventIdentifierUUID': str(uuid.uuid4()),
+        'eventType': "format identification",
+        'eventDateTime': getUTCDate(),
+        'eventDetail': event_detail_text,
+        'eventOutcome': event_outcome_text,
+        'eventOutcomeDetailNote': format,
+    }
 
-    insertIntoEvents(fileUUID=file_uuid,
-                     eventIdentifierUUID=str(uuid.uuid4()),
-                     eventType="format identification",
-                     eventDateTime=date,
-                     eventDetail=event_detail_text,
-                     eventOutcome=event_outcome_text,
-                     eventOutcomeDetailNote=format)
 
+def write_identification_event(file_uuid, command, format=None, success=True, agents=None):
+    insertIntoEvents(agents=agents, **identification_event(file_uuid, command, format=format, success=success))
 
-def write_file_id(file_uuid, format, output):
+
+def file_id(file_uuid, format, output):
     """
-    Write the identified format to the DB.
+    Returns the FileID recording the identified format.
 
     :param str file_uuid: UUID of the file identified
     :param FormatVersion format: FormatVersion it was identified as
@@ -81,7 +91,7 @@ def write_file_id(file_uuid, format, output):
     # Sometimes, this is null instead of an empty string
     version = format.version or ''
 
-    FileID.objects.create(
+    return FileID(
         file_id=file_uuid,
         format_name=format.format.description,
         format_version=version,
@@ -90,6 +100,11 @@ def write_file_id(file_uuid, format, output):
     )
 
 
+def write_file_id(file_uuid, format, output):
+    """Write the identified format to the DB; see file_id."""
+    file_id(file_uuid, format, output).save()
+
+
 def main(command_uuid, file_path, file_uuid, disable_reidentify):
     print("IDCommand UUID:", command_uuid)
     print("File: ({}) {}".format(file_uuid, file_path))
@@ -109,8 +124,12 @@ def main(command_uuid, file_path, file_uuid, disable_reidentify):
         print('This file has already been identified, and re-identification is disabled. Skipping.')
         return 0
 
-    # Save the selected ID command for use in a later chain
-    save_idtool(file_, command_uuid)
+    # Save the selected ID command for use in a later chain.
+    # The unit_uuid foreign key can point to a transfer or SIP, and this tool
+    # runs in both.
+    # Check the SIP first - if it hasn't been assigned yet, then this is being
+    # run during the transfer.
+    save_idtool((file_.sip or file_.transfer).pk, command_uuid)
 
     exitcode, output, _ = executeOrRun(command.script_type, command.script, arguments=[file_path], printing=False)
     output = output.strip()
@@ -153,14 +172,208 @@ def main(command_uuid, file_path, file_uuid, disable_reidentify):
     return 0
 
 
+def get_formats(command, outputs):
+    """
+    Returns the FormatVersion each of the command's outputs identifies, as a
+    dict of output: (FormatVersion, error), looking the rules up in a few
+    queries. The FormatVersion is None, and error says why, if an output
+    doesn't identify exactly one.
+    """
+    outputs = list(set(outputs))
+    matches = dict((output, []) for output in outputs)
+    for start in range(0, len(outputs), BATCH_SIZE):
+        batch = outputs[start:start + BATCH_SIZE]
+        # PUIDs are the same regardless of tool, so PUID-producing tools don't have "rules" per se - we just
+        # go straight to the FormatVersion table to see if there's a matching PUID
+        if command.config == 'PUID':
+            for version in FormatVersion.active.filter(pronom_id__in=batch).select_related('format'):
+                matches[version.pronom_id].append(version)
+        else:
+            for rule in IDRule.active.filter(command=command, command_output__in=batch).select_related('format__format'):
+                matches[rule.command_output].append(rule.format)
+
+    formats = {}
+    for output, versions in matches.items():
+        if len(versions) == 1:
+            formats[output] = (versions[0], None)
+        elif command.config == 'PUID':
+            formats[output] = (None, 'No FPR format record found for PUID {}'.format(output) if not versions else
+                               'Multiple FPR format records found for PUID {}'.format(output))
+        else:
+            formats[output] = (None, 'No FPR identification rule for tool output "{}" found'.format(output) if not versions else
+                               'Multiple FPR identification rules for tool output "{}" found'.format(output))
+    return formats
+
+
+def file_key(path, checksum_type, checksum):
+    """
+    Returns the key of the file at path: files with the same key are
+    identified the same way. Commands such as FIDO's and Siegfried's take the
+    extension into account as well as the contents, so it is part of the key.
+    Files which can't be cached, having no checksum or too long an extension,
+    are keyed by their path.
+    """
+    extension = os.path.splitext(path)[1].decode('utf-8').lower()
+    if checksum_type and checksum and checksum != 'None' and len(extension) <= EXTENSION_MAX_LENGTH:
+        return (checksum_type, checksum, extension)
+    return (None, path, None)
+
+
+def get_cached_outputs(command, keys):
+    """Returns the command's cached output for each (checksum type, checksum, extension) in keys that has one."""
+    keys = set(keys)
+    by_type = {}
+    for checksum_type, checksum, _ in keys:
+        by_type.setdefault(checksum_type, set()).add(checksum)
+    outputs = {}
+    for checksum_type, values in by_type.items():
+        values = list(values)
+        for start in range(0, len(values), BATCH_SIZE):
+            for checksum, extension, output in FormatIdentificationCache.objects.filter(
+                    command_uuid=command.uuid, checksum_type=checksum_type,
+                    checksum__in=values[start:start + BATCH_SIZE]).values_list('checksum', 'extension', 'output'):
+                if (checksum_type, checksum, extension) in keys:
+                    outputs[(checksum_type, checksum, extension)] = output
+    return outputs
+
+
+def cache_outputs(command, outputs):
+    """Caches the command's output for each (checksum type, checksum, extension) in outputs."""
+    try:
+        with transaction.atomic():
+            FormatIdentificationCache.objects.bulk_create([
+                FormatIdentificationCache(command_uuid=command.uuid, checksum_type=checksum_type,
+                                          checksum=checksum, extension=extension, output=output)
+                for (checksum_type, checksum, extension), output in outputs.items()
+            ], batch_size=BATCH_SIZE)
+    except IntegrityError:
+        # Another unit with some of the same files was identified at the same time
+        pass
+
+
+def get_workers():
+    config = read_client_config({'formatIdentificationWorkers': str(DEFAULT_WORKERS)})
+    return config.getint('MCPClient', 'formatIdentificationWorkers')
+
+
+def identify_unit(command_uuid, unit_uuid, unit_type, unit_directory, subdirectory, disable_reidentify):
+    """
+    Identify the format of every file in subdirectory of the unit.
+
+    Files with the same checksum and extension are identified once, and not
+    at all if such a file was identified by the same command before. The
+    command is run for the others several files at a time. The results are
+    written in bulk.
+    """
+    print("IDCommand UUID:", command_uuid)
+    if command_uuid == "None":
+        print("Skipping file format identification")
+        return 0
+    try:
+        command = IDCommand.active.get(uuid=command_uuid)
+    except IDCommand.DoesNotExist:
+        sys.stderr.write("IDCommand with UUID {} does not exist.\n".format(command_uuid))
+        return -1
+
+    db_files = databaseFunctions.getUnitFiles(unit_uuid, unit_type, unit_directory, ('checksumtype', 'checksum'))
+    identified = set()
+    if disable_reidentify:
+        identified = databaseFunctions.getUnitFilesWithEvent(unit_uuid, unit_type, 'format identification')
+
+    failed = False
+    # (file UUID, path, key); see file_key
+    files = []
+    for dirpath, _, filenames in os.walk(os.path.join(unicodeToStr(unit_directory), subdirectory)):
+        for filename in filenames:
+            path = os.path.join(dirpath, filename)
+            if path not in db_files:
+                print('File not found in database:', path, file=sys.stderr)
+                failed = True
+                continue
+            file_uuid, checksum_type, checksum = db_files[path]
+            if file_uuid in identified:
+                continue
+            files.append((file_uuid, path, file_key(path, checksum_type, checksum)))
+    if identified:
+        print(len(identified), 'files have already been identified, and re-identification is disabled. Skipping them.')
+    if not files:
+        return -1 if failed else 0
+
+    # Save the selected ID command for use in a later chain
+    save_idtool(unit_uuid, command_uuid)
+
+    outputs = get_cached_outputs(command, set(key for _, _, key in files if key[0] is not None))
+    print(len(outputs), 'outputs of earlier identifications of identical files reused')
+    to_run = {}
+    for _, path, key in files:
+        if key not in outputs:
+            to_run.setdefault(key, path)
+
+    def run(key):
+        exitcode, output, _ = executeOrRun(command.script_type, command.script, arguments=[to_run[key]], printing=False)
+        return key, exitcode, output.strip()
+
+    pool = ThreadPool(max(1, min(get_workers(), len(to_run))))
+    try:
+        ran = {}
+        for key, exitcode, output in pool.imap_unordered(run, to_run.keys()):
+            if exitcode != 0:
+                print('Error: IDCommand with UUID {} exited non-zero for {}.'.format(command_uuid, to_run[key]), file=sys.stderr)
+                continue
+            ran[key] = output
+    finally:
+        pool.terminate()
+    cache_outputs(command, dict((key, output) for key, output in ran.items() if key[0] is not None))
+    outputs.update(ran)
+
+    formats = get_formats(command, outputs.values())
+    file_format_versions = []
+    file_ids = []
+    events = []
+    for file_uuid, path, key in files:
+        if key not in outputs:
+            failed = True
+            continue
+        output = outputs[key]
+        print('File: ({}) {}'.format(file_uuid, path), 'command output:', output)
+        version, error = formats[output]
+        if version is None:
+            print('Error:', error, file=sys.stderr)
+            failed = True
+            event = identification_event(file_uuid, command, success=False)
+        else:
+            print("{} identified as a {}".format(path, version.description))
+            file_format_versions.append(FileFormatVersion(file_uuid_id=file_uuid, format_version=version))
+            file_ids.append(file_id(file_uuid, version, output))
+            event = identification_event(file_uuid, command, format=version.pronom_id)
+        events.append(event)
+
+    with transaction.atomic():
+        identified_uuids = [ffv.file_uuid_id for ffv in file_format_versions]
+        for start in range(0, len(identified_uuids), BATCH_SIZE):
+            FileFormatVersion.objects.filter(file_uuid_id__in=identified_uuids[start:start + BATCH_SIZE]).delete()
+        FileFormatVersion.objects.bulk_create(file_format_versions, batch_size=BATCH_SIZE)
+        FileID.objects.bulk_create(file_ids, batch_size=BATCH_SIZE)
+        databaseFunctions.bulkInsertIntoEvents(events, batch_size=BATCH_SIZE)
+
+    return -1 if failed else 0
+
+
 if __name__ == '__main__':
     logger = get_script_logger("archivematica.mcp.client.identifyFileFormat")
 
     parser = argparse.ArgumentParser(description='Identify file formats.')
     parser.add_argument('idcommand', type=str, help='%IDCommand%')
-    parser.add_argument('file_path', type=str, help='%relativeLocation%')
-    parser.add_argument('file_uuid', type=str, help='%fileUUID%')
+    parser.add_argument('file_path', type=str, nargs='?', help='%relativeLocation%')
+    parser.add_argument('file_uuid', type=str, nargs='?', help='%fileUUID%')
     parser.add_argument('--disable-reidentify', action='store_true', help='Disable identification if it has already happened for this file.')
+    parser.add_argument('--unitUUID', type=str, help='Identify all files of the unit with this UUID instead of one file.')
+    parser.add_argument('--unitType', type=str, help='%unitType%')
+    parser.add_argument('--unitDirectory', type=str, help='%SIPDirectory%')
+    parser.add_argument('--subdirectory', type=str, default='', help='Subdirectory of the unit whose files are identified.')
 
     args = parser.parse_args()
+    if args.unitUUID:
+        sys.exit(identify_unit(args.idcommand, args.unitUUID, args.unitType, args.unitDirectory,
+                               args.subdirectory, args.disable_reidentify))
     sys.exit(main(args.idcommand, args.file_path, args.file_uuid, args.disable_reidentify))
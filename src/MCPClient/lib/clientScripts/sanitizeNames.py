@@ -85,6 +85,36 @@ def sanitizeRecursively(path):
 
     return sanitizations
 
+class SanitizedPaths(object):
+    """
+    Maps paths from before sanitizeRecursively renamed them to after, in time
+    proportional to their depth rather than to the number of sanitizations.
+
+    sanitizations are keyed by paths whose parent directories have already
+    been sanitized, so they are stored in a trie of sanitized directory names,
+    each node holding the renames made in its directory. A path is rewritten
+    by walking down the trie, renaming each of its components in turn.
+    """
+    def __init__(self, sanitizations):
+        # Nodes are (child nodes by sanitized name, {old name: sanitized name})
+        self.root = ({}, {})
+        for oldpath, newpath in sanitizations.items():
+            node = self.root
+            for name in os.path.dirname(oldpath).split(os.sep):
+                node = node[0].setdefault(name, ({}, {}))
+            node[1][os.path.basename(oldpath)] = os.path.basename(newpath)
+
+    def sanitize(self, path):
+        """Returns what path is after sanitization; path must be NFC normalized, as sanitizations' keys are."""
+        names = path.split(os.sep)
+        node = self.root
+        for i, name in enumerate(names):
+            names[i] = node[1].get(name, name)
+            node = node[0].get(names[i])
+            if node is None:
+                break
+        return os.sep.join(names)
+
 if __name__ == '__main__':
     path = sys.argv[1]
     if not os.path.isdir(path):
@@ -23,7 +23,6 @@
 from __future__ import print_function
 import logging
 import sys
-import os
 import unicodedata
 
 import django
@@ -33,7 +32,8 @@ from main.models import File
 
 # archivematicaCommon
 from custom_handlers import get_script_logger
-from fileOperations import updateFileLocation
+from databaseFunctions import getAMAgentsForFile
+from fileOperations import updateFileLocations
 from archivematicaFunctions import unicodeToStr
 import sanitizeNames
 
@@ -51,58 +51,45 @@ def sanitize_object_names(objectsDirectory, sipUUID, date, groupType, groupSQL,
 
     eventDetail = 'program="sanitizeNames"; version="' + sanitizeNames.VERSION + '"'
 
+    if groupType not in ("%SIPDirectory%", "%transferDirectory%"):
+        print("bad group type", groupType, file=sys.stderr)
+        sys.exit(3)
+
     # Update files in DB
+    sanitizedPaths = sanitizeNames.SanitizedPaths(sanitizations)
     kwargs = {
         groupSQL: sipUUID,
         "removedtime__isnull": True,
     }
-    for f in File.objects.filter(**kwargs):
-        # Check all files to see if any parent directory had a sanitization event
+    # Moves by the transfer each file is from, whose agents they share
+    moves = {}
+    for fileUUID, currentlocation, transferUUID in File.objects.filter(**kwargs).values_list('uuid', 'currentlocation', 'transfer_id'):
+        # Check all files to see if they or any parent directory were sanitized
         current_location = unicodeToStr(
-            unicodedata.normalize('NFC', f.currentlocation)).replace(
+            unicodedata.normalize('NFC', currentlocation)).replace(
                 groupType, sipPath)
-        sanitized_location = unicodeToStr(current_location)
-        logger.info('Checking %s', current_location)
-
-        # Check parent directories
-        # Since directory keys are a mix of sanitized and unsanitized, this is a little complicated
-        # Directories keys are in the form sanitized/sanitized/unsanitized
-        # When a match is found (eg 'unsanitized' -> 'sanitized') reset the search
-        # This will find 'sanitized/unsanitized2' -> 'sanitized/sanitized2' on the next pass
-        # TODO This should be checked for a more efficient solution
-        dirpath = sanitized_location
-        while objectsDirectory in dirpath:  # Stay within unit
-            if dirpath in sanitizations:  # Make replacement
-                sanitized_location = sanitized_location.replace(dirpath, sanitizations[dirpath])
-                dirpath = sanitized_location  # Reset search
-            else:  # Check next level up
-                dirpath = os.path.dirname(dirpath)
+        if current_location.startswith(objectsDirectory):
+            sanitized_location = sanitizedPaths.sanitize(current_location)
+        else:  # Stay within unit
+            sanitized_location = current_location
 
         if current_location != sanitized_location:
             oldfile = current_location.replace(objectsDirectory, relativeReplacement, 1)
             newfile = sanitized_location.replace(objectsDirectory, relativeReplacement, 1)
-            kwargs = {
-                'src': oldfile,
-                'dst': newfile,
-                'eventType': 'name cleanup',
-                'eventDateTime': date,
-                'eventDetail': "prohibited characters removed:" + eventDetail,
-                'fileUUID': None,
-            }
-            if groupType == "%SIPDirectory%":
-                kwargs['sipUUID'] = sipUUID
-            elif groupType == "%transferDirectory%":
-                kwargs['transferUUID'] = sipUUID
-            else:
-                print("bad group type", groupType, file=sys.stderr)
-                sys.exit(3)
             logger.info('Sanitized name: %s -> %s', oldfile, newfile)
             print('Sanitized name:', oldfile, " -> ", newfile)
-            updateFileLocation(**kwargs)
+            moves.setdefault(transferUUID, []).append((fileUUID, oldfile, newfile))
         else:
             logger.info('No sanitization for %s', current_location)
             print('No sanitization found for', current_location)
 
+    for transferMoves in moves.values():
+        updateFileLocations(transferMoves,
+                            eventType='name cleanup',
+                            eventDateTime=date,
+                            eventDetail="prohibited characters removed:" + eventDetail,
+                            agents=getAMAgentsForFile(transferMoves[0][0]))
+
 
 if __name__ == '__main__':
     logger = get_script_logger("archivematica.mcp.client.sanitizeObjectNames")
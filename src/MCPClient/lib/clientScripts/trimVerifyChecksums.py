@@ -24,16 +24,17 @@ from __future__ import print_function
 import os
 from lxml import etree as etree
 import sys
-import uuid
 
 # fileOperations, databaseFunctions requires Django to be set up
 import django
 django.setup()
+# dashboard
+from main.models import File
 
 # archivematicaCommon
-from archivematicaFunctions import get_file_checksum
-from fileOperations import getFileUUIDLike
+from archivematicaFunctions import unicodeToStr
 import databaseFunctions
+import fixityCheck
 
 transferUUID = sys.argv[1]
 transferName = sys.argv[2]
@@ -43,6 +44,14 @@ date = sys.argv[4]
 currentDirectory = ''
 exitCode = 0
 
+# File UUIDs by current location
+fileUUIDs = {}
+for currentlocation, fileUUID in File.objects.filter(transfer_id=transferUUID, removedtime__isnull=True).values_list('currentlocation', 'uuid'):
+    if currentlocation is not None:
+        fileUUIDs[unicodeToStr(currentlocation)] = fileUUID
+
+expected = []
+xmlFiles = {}
 for transfer_dir in os.listdir(transferPath):
     dirPath = os.path.join(transferPath, transfer_dir)
     if not os.path.isdir(dirPath):
@@ -68,29 +77,40 @@ for transfer_dir in os.listdir(transferPath):
             exitCode += 1
             continue
 
-        objectMD5 = get_file_checksum(filePath, 'md5')
-
-        if objectMD5 == xmlMD5:
-            print('File OK: ', xmlMD5, filePath.replace(transferPath, '%TransferDirectory%'))
-
-            fileID = getFileUUIDLike(filePath, transferPath, transferUUID, 'transfer', '%transferDirectory%')
-            for path, fileUUID in fileID.items():
-                eventDetail = 'program="python"; module="hashlib.md5()"'
-                eventOutcome = 'Pass'
-                eventOutcomeDetailNote = '%s %s' % (xmlFile.__str__(), 'verified')
-                eventIdentifierUUID = uuid.uuid4().__str__()
-
-                databaseFunctions.insertIntoEvents(
-                    fileUUID=fileUUID,
-                    eventIdentifierUUID=eventIdentifierUUID,
-                    eventType='fixity check',
-                    eventDateTime=date,
-                    eventOutcome=eventOutcome,
-                    eventOutcomeDetailNote=eventOutcomeDetailNote,
-                    eventDetail=eventDetail
-                )
-        else:
-            print('Checksum mismatch: ', filePath.replace(transferPath, '%TransferDirectory%'), file=sys.stderr)
-            exitCode += 1
+        expected.append(fixityCheck.Expected(filePath, filePath, xmlMD5, 'md5'))
+        xmlFiles[filePath] = xmlFile
+
+
+def record(results):
+    events = []
+    for result in results:
+        if not fixityCheck.result_passed(result):
+            continue
+        filePath = result.expected.path
+        fileUUID = fileUUIDs.get(filePath.replace(transferPath, '%transferDirectory%', 1))
+        if fileUUID is None:
+            continue
+        events.append({
+            'fileUUID': fileUUID,
+            'eventType': 'fixity check',
+            'eventDateTime': date,
+            'eventOutcome': 'Pass',
+            'eventOutcomeDetailNote': '%s %s' % (xmlFiles[filePath].__str__(), 'verified'),
+            'eventDetail': 'program="python"; module="hashlib.md5()"',
+        })
+    if events:
+        # All files are in this transfer, so have the same agents
+        agents = databaseFunctions.getAMAgentsForFile(events[0]['fileUUID'])
+        databaseFunctions.bulkInsertIntoEvents(events, agents=agents)
+
+
+check = fixityCheck.from_client_config(transferUUID, 'trimVerifyChecksums')
+for result in check.run(expected, record):
+    filePath = result.expected.path
+    if fixityCheck.result_passed(result):
+        print('File OK: ', result.expected.checksum, filePath.replace(transferPath, '%TransferDirectory%'))
+    else:
+        print('Checksum mismatch: ', filePath.replace(transferPath, '%TransferDirectory%'), file=sys.stderr)
+        exitCode += 1
 
 quit(exitCode)
@@ -27,11 +27,19 @@ import os
 import sys
 import lxml.etree as etree
 
-from archivematicaFunctions import get_file_checksum
+import django
+django.setup()
+
+# archivematicaCommon
+from archivematicaFunctions import get_setting
+from fileOperations import get_cached_checksums
 
 def verifyMetsFileSecChecksums(metsFile, date, taskUUID, relativeDirectory="./"):
     print(metsFile)
     exitCode = 0
+    # Also compute the checksum updateSizeAndChecksum will need, so it
+    # doesn't have to read the files again
+    cachedType = get_setting('checksum_type', 'sha256')
     tree = etree.parse(metsFile)
     root = tree.getroot()
     for item in root.findall("{http://www.loc.gov/METS/}fileSec/{http://www.loc.gov/METS/}fileGrp/{http://www.loc.gov/METS/}file"):
@@ -45,7 +53,7 @@ def verifyMetsFileSecChecksums(metsFile, date, taskUUID, relativeDirectory="./")
         fileFullPath = os.path.join(relativeDirectory, fileLocation)
 
         if checksumType and checksumType in hashlib.algorithms:
-            checksum2 = get_file_checksum(fileFullPath, checksumType)
+            checksum2 = get_cached_checksums(fileFullPath, [checksumType, cachedType], refresh=True)[checksumType]
             eventDetail = 'program="python"; module="hashlib.{}()"'.format(checksumType)
         else:
             print("Unsupported checksum type: %s" % (checksumType.__str__()), file=sys.stderr)
@@ -22,6 +22,7 @@
 # @author Joseph Perry <joseph@artefactual.com>
 
 from __future__ import print_function
+import os
 import sys
 from optparse import OptionParser
 import uuid
@@ -33,9 +34,18 @@ django.setup()
 from main.models import File
 
 # archivematicaCommon
+from archivematicaFunctions import get_file_checksum, unicodeToStr
 from custom_handlers import get_script_logger
 import databaseFunctions
-from archivematicaFunctions import get_file_checksum
+import fixityCheck
+
+
+def eventFields(expected, checksumFile):
+    """Returns the outcome, outcome detail note and exit code of a fixity check."""
+    if checksumFile != expected:
+        return 'Fail', str(checksumFile) + ' != ' + expected, 2
+    return 'Pass', '%s %s' % (str(checksumFile), 'verified'), 0
+
 
 def verifyChecksum(fileUUID, filePath, date, eventIdentifierUUID):
     f = File.objects.get(uuid=fileUUID)
@@ -46,20 +56,10 @@ def verifyChecksum(fileUUID, filePath, date, eventIdentifierUUID):
 
     checksumFile = get_file_checksum(filePath, f.checksumtype)
 
-    eventOutcome = ''
-    eventOutcomeDetailNote = ''
-    exitCode = 0
-
-    if checksumFile != f.checksum:
-        eventOutcomeDetailNote = str(checksumFile) + ' != ' + f.checksum
-        eventOutcome = 'Fail'
-        exitCode = 2
+    eventOutcome, eventOutcomeDetailNote, exitCode = eventFields(f.checksum, checksumFile)
+    if exitCode:
         print('Checksums do not match:', fileUUID, filePath, file=sys.stderr)
         print(eventOutcomeDetailNote, file=sys.stderr)
-    else:
-        eventOutcomeDetailNote = '%s %s' % (str(checksumFile), 'verified')
-        eventOutcome = 'Pass'
-        exitCode = 0
 
     databaseFunctions.insertIntoEvents(
         fileUUID=fileUUID,
@@ -74,6 +74,64 @@ def verifyChecksum(fileUUID, filePath, date, eventIdentifierUUID):
     exit(exitCode)
 
 
+def verifyChecksums(sipUUID, sipDirectory, date):
+    """
+    Verify the checksums of all files in the SIP's objects directory with
+    one FixityCheck, writing their fixity check events in bulk.
+    """
+    objectsDirectory = os.path.join(sipDirectory, 'objects')
+    dbFiles = databaseFunctions.getUnitFiles(sipUUID, 'SIP', sipDirectory, ('checksum', 'checksumtype'))
+
+    exitCode = 0
+    expected = []
+    for dirpath, _, filenames in os.walk(unicodeToStr(objectsDirectory)):
+        for filename in filenames:
+            filePath = os.path.join(dirpath, filename)
+            if filePath not in dbFiles:
+                print('File not found in database:', filePath, file=sys.stderr)
+                exitCode = max(exitCode, 1)
+                continue
+            fileUUID, checksum, checksumtype = dbFiles[filePath]
+            if checksum in ('', 'None', None):
+                print('No checksum found in database for file:', fileUUID, filePath, file=sys.stderr)
+                exitCode = max(exitCode, 1)
+                continue
+            expected.append(fixityCheck.Expected(fileUUID, filePath, checksum, checksumtype))
+
+    def record(results):
+        events = []
+        for result in results:
+            if result.checksum is None:
+                continue
+            eventOutcome, eventOutcomeDetailNote, _ = eventFields(
+                result.expected.checksum, result.checksum)
+            events.append({
+                'fileUUID': result.expected.key,
+                'eventType': 'fixity check',
+                'eventDateTime': date,
+                'eventOutcome': eventOutcome,
+                'eventOutcomeDetailNote': eventOutcomeDetailNote,
+                'eventDetail': 'program="python"; module="hashlib.{}()"'.format(result.expected.algorithm),
+            })
+        databaseFunctions.bulkInsertIntoEvents(events)
+
+    check = fixityCheck.from_client_config(sipUUID, 'verifyPREMISChecksums')
+    for result in check.run(expected, record):
+        if result.checksum is None:
+            print('Unable to read file:', result.expected.key, result.expected.path, result.error, file=sys.stderr)
+            exitCode = max(exitCode, 1)
+            continue
+        _, eventOutcomeDetailNote, fileExitCode = eventFields(
+            result.expected.checksum, result.checksum)
+        if fileExitCode:
+            print('Checksums do not match:', result.expected.key, result.expected.path, file=sys.stderr)
+            print(eventOutcomeDetailNote, file=sys.stderr)
+            exitCode = max(exitCode, fileExitCode)
+
+    print('Verified checksums of', len(expected), 'files')
+    return exitCode
+
+
 if __name__ == '__main__':
     logger = get_script_logger('archivematica.mcp.client.verifyPREMISChecksums')
 
@@ -82,6 +140,10 @@ if __name__ == '__main__':
     parser.add_option('-p', '--filePath', action='store', dest='filePath', default='')
     parser.add_option('-d', '--date', action='store', dest='date', default='')
     parser.add_option('-u', '--eventIdentifierUUID', action='store', dest='eventIdentifierUUID', default='')
+    parser.add_option('-s', '--sipUUID', action='store', dest='sipUUID', default='')
+    parser.add_option('-D', '--sipDirectory', action='store', dest='sipDirectory', default='')
     (opts, args) = parser.parse_args()
 
+    if opts.sipUUID:
+        sys.exit(verifyChecksums(opts.sipUUID, opts.sipDirectory, opts.date))
     verifyChecksum(opts.fileUUID, opts.filePath, opts.date, opts.eventIdentifierUUID)
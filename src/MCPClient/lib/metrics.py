@@ -0,0 +1,93 @@
+#!/usr/bin/env python2
+
+# This file is part of Archivematica.
+#
+# Copyright 2010-2013 Artefactual Systems Inc. <http://artefactual.com>
+#
+# Archivematica is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Archivematica is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Archivematica.  If not, see <http://www.gnu.org/licenses/>.
+
+# @package Archivematica
+# @subpackage archivematicaClient
+
+#~DOC~
+#
+# Prometheus metrics for the MCP client, served over HTTP on metricsListen.
+#
+# The functions below do nothing when prometheus_client isn't installed or
+# metrics are not enabled.
+
+import sys
+
+try:
+    import prometheus_client
+except ImportError:
+    prometheus_client = None
+
+sys.path.append("/usr/lib/archivematica/archivematicaCommon")
+import metricsServer
+
+# Seconds
+JOB_DURATION_BUCKETS = (0.1, 0.5, 1, 5, 10, 30, 60, 300, 900, 3600, 4 * 3600, 12 * 3600, float('inf'))
+# Bytes, from 16 MiB to 16 GiB
+MEMORY_BUCKETS = tuple(2 ** i * 1024 * 1024 for i in range(4, 15)) + (float('inf'),)
+# ru_maxrss is in kilobytes on Linux
+MAXRSS_UNIT = 1024
+
+enabled = False
+
+if prometheus_client is not None:
+    job_started = prometheus_client.Counter(
+        'mcpclient_job_started_total', 'Jobs received from Gearman', ['execute'])
+    job_completed = prometheus_client.Counter(
+        'mcpclient_job_completed_total', 'Jobs completed', ['execute'])
+    job_failed = prometheus_client.Counter(
+        'mcpclient_job_failed_total', 'Jobs completed with a non-zero exit code', ['execute'])
+    job_duration = prometheus_client.Histogram(
+        'mcpclient_job_duration_seconds', 'Time spent running a job', ['execute'],
+        buckets=JOB_DURATION_BUCKETS)
+    subprocess_peak_memory = prometheus_client.Histogram(
+        'mcpclient_subprocess_peak_memory_bytes', 'Peak resident memory of the process run for a job',
+        ['execute'], buckets=MEMORY_BUCKETS)
+
+
+def start(listen):
+    """Serve metrics over HTTP on listen, "address:port"."""
+    global enabled
+    enabled = metricsServer.serve(listen)
+
+
+def job_received(execute):
+    if enabled:
+        job_started.labels(execute).inc()
+
+
+def job_finished(execute, exit_code, duration):
+    if enabled:
+        job_completed.labels(execute).inc()
+        job_duration.labels(execute).observe(duration)
+        if exit_code:
+            job_failed.labels(execute).inc()
+
+
+def rusage_recorder(execute):
+    """
+    Return a rusage_callback for executeOrRun recording the peak memory of the
+    job's process, or None if metrics are not enabled.
+    """
+    if not enabled:
+        return None
+
+    def record(rusage):
+        subprocess_peak_memory.labels(execute).observe(rusage.ru_maxrss * MAXRSS_UNIT)
+    return record
@@ -0,0 +1,318 @@
+#!/usr/bin/env python2
+
+# This file is part of Archivematica.
+#
+# Copyright 2010-2013 Artefactual Systems Inc. <http://artefactual.com>
+#
+# Archivematica is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Archivematica is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Archivematica.  If not, see <http://www.gnu.org/licenses/>.
+
+# @package Archivematica
+# @subpackage archivematicaClient
+
+#~DOC~
+#
+# Pool of warm workers running Python client scripts without starting a new
+# interpreter for each task.
+#
+# Most client scripts are short Python programs, and for per-file tasks
+# starting Python, importing Django and calling django.setup() takes longer
+# than the work itself. When pythonScriptPool is enabled, the MCP client forks
+# one worker per task thread at startup, with Django and the common
+# archivematicaCommon modules already imported. To run a script a worker forks
+# again, and the child runs the script as __main__ with the task's arguments
+# and its output going to spool files, as a subprocess would. Each task still
+# gets its own process, so scripts need no changes and can't affect each other.
+#
+# Anything which isn't a Python script, and every script when no worker is
+# alive, is run with executeOrRun as before.
+#
+# Running this module directly compares the time taken to run a script which
+# sets up Django both ways.
+
+from __future__ import print_function
+import errno
+import logging
+import multiprocessing
+import os
+import Queue
+import resource
+import runpy
+import shlex
+import sys
+import tempfile
+import threading
+import time
+import traceback
+
+sys.path.append("/usr/lib/archivematica/archivematicaCommon")
+from executeOrRunSubProcess import executeOrRun, readSpool, DEFAULT_HEAD_SIZE, DEFAULT_TAIL_SIZE
+
+LOGGER = logging.getLogger('archivematica.mcp.client')
+
+# Imported by workers before they run any script; modules which fail to
+# import are left for the script to report
+PRELOAD_MODULES = ('archivematicaFunctions', 'custom_handlers', 'databaseFunctions',
+                   'fileOperations', 'lxml.etree', 'metsrw')
+
+
+class _Output(object):
+    """Standard output or error of a script, encoding unicode as UTF-8 like PYTHONIOENCODING=utf-8."""
+    def __init__(self, f):
+        self.file = f
+        self.softspace = 0
+
+    def write(self, s):
+        if isinstance(s, unicode):
+            s = s.encode('utf-8')
+        self.file.write(s)
+
+    def writelines(self, lines):
+        for line in lines:
+            self.write(line)
+
+    def __getattr__(self, name):
+        return getattr(self.file, name)
+
+
+def isPythonScript(path, _cache={}):
+    """Returns True if path is a file starting with a python shebang line."""
+    if path not in _cache:
+        try:
+            with open(path, 'rb') as f:
+                line = f.readline(200)
+        except IOError:
+            line = ''
+        _cache[path] = line.startswith('#!') and 'python' in line
+    return _cache[path]
+
+
+def _close_db_connections():
+    from django.db import connections
+    for connection in connections.all():
+        connection.close()
+
+
+def _run_script(argv, env_updates, stdout_path, stderr_path):
+    """Run a script as __main__ in this, freshly forked, process and exit with its exit code."""
+    stdin = os.open(os.devnull, os.O_RDONLY)
+    stdout = os.open(stdout_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o666)
+    stderr = os.open(stderr_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o666)
+    for fd, target in ((stdin, 0), (stdout, 1), (stderr, 2)):
+        os.dup2(fd, target)
+        os.close(fd)
+    sys.stdin = os.fdopen(0, 'rb')
+    sys.stdout = _Output(os.fdopen(1, 'wb'))
+    sys.stderr = _Output(os.fdopen(2, 'wb', 0))
+
+    # Scripts configure their own logging
+    for logger in [logging.root] + logging.Logger.manager.loggerDict.values():
+        if isinstance(logger, logging.Logger):
+            logger.handlers = []
+
+    # As launchSubProcess does for the process it starts
+    os.environ['PYTHONIOENCODING'] = 'utf-8'
+    if not os.environ.get('LANG'):
+        os.environ['LANG'] = 'en_US.UTF-8'
+    if not os.environ.get('LANGUAGE'):
+        os.environ['LANGUAGE'] = os.environ['LANG']
+    os.environ.update(env_updates)
+    sys.argv = argv
+    sys.path[0] = os.path.dirname(argv[0])
+
+    code = 0
+    try:
+        runpy.run_path(argv[0], run_name='__main__')
+    except SystemExit as e:
+        if e.code is None:
+            code = 0
+        elif isinstance(e.code, (int, long)):
+            code = e.code
+        else:
+            print(e.code, file=sys.stderr)
+            code = 1
+    except BaseException:
+        traceback.print_exc()
+        code = 1
+    try:
+        sys.stdout.flush()
+        sys.stderr.flush()
+        logging.shutdown()
+        _close_db_connections()
+    finally:
+        os._exit(code & 0xff)
+
+
+def _serve(conn):
+    """Worker process: run each script requested over conn in a child process."""
+    for name in PRELOAD_MODULES:
+        try:
+            __import__(name)
+        except Exception:
+            pass
+    _close_db_connections()
+    while True:
+        try:
+            request = conn.recv()
+        except EOFError:
+            return
+        pid = os.fork()
+        if pid == 0:
+            try:
+                conn.close()
+                _run_script(*request)
+            finally:
+                os._exit(1)
+        while True:
+            try:
+                _, status, rusage = os.wait4(pid, 0)
+                break
+            except OSError as e:
+                if e.errno != errno.EINTR:
+                    raise
+        if os.WIFSIGNALED(status):
+            code = -os.WTERMSIG(status)
+        else:
+            code = os.WEXITSTATUS(status)
+        conn.send((code, tuple(rusage)))
+
+
+class _Worker(object):
+    def __init__(self, name):
+        self.conn, child_conn = multiprocessing.Pipe()
+        self.process = multiprocessing.Process(target=_serve, args=(child_conn,), name=name)
+        self.process.daemon = True
+        self.process.start()
+        self.reported = False
+        child_conn.close()
+
+    def run(self, argv, env_updates, stdout_path, stderr_path):
+        """Returns the exit code and resource usage of the script."""
+        self.conn.send((argv, env_updates, stdout_path, stderr_path))
+        code, rusage = self.conn.recv()
+        return code, resource.struct_rusage(rusage)
+
+
+class ScriptPool(object):
+    def __init__(self, size):
+        self.workers = Queue.Queue()
+        for i in range(size):
+            self.workers.put(_Worker('scriptPool-%d' % (i + 1)))
+
+    def run(self, command, env_updates={}, spool_path=None, head_size=DEFAULT_HEAD_SIZE,
+            tail_size=DEFAULT_TAIL_SIZE, rusage_callback=None):
+        """
+        Run the Python script command, a script path and its arguments as one
+        string, in a worker. Arguments and return value are as for
+        executeOrRun("command", command, ...), which is used instead if the
+        worker has died.
+        """
+        worker = self.workers.get()
+        try:
+            if not worker.process.is_alive():
+                if not worker.reported:
+                    worker.reported = True
+                    LOGGER.error('Script pool worker %s exited with %s', worker.process.name, worker.process.exitcode)
+                return executeOrRun("command", command, printing=False, env_updates=env_updates,
+                                    spool_path=spool_path, head_size=head_size, tail_size=tail_size,
+                                    rusage_callback=rusage_callback)
+            if spool_path is None:
+                # Keep all output, as executeOrRun does without a spool
+                spool_path = os.path.join(tempfile.gettempdir(), 'scriptPool-%d-%s' % (os.getpid(), worker.process.name))
+                head_size = tail_size = sys.maxsize
+            spool_dir = os.path.dirname(spool_path)
+            if spool_dir and not os.path.isdir(spool_dir):
+                os.makedirs(spool_dir)
+            try:
+                code, rusage = worker.run(shlex.split(command), env_updates,
+                                          spool_path + '.stdout', spool_path + '.stderr')
+            except (EOFError, IOError, OSError):
+                LOGGER.exception('Script pool worker %s failed running %s', worker.process.name, command)
+                worker.process.join(1)
+                return -1, "Execution failed:", traceback.format_exc()
+            # Read before the worker, and so its spool file names, can be reused
+            stdOut = readSpool(spool_path + '.stdout', head_size, tail_size)
+            stdError = readSpool(spool_path + '.stderr', head_size, tail_size)
+        finally:
+            self.workers.put(worker)
+        if rusage_callback is not None:
+            rusage_callback(rusage)
+        return code, stdOut, stdError
+
+
+_pool = None
+
+
+def start(size):
+    """
+    Start the process-wide ScriptPool with size workers. Must be called
+    before the MCP client starts any other thread, as workers are forked.
+    """
+    global _pool
+    _close_db_connections()
+    _pool = ScriptPool(size)
+    LOGGER.info('Started %d Python script workers', size)
+
+
+def handles(script):
+    """Returns True if script is run by the pool."""
+    return _pool is not None and isPythonScript(script)
+
+
+def run(command, env_updates={}, **capture):
+    """Run a Python script in the process-wide ScriptPool; see ScriptPool.run."""
+    return _pool.run(command, env_updates=env_updates, **capture)
+
+
+def benchmark(tasks=100):
+    """
+    Run a script which sets up Django tasks times as a subprocess and in a
+    pool, and return a dict of method: seconds per task.
+    """
+    global _pool
+    script = tempfile.NamedTemporaryFile(suffix='.py', delete=False)
+    script.write('#!/usr/bin/env python2\n'
+                 'import django\n'
+                 'django.setup()\n'
+                 'from main.models import File\n'
+                 'print(File._meta.db_table)\n')
+    script.close()
+    os.chmod(script.name, 0o755)
+    env_updates = {'PYTHONPATH': os.pathsep.join(path for path in sys.path if path)}
+    results = {}
+    try:
+        start = time.time()
+        for _ in range(tasks):
+            assert executeOrRun('command', script.name, printing=False, env_updates=env_updates)[0] == 0
+        results['subprocess'] = (time.time() - start) / tasks
+
+        pool, _pool = _pool, ScriptPool(1)
+        try:
+            start = time.time()
+            for _ in range(tasks):
+                assert run(script.name, env_updates)[0] == 0
+            results['pool'] = (time.time() - start) / tasks
+        finally:
+            _pool = pool
+    finally:
+        os.remove(script.name)
+    return results
+
+
+if __name__ == '__main__':
+    import django
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'settings.common')
+    sys.path.append("/usr/share/archivematica/dashboard")
+    django.setup()
+    for method, seconds in sorted(benchmark().items()):
+        print('%-10s %.1f ms per task' % (method, seconds * 1000))
@@ -0,0 +1,84 @@
+# -*- coding: utf8
+import os
+import shutil
+import sys
+import tempfile
+import uuid
+
+from django.test import TestCase
+
+THIS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.abspath(os.path.join(THIS_DIR, '../lib/clientScripts')))
+
+from fpr.models import IDCommand, IDTool
+from main.models import File, FileFormatVersion, FormatIdentificationCache
+
+import identifyFileFormat
+
+TRANSFER_UUID = 'e95ab50f-9c84-45d5-a3ca-1b0b3f58d9b6'
+# The command's output by extension
+PUIDS = {'.tif': 'fmt/353', '.jpg': 'fmt/43'}
+
+
+class TestIdentifyUnit(TestCase):
+    """Test identifyFileFormat.identify_unit."""
+
+    fixture_files = ['transfer.json', 'formats.json']
+    fixtures = [os.path.join(THIS_DIR, 'fixtures', p) for p in fixture_files]
+
+    def setUp(self):
+        self.unit_directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.unit_directory)
+        os.mkdir(os.path.join(self.unit_directory, 'objects'))
+        # Identical contents, under different extensions
+        for name in ('a.tif', 'b.tif', 'c.jpg'):
+            with open(os.path.join(self.unit_directory, 'objects', name), 'w') as f:
+                f.write('identical')
+            File.objects.create(uuid=str(uuid.uuid4()), transfer_id=TRANSFER_UUID,
+                                currentlocation='%transferDirectory%objects/' + name,
+                                checksumtype='sha256', checksum='abc')
+        tool = IDTool.objects.create(description='Test tool', version='1.0')
+        self.command = IDCommand.objects.create(description='Identify by extension', config='PUID',
+                                                script='test', script_type='command', tool=tool)
+
+        self.runs = []
+
+        def executeOrRun(type_, script, arguments, printing):
+            self.runs.append(arguments[0])
+            return 0, PUIDS[os.path.splitext(arguments[0])[1]] + '\n', ''
+
+        self.addCleanup(setattr, identifyFileFormat, 'executeOrRun', identifyFileFormat.executeOrRun)
+        identifyFileFormat.executeOrRun = executeOrRun
+
+    def identify(self):
+        return identifyFileFormat.identify_unit(self.command.uuid, TRANSFER_UUID, 'Transfer',
+                                                self.unit_directory, 'objects', False)
+
+    def formats(self):
+        return dict(
+            (os.path.basename(ffv.file_uuid.currentlocation), ffv.format_version.pronom_id)
+            for ffv in FileFormatVersion.objects.filter(file_uuid__transfer_id=TRANSFER_UUID))
+
+    def test_identical_files_are_identified_once_per_extension(self):
+        assert self.identify() == 0
+        assert sorted(os.path.splitext(path)[1] for path in self.runs) == ['.jpg', '.tif']
+        assert self.formats() == {'a.tif': 'fmt/353', 'b.tif': 'fmt/353', 'c.jpg': 'fmt/43'}
+        assert sorted(FormatIdentificationCache.objects.values_list('extension', 'output')) == \
+            [('.jpg', 'fmt/43'), ('.tif', 'fmt/353')]
+
+    def test_cached_outputs_are_reused(self):
+        self.identify()
+        del self.runs[:]
+        assert self.identify() == 0
+        assert self.runs == []
+        assert self.formats() == {'a.tif': 'fmt/353', 'b.tif': 'fmt/353', 'c.jpg': 'fmt/43'}
+
+    def test_cache_misses_other_extensions(self):
+        identifyFileFormat.cache_outputs(self.command, {('sha256', 'abc', '.tif'): 'fmt/353'})
+        assert self.identify() == 0
+        assert [os.path.basename(path) for path in self.runs] == ['c.jpg']
+        assert self.formats()['c.jpg'] == 'fmt/43'
+
+    def test_file_key(self):
+        assert identifyFileFormat.file_key('/a/b.TIF', 'sha256', 'abc') == ('sha256', 'abc', '.tif')
+        assert identifyFileFormat.file_key('/a/b.tif', 'sha256', 'None') == (None, '/a/b.tif', None)
@@ -12,6 +12,7 @@ sys.path.append(os.path.abspath(os.path.join(THIS_DIR, '../lib/clientScripts')))
 
 from main.models import Event, File, Transfer
 
+import sanitizeNames
 import sanitizeObjectNames
 
 
@@ -74,3 +75,21 @@ class TestSanitize(TestCase):
         finally:
             # Delete files
             shutil.rmtree(transfer_path)
+
+    def test_sanitized_paths(self):
+        """Test sanitizeNames.SanitizedPaths.
+
+        It should rename every sanitized component of a path.
+        It should not change paths, or parts of paths, which weren't sanitized.
+        """
+        sanitized_paths = sanitizeNames.SanitizedPaths({
+            '/unit/objects/a b': '/unit/objects/a_b',
+            '/unit/objects/a_b/c d': '/unit/objects/a_b/c_d',
+            '/unit/objects/a_b/c_d/e f.txt': '/unit/objects/a_b/c_d/e_f.txt',
+            '/unit/objects/c d': '/unit/objects/c_d_1',
+        })
+        assert sanitized_paths.sanitize('/unit/objects/a b/c d/e f.txt') == '/unit/objects/a_b/c_d/e_f.txt'
+        assert sanitized_paths.sanitize('/unit/objects/a b/c d/other.txt') == '/unit/objects/a_b/c_d/other.txt'
+        assert sanitized_paths.sanitize('/unit/objects/c d/e f.txt') == '/unit/objects/c_d_1/e f.txt'
+        assert sanitized_paths.sanitize('/unit/objects/clean/c d') == '/unit/objects/clean/c d'
+        assert sanitized_paths.sanitize('/other/objects/a b') == '/other/objects/a b'
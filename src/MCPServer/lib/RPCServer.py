@@ -23,17 +23,22 @@
 import archivematicaMCP
 import cPickle
 import gearman
+import json
 import logging
 import lxml.etree as etree
 from socket import gethostname
 import sys
 import time
 
-from linkTaskManagerChoice import choicesAvailableForUnits
+from linkTaskManagerChoice import choicesAvailableForUnits, choicesAvailableForUnitsLock
+import workflow
 
 
 LOGGER = logging.getLogger("archivematica.mcp.server.rpcserver")
 
+# What getChoices last built from choicesAvailableForUnits, and its version
+_choices = {'version': None, 'choices': {}}
+
 def rpcError(code="", details=""):
     ret = etree.Element("Error")
     etree.SubElement(ret, "code").text = code.__str__()
@@ -48,6 +53,41 @@ def getJobsAwaitingApproval():
     return etree.tostring(ret, pretty_print=True)
 
 
+def _choiceInfo(choice):
+    """Returns what xmlify does for the choices of a link task manager, as a dict."""
+    unit = choice.unit
+    return {
+        'unit': {
+            'type': unit.__class__.__name__.replace('unit', '', 1),
+            'UUID': unit.UUID,
+            'currentPath': unit.currentPath.replace(archivematicaMCP.config.get('MCPServer', "sharedDirectory"), "%sharedPath%"),
+        },
+        'choices': [[str(c[0]), c[1]] for c in choice.choices],
+    }
+
+
+def getChoices(jobUUIDs=None, version=None):
+    """
+    Returns the choices available for the jobs awaiting decision with UUIDs
+    in jobUUIDs, or all of them, as a dict with the version of the choices
+    and, by job UUID, the unit and [chain, description] pairs of each job.
+
+    The choices are only built again after they change. If version is the
+    current one, the caller's copy is up to date and they are left out.
+    """
+    with choicesAvailableForUnitsLock:
+        current = choicesAvailableForUnits.version
+        if version == current:
+            return {'version': current, 'notModified': True}
+        if _choices['version'] != current:
+            _choices['choices'] = dict((UUID, _choiceInfo(choice)) for UUID, choice in choicesAvailableForUnits.items())
+            _choices['version'] = current
+        choices = _choices['choices']
+    if jobUUIDs is not None:
+        choices = dict((UUID, choices[UUID]) for UUID in jobUUIDs if UUID in choices)
+    return {'version': current, 'notModified': False, 'choices': choices}
+
+
 def approveJob(jobUUID, chain, user_id):
     LOGGER.debug("Approving: %s %s %s", jobUUID, chain, user_id)
     if jobUUID in choicesAvailableForUnits:
@@ -74,6 +114,24 @@ def gearmanGetJobsAwaitingApproval(gearman_worker, gearman_job):
         LOGGER.exception('Error getting jobs awaiting approval')
         raise
 
+def gearmanGetChoices(gearman_worker, gearman_job):
+    """Called with JSON of getChoices' keyword arguments; returns JSON."""
+    try:
+        data = json.loads(gearman_job.data or '{}')
+        return json.dumps(getChoices(jobUUIDs=data.get('jobUUIDs'), version=data.get('version')))
+    except Exception:
+        LOGGER.exception('Error getting choices')
+        raise
+
+def gearmanReloadWorkflow(gearman_worker, gearman_job):
+    """Called by the dashboard after it changes the workflow tables."""
+    try:
+        workflow.invalidate()
+        return ""
+    except Exception:
+        LOGGER.exception('Error reloading workflow')
+        raise
+
 
 def startRPCServer():
     gm_worker = gearman.GearmanWorker([archivematicaMCP.config.get('MCPServer', 'GearmanServerWorker')])
@@ -81,6 +139,8 @@ def startRPCServer():
     gm_worker.set_client_id(hostID)
     gm_worker.register_task("approveJob", gearmanApproveJob)
     gm_worker.register_task("getJobsAwaitingApproval", gearmanGetJobsAwaitingApproval)
+    gm_worker.register_task("getChoices", gearmanGetChoices)
+    gm_worker.register_task("reloadWorkflow", gearmanReloadWorkflow)
     failMaxSleep = 30
     failSleep = 1
     failSleepIncrementor = 2
@@ -53,8 +53,13 @@ django.setup()
 from django.db.models import Q
 
 # This project, alphabetical by import source
+import gearmanSubmitter
+import metrics
 import watchDirectory
 import RPCServer
+import taskJournal
+import taskScheduler
+import workflow
 from utils import log_exceptions
 
 from jobChain import jobChain
@@ -68,12 +73,16 @@ from django_mysqlpool import auto_close_db
 import databaseFunctions
 from archivematicaFunctions import unicodeToStr
 
-from main.models import Job, SIP, Task, WatchedDirectory
+from main.models import Job, SIP, Task, UnitStatus, WatchedDirectory
 
-global countOfCreateUnitAndJobChainThreaded
-countOfCreateUnitAndJobChainThreaded = 0
-
-config = ConfigParser.SafeConfigParser()
+config = ConfigParser.SafeConfigParser({
+    'watchDirectoriesMethod': watchDirectory.METHOD_AUTO,
+    'limitTaskQueueSize': '5000',
+    'gearmanClientConnections': '2',
+    'taskJournalBatchSize': '500',
+    'taskJournalFlushInterval': '1',
+    'metricsListen': '',
+})
 config.read("/etc/archivematica/MCPServer/serverConfig.conf")
 
 #time to sleep to allow db to be updated with the new location of a SIP
@@ -81,9 +90,8 @@ dbWaitSleep = 2
 
 
 limitTaskThreads = config.getint('Protocol', "limitTaskThreads")
-limitTaskThreadsSleep = config.getfloat('Protocol', "limitTaskThreadsSleep")
+limitTaskQueueSize = config.getint('Protocol', "limitTaskQueueSize")
 limitGearmanConnectionsSemaphore = threading.Semaphore(value=config.getint('Protocol', "limitGearmanConnections"))
-reservedAsTaskProcessingThreads = config.getint('Protocol', "reservedAsTaskProcessingThreads")
 stopSignalReceived = False #Tracks whether a sigkill has been received or not
 
 def isUUID(uuid):
@@ -155,7 +163,7 @@ def findOrCreateSipInDB(path, waitSleep=dbWaitSleep, unit_type='SIP'):
 
 @log_exceptions
 @auto_close_db
-def createUnitAndJobChain(path, config, terminate=False):
+def createUnitAndJobChain(path, config):
     path = unicodeToStr(path)
     if os.path.isdir(path):
             path = path + "/"
@@ -181,31 +189,15 @@ def createUnitAndJobChain(path, config, terminate=False):
         return
     jobChain(unit, config[1])
 
-    if terminate:
-        exit(0)
-
-def createUnitAndJobChainThreaded(path, config, terminate=True):
-    global countOfCreateUnitAndJobChainThreaded
-    try:
-        logger.debug('Watching path %s', path)
-        t = threading.Thread(target=createUnitAndJobChain, args=(path, config), kwargs={"terminate":terminate})
-        t.daemon = True
-        countOfCreateUnitAndJobChainThreaded += 1
-        while(limitTaskThreads <= threading.activeCount() + reservedAsTaskProcessingThreads ):
-            if stopSignalReceived:
-                logger.info('Signal was received; stopping createUnitAndJobChainThreaded(path, config)')
-                exit(0)
-            logger.debug('Active thread count: %s', threading.activeCount())
-            time.sleep(.5)
-        countOfCreateUnitAndJobChainThreaded -= 1
-        t.start()
-    except Exception:
-        logger.exception('Error creating threads to watch directories')
+def createUnitAndJobChainThreaded(path, config):
+    logger.debug('Watching path %s', path)
+    taskScheduler.submit(createUnitAndJobChain, args=(path, config), priority=taskScheduler.PRIORITY_LOW, unit=path)
 
 def watchDirectories():
     """Start watching the watched directories defined in the WatchedDirectories table in the database."""
     watched_dir_path = config.get('MCPServer', "watchDirectoryPath")
     interval = config.getint('MCPServer', "watchDirectoriesPollInterval")
+    method = config.get('MCPServer', "watchDirectoriesMethod")
 
     watched_directories = WatchedDirectory.objects.all()
 
@@ -222,9 +214,7 @@ def watchDirectories():
                 continue
             item = item.decode("utf-8")
             path = os.path.join(unicode(directory), item)
-            while(limitTaskThreads <= threading.activeCount() + reservedAsTaskProcessingThreads ):
-                time.sleep(1)
-            createUnitAndJobChainThreaded(path, row, terminate=False)
+            createUnitAndJobChainThreaded(path, row)
         actOnFiles=True
         if watched_directory.only_act_on_directories:
             actOnFiles=False
@@ -234,6 +224,7 @@ def watchDirectories():
             callBackFunctionAdded=createUnitAndJobChainThreaded,
             alertOnFiles=actOnFiles,
             interval=interval,
+            method=method,
         )
 
 def signal_handler(signalReceived, frame):
@@ -241,6 +232,10 @@ def signal_handler(signalReceived, frame):
     logger.info('Recieved signal %s in frame %s', signalReceived, frame)
     global stopSignalReceived
     stopSignalReceived = True
+    try:
+        taskJournal.flush()
+    except Exception:
+        logger.exception('Unable to write journaled tasks')
     threads = threading.enumerate()
     for thread in threads:
         logger.warning('Not stopping %s %s', type(thread), thread)
@@ -253,11 +248,12 @@ def signal_handler(signalReceived, frame):
 @auto_close_db
 def debugMonitor():
     """Periodically prints out status of MCP, including whether the database lock is locked, thread count, etc."""
-    global countOfCreateUnitAndJobChainThreaded
     while True:
         logger.debug('Debug monitor: datetime: %s', databaseFunctions.getUTCDate())
         logger.debug('Debug monitor: thread count: %s', threading.activeCount())
-        logger.debug('Debug monitor: created job chain threaded: %s', countOfCreateUnitAndJobChainThreaded)
+        logger.debug('Debug monitor: task scheduler: %s', taskScheduler.get_scheduler().stats())
+        logger.debug('Debug monitor: gearman submitters: %s', gearmanSubmitter.stats())
+        logger.debug('Debug monitor: task journal: %s', taskJournal.get_journal().stats())
         time.sleep(3600)
 
 @log_exceptions
@@ -269,9 +265,12 @@ def flushOutputs():
         time.sleep(5)
 
 def cleanupOldDbEntriesOnNewRun():
+    units = set(Job.objects.filter(currentstep__in=('Awaiting decision', 'Executing command(s)')).values_list('sipuuid', 'unittype'))
     Job.objects.filter(currentstep='Awaiting decision').delete()
     Job.objects.filter(currentstep='Executing command(s)').update(currentstep='Failed')
     Task.objects.filter(exitcode=None).update(exitcode=-1, stderror="MCP shut down while processing.")
+    for unit_uuid, unit_type in units:
+        UnitStatus.objects.refresh(unit_uuid, unit_type)
 
 
 def _except_hook_log_everything(exc_type, exc_value, exc_traceback):
@@ -333,6 +332,8 @@ if __name__ == '__main__':
     logger.info('This PID: %s', os.getpid())
     logger.info('User: %s', getpass.getuser())
 
+    metrics.start(config.get('MCPServer', 'metricsListen'))
+
     t = threading.Thread(target=debugMonitor)
     t.daemon = True
     t.start()
@@ -341,6 +342,7 @@ if __name__ == '__main__':
     t.daemon = True
     t.start()
     cleanupOldDbEntriesOnNewRun()
+    workflow.get_graph()
     watchDirectories()
 
     # This is blocking the main thread with the worker loop
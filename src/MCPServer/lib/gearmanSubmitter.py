@@ -0,0 +1,239 @@
+#!/usr/bin/env python2
+
+# This file is part of Archivematica.
+#
+# Copyright 2010-2013 Artefactual Systems Inc. <http://artefactual.com>
+#
+# Archivematica is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Archivematica is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Archivematica.  If not, see <http://www.gnu.org/licenses/>.
+
+# @package Archivematica
+# @subpackage MCPServer
+
+#~DOC~
+#
+# Long-lived Gearman submission layer for taskStandard.
+#
+# A few submitters each own one GearmanClient, and so one set of connections,
+# for the lifetime of the MCP server. Each submitter has a thread which sends
+# queued tasks to Gearman in batches with submit_multiple_requests, without
+# waiting for them to complete, then polls its connections for completed jobs.
+# Completed tasks are handed to the task scheduler, which calls the link task
+# manager's taskCompletedCallBackFunction; no thread is held while a job runs.
+
+import collections
+import cPickle
+import gearman
+from gearman.client_handler import GearmanClientCommandHandler
+from gearman.constants import JOB_CREATED, JOB_UNKNOWN
+import itertools
+import logging
+import Queue
+import threading
+import time
+
+import archivematicaMCP
+import metrics
+import taskJournal
+import taskScheduler
+from utils import log_exceptions
+
+LOGGER = logging.getLogger('archivematica.mcp.server')
+
+# How long to wait for Gearman activity before checking for new tasks
+POLL_TIMEOUT = 0.1
+# Most tasks sent to Gearman in one batch
+MAX_BATCH_SIZE = 500
+
+
+class _TrackingClientCommandHandler(GearmanClientCommandHandler):
+    """Records requests on the client as they finish, so that in-flight requests never need to be scanned."""
+    def recv_work_complete(self, job_handle, data):
+        request = self.handle_to_request_map.get(job_handle)
+        handled = super(_TrackingClientCommandHandler, self).recv_work_complete(job_handle, data)
+        self.connection_manager.finished.append(request)
+        return handled
+
+    def recv_work_fail(self, job_handle):
+        request = self.handle_to_request_map.get(job_handle)
+        handled = super(_TrackingClientCommandHandler, self).recv_work_fail(job_handle)
+        self.connection_manager.finished.append(request)
+        return handled
+
+    def on_io_error(self):
+        # Accepted requests on this connection are lost, and go back to JOB_UNKNOWN
+        super(_TrackingClientCommandHandler, self).on_io_error()
+        self.connection_manager.finished.extend(self.handle_to_request_map.values())
+        self.handle_to_request_map.clear()
+
+
+class _TrackingClient(gearman.GearmanClient):
+    command_handler_class = _TrackingClientCommandHandler
+
+    def __init__(self, host_list=None):
+        super(_TrackingClient, self).__init__(host_list=host_list)
+        self.finished = collections.deque()
+
+
+class GearmanSubmitter(object):
+    def __init__(self, host_list, name):
+        self.host_list = host_list
+        self.inbox = Queue.Queue()
+        self.in_flight = {}
+        self.retries = 0
+        self.thread = threading.Thread(target=self.run, name=name)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def submit(self, task, data):
+        """Queue a taskStandard to be sent to Gearman with the given job data."""
+        self.inbox.put((task, data))
+
+    def _take_new(self, block):
+        """Return a batch of queued (task, data) tuples, waiting for one if block is True."""
+        batch = []
+        try:
+            if block:
+                batch.append(self.inbox.get())
+            while len(batch) < MAX_BATCH_SIZE:
+                batch.append(self.inbox.get_nowait())
+        except Queue.Empty:
+            pass
+        return batch
+
+    def _send(self, client, pending):
+        """
+        Send pending tasks to Gearman, moving accepted ones to in_flight.
+        Returns the tasks which must be sent again.
+        """
+        # Clients read the task's row as soon as they start the job
+        taskJournal.flush(completed=False)
+        requests = []
+        for task, data in pending:
+            job = client.job_class(connection=None, handle=None, task=task.execute.lower(),
+                                   unique=task.UUID, data=cPickle.dumps(data))
+            requests.append(client.job_request_class(job))
+        try:
+            client.submit_multiple_requests(requests, wait_until_complete=False)
+        except (gearman.errors.ServerUnavailable, gearman.errors.ExceededConnectionAttempts):
+            LOGGER.debug('Unable to submit all jobs', exc_info=True)
+        retry = []
+        for (task, data), request in zip(pending, requests):
+            if request.state == JOB_CREATED or request.complete:
+                self.in_flight[request] = (task, data)
+                metrics.task_submitted_to_gearman(task)
+            else:
+                retry.append((task, data))
+        return retry
+
+    def _dispatch_finished(self, client):
+        """
+        Hand finished tasks to the task scheduler. Returns the tasks whose
+        connection was lost, or which timed out, which must be sent again.
+        """
+        retry = []
+        while client.finished:
+            request = client.finished.popleft()
+            task, data = self.in_flight.pop(request, (None, None))
+            if task is None:
+                continue
+            client.request_to_rotating_connection_queue.pop(request, None)
+            if request.state == JOB_UNKNOWN or request.timed_out:
+                # As when submit_job raised ServerUnavailable, the job is
+                # submitted again under the same unique ID, so Gearman joins
+                # it to the original if that is still running
+                LOGGER.warning('Lost track of task %s, submitting it again', task.UUID)
+                retry.append((task, data))
+                continue
+            archivematicaMCP.limitGearmanConnectionsSemaphore.release()
+            taskScheduler.submit(task.requestCompleted, args=(request,),
+                                 priority=taskScheduler.PRIORITY_HIGH,
+                                 unit=task.linkTaskManager.unit.UUID)
+        return retry
+
+    @log_exceptions
+    def run(self):
+        client = _TrackingClient(self.host_list)
+
+        def keep_polling(any_activity):
+            return self.inbox.empty() and not client.finished
+
+        pending = []
+        failMaxSleep = 60
+        failSleepInitial = 1
+        failSleep = failSleepInitial
+        failSleepIncrementor = 2
+        while True:
+            pending.extend(self._take_new(block=not pending and not self.in_flight))
+            if pending:
+                pending = self._send(client, pending)
+                if pending:
+                    self.retries += 1
+                    metrics.gearman_submit_retried()
+                    if failSleep == failSleepInitial:
+                        LOGGER.error('Error submitting %d job(s). Retrying.', len(pending))
+                    time.sleep(failSleep)
+                    if failSleep < failMaxSleep:
+                        failSleep += failSleepIncrementor
+                else:
+                    failSleep = failSleepInitial
+            if self.in_flight:
+                try:
+                    client.poll_connections_until_stopped(client.connection_list, keep_polling, timeout=POLL_TIMEOUT)
+                except gearman.errors.ServerUnavailable:
+                    LOGGER.error('Lost connection to Gearman with %d job(s) in flight', len(self.in_flight))
+                pending.extend(self._dispatch_finished(client))
+
+    def stats(self):
+        return {
+            'queued': self.inbox.qsize(),
+            'in_flight': len(self.in_flight),
+            'retries': self.retries,
+        }
+
+
+_submitters = None
+_submitters_cycle = None
+_submitters_lock = threading.Lock()
+
+
+def get_submitters():
+    """Return the process-wide GearmanSubmitters, starting them on first use."""
+    global _submitters, _submitters_cycle
+    with _submitters_lock:
+        if _submitters is None:
+            host_list = [archivematicaMCP.config.get('MCPServer', "MCPArchivematicaServer")]
+            count = archivematicaMCP.config.getint('Protocol', "gearmanClientConnections")
+            _submitters = [GearmanSubmitter(host_list, 'gearmanSubmitter-%d' % (i + 1)) for i in range(count)]
+            _submitters_cycle = itertools.cycle(_submitters)
+        return _submitters
+
+
+def submit(task, data):
+    """
+    Send a taskStandard to Gearman with the given job data. Returns immediately;
+    task.requestCompleted is called from the task scheduler when the job ends.
+    """
+    get_submitters()
+    with _submitters_lock:
+        submitter = next(_submitters_cycle)
+    submitter.submit(task, data)
+
+
+def stats():
+    """Return the summed queued, in flight and retry counts of all submitters."""
+    totals = {'queued': 0, 'in_flight': 0, 'retries': 0}
+    for submitter in get_submitters():
+        for key, value in submitter.stats().items():
+            totals[key] += value
+    return totals
@@ -25,12 +25,14 @@ import logging
 import sys
 
 from jobChainLink import jobChainLink
+import metrics
+import workflow
 
 sys.path.append("/usr/lib/archivematica/archivematicaCommon")
 from dicts import ReplacementDict
 
 sys.path.append("/usr/share/archivematica/dashboard")
-from main.models import MicroServiceChain, UnitVariable
+from main.models import UnitVariable
 
 #Holds:
 #-UNIT
@@ -70,10 +72,11 @@ class jobChain:
         self.linkSplitCount = 1
         self.subJobOf = subJobOf
 
-        chain = MicroServiceChain.objects.get(id=str(chainPK))
+        chain = workflow.get_graph().get_chain(chainPK)
         LOGGER.debug('Chain: %s', chain)
         self.startingChainLink = chain.startinglink_id
         self.description = chain.description
+        metrics.chain_started(self)
 
         # Migrate over unit variables containing replacement dicts from previous chains,
         # but prioritize any values contained in passVars passed in as kwargs
@@ -97,6 +100,7 @@ class jobChain:
             self.linkSplitCount -= 1
             if self.linkSplitCount == 0:
                 LOGGER.debug('Done with unit %s', self.unit.UUID)
+                metrics.chain_completed(self)
                 if self.notifyComplete:
                     self.notifyComplete(self)
 
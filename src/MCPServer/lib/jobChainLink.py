@@ -24,6 +24,8 @@ import logging
 import sys
 import uuid
 
+import metrics
+import taskJournal
 from utils import log_exceptions
 from linkTaskManagerDirectories import linkTaskManagerDirectories
 from linkTaskManagerFiles import linkTaskManagerFiles
@@ -35,13 +37,14 @@ from linkTaskManagerGetMicroserviceGeneratedListInStdOut import linkTaskManagerG
 from linkTaskManagerGetUserChoiceFromMicroserviceGeneratedList import linkTaskManagerGetUserChoiceFromMicroserviceGeneratedList
 from linkTaskManagerSetUnitVariable import linkTaskManagerSetUnitVariable
 from linkTaskManagerUnitVariableLinkPull import linkTaskManagerUnitVariableLinkPull
+import workflow
 
 sys.path.append("/usr/lib/archivematica/archivematicaCommon")
 from django_mysqlpool import auto_close_db
 from databaseFunctions import logJobCreatedSQL, getUTCDate
 
 sys.path.append("/usr/share/archivematica/dashboard")
-from main.models import Job, MicroServiceChainLink, MicroServiceChainLinkExitCode, TaskType
+from main.models import Job, MicroServiceChainLink, TaskType, UnitStatus
 
 LOGGER = logging.getLogger('archivematica.mcp.server')
 
@@ -70,14 +73,13 @@ class jobChainLink:
 
         # Depending on the path that led to this, jobChainLinkPK may
         # either be a UUID or a MicroServiceChainLink instance
-        if isinstance(jobChainLinkPK, basestring):
-            try:
-                link = MicroServiceChainLink.objects.get(id=str(jobChainLinkPK))
-            # This will sometimes return no values
-            except MicroServiceChainLink.DoesNotExist:
-                return
-        else:
-            link = jobChainLinkPK
+        if not isinstance(jobChainLinkPK, basestring):
+            jobChainLinkPK = jobChainLinkPK.id
+        try:
+            link = workflow.get_graph().get_link(jobChainLinkPK)
+        # This will sometimes return no values
+        except MicroServiceChainLink.DoesNotExist:
+            return
 
         self.pk = link.id
 
@@ -91,12 +93,13 @@ class jobChainLink:
         self.microserviceGroup = link.microservicegroup
 
         LOGGER.info('Running %s (unit %s)', self.description, self.unit.UUID)
-        self.unit.reload()
+        with metrics.measure_link():
+            self.unit.reload()
 
-        logJobCreatedSQL(self)
+            logJobCreatedSQL(self)
 
-        if self.createTasks(taskType, taskTypePKReference) == None:
-            self.getNextChainLinkPK(None)
+            if self.createTasks(taskType, taskTypePKReference) == None:
+                self.getNextChainLinkPK(None)
             #can't have none represent end of chain, and no tasks to process.
             #could return negative?
 
@@ -128,23 +131,23 @@ class jobChainLink:
 
     def getNextChainLinkPK(self, exitCode):
         if exitCode is not None:
-            try:
-                return MicroServiceChainLinkExitCode.objects.get(microservicechainlink_id=str(self.pk), exitcode=str(exitCode)).nextmicroservicechainlink_id
-            except (MicroServiceChainLinkExitCode.DoesNotExist, MicroServiceChainLinkExitCode.MultipleObjectsReturned):
+            exit_code = workflow.get_graph().get_exit_code(self.pk, exitCode)
+            if exit_code is None:
                 return self.defaultNextChainLink
+            return exit_code.nextmicroservicechainlink_id
 
     @log_exceptions
     @auto_close_db
     def setExitMessage(self, message):
         Job.objects.filter(jobuuid=self.UUID).update(currentstep=str(message))
+        UnitStatus.objects.refresh_job(self.UUID)
 
     def updateExitMessage(self, exitCode):
         message = self.defaultExitMessage
         if exitCode is not None:
-            try:
-                message = MicroServiceChainLinkExitCode.objects.get(microservicechainlink_id=str(self.pk), exitcode=str(exitCode)).exitmessage
-            except MicroServiceChainLinkExitCode.DoesNotExist:
-                pass
+            exit_code = workflow.get_graph().get_exit_code(self.pk, exitCode)
+            if exit_code is not None:
+                message = exit_code.exitmessage
         if message is not None:
             self.setExitMessage(message)
         else:
@@ -153,5 +156,7 @@ class jobChainLink:
     @log_exceptions
     @auto_close_db
     def linkProcessingComplete(self, exitCode, passVar=None):
+        # Tasks of this link must be in the database before the next link starts
+        taskJournal.flush()
         self.updateExitMessage(exitCode)
         self.jobChain.nextChainLink(self.getNextChainLinkPK(exitCode), passVar=passVar)
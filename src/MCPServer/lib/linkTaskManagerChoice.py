@@ -28,14 +28,43 @@ import os
 import sys
 import threading
 import time
+import uuid
 
 from linkTaskManager import LinkTaskManager
 from executeOrRunSubProcess import executeOrRun
 import jobChain
 from utils import log_exceptions
 import archivematicaMCP
+import workflow
+
+
+class ChoiceRegistry(dict):
+    """
+    Link task managers awaiting a decision, by job UUID. Its version changes
+    whenever one is added or removed, so that what was built from it can be
+    reused until then; see RPCServer.getChoices.
+    """
+    def __init__(self):
+        super(ChoiceRegistry, self).__init__()
+        # Versions of a restarted MCP server must differ from those before
+        self._run = uuid.uuid4().hex[:8]
+        self._changes = 0
+
+    @property
+    def version(self):
+        return '{}-{}'.format(self._run, self._changes)
+
+    def __setitem__(self, key, value):
+        super(ChoiceRegistry, self).__setitem__(key, value)
+        self._changes += 1
+
+    def __delitem__(self, key):
+        super(ChoiceRegistry, self).__delitem__(key)
+        self._changes += 1
+
+
 global choicesAvailableForUnits
-choicesAvailableForUnits = {}
+choicesAvailableForUnits = ChoiceRegistry()
 choicesAvailableForUnitsLock = threading.Lock()
 
 sys.path.append("/usr/lib/archivematica/archivematicaCommon")
@@ -43,7 +72,7 @@ from django_mysqlpool import auto_close_db
 from archivematicaFunctions import unicodeToStr
 
 sys.path.append("/usr/share/archivematica/dashboard")
-from main.models import MicroServiceChainChoice, UserProfile
+from main.models import UserProfile
 
 waitingOnTimer="waitingOnTimer"
 
@@ -57,9 +86,8 @@ class linkTaskManagerChoice(LinkTaskManager):
         self.delayTimerLock = threading.Lock()
         self.delayTimer = None
 
-        choices = MicroServiceChainChoice.objects.filter(choiceavailableatlink_id=str(jobChainLink.pk))
-        for choice in choices:
-            self.choices.append((choice.chainavailable_id, choice.chainavailable.description))
+        for choice in workflow.get_graph().get_choices(jobChainLink.pk):
+            self.choices.append((choice.chainavailable_id, choice.description))
 
         preConfiguredChain = self.checkForPreconfiguredXML()
         if preConfiguredChain != None:
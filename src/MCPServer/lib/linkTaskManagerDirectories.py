@@ -22,24 +22,23 @@
 # @author Joseph Perry <joseph@artefactual.com>
 
 from linkTaskManager import LinkTaskManager
+import taskJournal
+import taskScheduler
 from taskStandard import taskStandard
+import workflow
 import os
 import sys
-import threading
 
 sys.path.append("/usr/lib/archivematica/archivematicaCommon")
 import archivematicaFunctions
-import databaseFunctions
 from dicts import ReplacementDict
-sys.path.append("/usr/share/archivematica/dashboard")
-from main.models import StandardTaskConfig
 
 
 class linkTaskManagerDirectories(LinkTaskManager):
     def __init__(self, jobChainLink, pk, unit):
         super(linkTaskManagerDirectories, self).__init__(jobChainLink, pk, unit)
         self.tasks = []
-        stc = StandardTaskConfig.objects.get(id=str(pk))
+        stc = workflow.get_graph().get_standard_task_config(pk)
         filterSubDir = stc.filter_subdir
         self.requiresOutputLock = stc.requires_output_lock
         standardOutputFile = stc.stdout_file
@@ -70,11 +69,9 @@ class linkTaskManagerDirectories(LinkTaskManager):
         arguments, standardOutputFile, standardErrorFile = commandReplacementDic.replace(arguments, standardOutputFile, standardErrorFile)
 
         self.task = taskStandard(self, execute, arguments, standardOutputFile, standardErrorFile, UUID=self.UUID)
-        databaseFunctions.logTaskCreatedSQL(self, commandReplacementDic, self.UUID, arguments)
-        t = threading.Thread(target=self.task.performTask)
-        t.daemon = True
-        t.start()
+        taskJournal.task_created(self, commandReplacementDic, self.UUID, arguments)
+        taskScheduler.submit(self.task.performTask, priority=taskScheduler.PRIORITY_HIGH, unit=self.unit.UUID)
 
     def taskCompletedCallBackFunction(self, task):
-        databaseFunctions.logTaskCompletedSQL(task)
+        taskJournal.task_completed(task)
         self.jobChainLink.linkProcessingComplete(task.results["exitCode"], self.jobChainLink.passVar)
@@ -25,22 +25,25 @@ import ast
 import logging
 import os
 import threading
-import time
 import sys
 import uuid
 
-import archivematicaMCP
 from linkTaskManager import LinkTaskManager
+import taskJournal
+import taskScheduler
 from taskStandard import taskStandard
+import workflow
 sys.path.append("/usr/lib/archivematica/archivematicaCommon")
 import archivematicaFunctions
-import databaseFunctions
 from dicts import ReplacementDict
 sys.path.append("/usr/share/archivematica/dashboard")
-from main.models import StandardTaskConfig, UnitVariable
+from main.models import UnitVariable
 
 LOGGER = logging.getLogger('archivematica.mcp.server')
 
+# Most escaped replacement values remembered while creating a link's tasks
+MAX_ESCAPED_VALUES = 10000
+
 class linkTaskManagerFiles(LinkTaskManager):
     def __init__(self, jobChainLink, pk, unit):
         super(linkTaskManagerFiles, self).__init__(jobChainLink, pk, unit)
@@ -49,7 +52,7 @@ class linkTaskManagerFiles(LinkTaskManager):
         self.exitCode = 0
         self.clearToNextLink = False
 
-        stc = StandardTaskConfig.objects.get(id=str(pk))
+        stc = workflow.get_graph().get_standard_task_config(pk)
         # These three may be concatenated/compared with other strings,
         # so they need to be bytestrings here
         filterFileEnd = str(stc.filter_file_end) if stc.filter_file_end else ''
@@ -86,7 +89,35 @@ class linkTaskManagerFiles(LinkTaskManager):
         # Escape all values for shell
         for key, value in SIPReplacementDic.items():
             SIPReplacementDic[key] = archivematicaFunctions.escapeForCommand(value)
-        self.tasksLock.acquire()
+        SIPReplacementDic = SIPReplacementDic.compile()
+
+        # Apply passvar replacement values; they're the same for every file
+        standardOutputFile = self.standardOutputFile
+        standardErrorFile = self.standardErrorFile
+        execute = self.execute
+        arguments = self.arguments
+        if self.jobChainLink.passVar is not None:
+            if isinstance(self.jobChainLink.passVar, list):
+                for passVar in self.jobChainLink.passVar:
+                    if isinstance(passVar, ReplacementDict):
+                        arguments, standardOutputFile, standardErrorFile = passVar.replace(arguments, standardOutputFile, standardErrorFile)
+            elif isinstance(self.jobChainLink.passVar, ReplacementDict):
+                arguments, standardOutputFile, standardErrorFile = self.jobChainLink.passVar.replace(arguments, standardOutputFile, standardErrorFile)
+        templates = (arguments, standardOutputFile, standardErrorFile)
+
+        # Many values (SIP paths, file group...) are the same for most files,
+        # so remember their escaped forms
+        escaped = {}
+        def escapeForCommand(value):
+            try:
+                return escaped[value]
+            except KeyError:
+                if len(escaped) >= MAX_ESCAPED_VALUES:
+                    escaped.clear()
+                ret = escaped[value] = archivematicaFunctions.escapeForCommand(value)
+                return ret
+
+        taskCount = 0
         for file, fileUnit in unit.fileList.items():
             if filterFileEnd:
                 if not file.endswith(filterFileEnd):
@@ -98,50 +129,40 @@ class linkTaskManagerFiles(LinkTaskManager):
                 if not file.startswith(unit.pathString + filterSubDir):
                     continue
 
-            standardOutputFile = self.standardOutputFile
-            standardErrorFile = self.standardErrorFile
-            execute = self.execute
-            arguments = self.arguments
-
-            # Apply passvar replacement values
-            if self.jobChainLink.passVar is not None:
-                if isinstance(self.jobChainLink.passVar, list):
-                    for passVar in self.jobChainLink.passVar:
-                        if isinstance(passVar, ReplacementDict):
-                            arguments, standardOutputFile, standardErrorFile = passVar.replace(arguments, standardOutputFile, standardErrorFile)
-                elif isinstance(self.jobChainLink.passVar, ReplacementDict):
-                    arguments, standardOutputFile, standardErrorFile = self.jobChainLink.passVar.replace(arguments, standardOutputFile, standardErrorFile)
-
             # Apply file replacement values
             commandReplacementDic = fileUnit.getReplacementDic()
             for key, value in commandReplacementDic.items():
                 # Escape values for shell
-                commandReplacementDic[key] = archivematicaFunctions.escapeForCommand(value)
-            arguments, standardOutputFile, standardErrorFile = commandReplacementDic.replace(arguments, standardOutputFile, standardErrorFile)
+                commandReplacementDic[key] = escapeForCommand(value)
+            arguments, standardOutputFile, standardErrorFile = commandReplacementDic.replace(*templates)
 
             # Apply unit (SIP/Transfer) replacement values
             arguments, standardOutputFile, standardErrorFile = SIPReplacementDic.replace(arguments, standardOutputFile, standardErrorFile)
 
             UUID = str(uuid.uuid4())
             task = taskStandard(self, execute, arguments, standardOutputFile, standardErrorFile, outputLock=outputLock, UUID=UUID)
-            self.tasks[UUID] = task
-            databaseFunctions.logTaskCreatedSQL(self, commandReplacementDic, UUID, arguments)
-            t = threading.Thread(target=task.performTask)
-            t.daemon = True
-            while(archivematicaMCP.limitTaskThreads <= threading.activeCount()):
-                self.tasksLock.release()
-                time.sleep(archivematicaMCP.limitTaskThreadsSleep)
-                self.tasksLock.acquire()
-            t.start()
+            with self.tasksLock:
+                self.tasks[UUID] = task
+            taskCount += 1
+            taskJournal.task_created(self, commandReplacementDic, UUID, arguments)
+            # The lock must not be held here: when the scheduler's queue is
+            # full, the task may run, and call back, in this thread.
+            taskScheduler.submit(task.performTask, priority=taskScheduler.PRIORITY_NORMAL, unit=self.unit.UUID)
 
+        self.tasksLock.acquire()
         self.clearToNextLink = True
+        tasksFinished = self.tasks == {}
         self.tasksLock.release()
-        if self.tasks == {}:
+        if taskCount == 0:
             self.jobChainLink.linkProcessingComplete(self.exitCode)
+        elif tasksFinished:
+            # Every task completed before the last one was submitted
+            LOGGER.debug('Proceeding to next link %s', self.jobChainLink.UUID)
+            self.jobChainLink.linkProcessingComplete(self.exitCode, self.jobChainLink.passVar)
 
     def taskCompletedCallBackFunction(self, task):
         self.exitCode = max(self.exitCode, abs(task.results["exitCode"]))
-        databaseFunctions.logTaskCompletedSQL(task)
+        taskJournal.task_completed(task)
 
         self.tasksLock.acquire()
         if task.UUID in self.tasks:
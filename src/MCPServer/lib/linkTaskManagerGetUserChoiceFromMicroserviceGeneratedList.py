@@ -32,11 +32,12 @@ from linkTaskManager import LinkTaskManager
 import archivematicaMCP
 from linkTaskManagerChoice import choicesAvailableForUnits
 from linkTaskManagerChoice import choicesAvailableForUnitsLock
+import workflow
 
 sys.path.append("/usr/lib/archivematica/archivematicaCommon")
 from dicts import ReplacementDict, ChoicesDict
 sys.path.append("/usr/share/archivematica/dashboard")
-from main.models import StandardTaskConfig, UserProfile
+from main.models import UserProfile
 
 LOGGER = logging.getLogger('archivematica.mcp.server')
 
@@ -44,7 +45,7 @@ class linkTaskManagerGetUserChoiceFromMicroserviceGeneratedList(LinkTaskManager)
     def __init__(self, jobChainLink, pk, unit):
         super(linkTaskManagerGetUserChoiceFromMicroserviceGeneratedList, self).__init__(jobChainLink, pk, unit)
         self.choices = []
-        stc = StandardTaskConfig.objects.get(id=str(pk))
+        stc = workflow.get_graph().get_standard_task_config(pk)
         key = stc.execute
 
         choiceIndex = 0
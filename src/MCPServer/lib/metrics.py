@@ -0,0 +1,173 @@
+#!/usr/bin/env python2
+
+# This file is part of Archivematica.
+#
+# Copyright 2010-2013 Artefactual Systems Inc. <http://artefactual.com>
+#
+# Archivematica is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Archivematica is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Archivematica.  If not, see <http://www.gnu.org/licenses/>.
+
+# @package Archivematica
+# @subpackage MCPServer
+
+#~DOC~
+#
+# Prometheus metrics for the MCP server, served over HTTP on metricsListen.
+#
+# The functions below are called where things happen; they do nothing when
+# prometheus_client isn't installed or metrics are not enabled, so callers
+# never need to check.
+
+import contextlib
+import sys
+import threading
+
+try:
+    import prometheus_client
+    from prometheus_client.core import GaugeMetricFamily, REGISTRY
+except ImportError:
+    prometheus_client = None
+
+sys.path.append("/usr/lib/archivematica/archivematicaCommon")
+import metricsServer
+
+# Seconds; tasks run from under a second to many hours
+TASK_DURATION_BUCKETS = (0.1, 0.5, 1, 5, 10, 30, 60, 300, 900, 3600, 4 * 3600, 12 * 3600, float('inf'))
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 500, 1000, 5000, 10000, 50000, 100000, float('inf'))
+
+enabled = False
+_local = threading.local()
+# Unit UUID: (jobChain, chain description) of the chain each unit is running
+_unit_chains = {}
+_unit_chains_lock = threading.Lock()
+
+
+if prometheus_client is not None:
+    task_submitted = prometheus_client.Counter(
+        'mcpserver_task_submitted_total', 'Tasks sent to MCP clients', ['execute'])
+    task_completed = prometheus_client.Counter(
+        'mcpserver_task_completed_total', 'Tasks completed by MCP clients', ['execute'])
+    task_failed = prometheus_client.Counter(
+        'mcpserver_task_failed_total', 'Tasks completed with a non-zero exit code', ['execute'])
+    task_duration = prometheus_client.Histogram(
+        'mcpserver_task_duration_seconds', 'Time from sending a task to Gearman to its completion',
+        ['execute'], buckets=TASK_DURATION_BUCKETS)
+    scheduler_wait = prometheus_client.Histogram(
+        'mcpserver_scheduler_wait_seconds', 'Time work waited in the task scheduler queue',
+        buckets=TASK_DURATION_BUCKETS)
+    scheduler_run = prometheus_client.Histogram(
+        'mcpserver_scheduler_run_seconds', 'Time task scheduler workers spent on a work item',
+        buckets=TASK_DURATION_BUCKETS)
+    gearman_retries = prometheus_client.Counter(
+        'mcpserver_gearman_submit_retries_total', 'Failed attempts to submit a batch of jobs to Gearman')
+    link_queries = prometheus_client.Histogram(
+        'mcpserver_link_db_queries', 'Database queries made while starting a chain link and creating its tasks',
+        buckets=QUERY_COUNT_BUCKETS)
+
+    class _ActiveUnitsCollector(object):
+        def collect(self):
+            family = GaugeMetricFamily('mcpserver_active_units', 'Units being processed, by chain', labels=['chain'])
+            with _unit_chains_lock:
+                counts = {}
+                for _, description in _unit_chains.values():
+                    counts[description] = counts.get(description, 0) + 1
+            for description, count in counts.items():
+                family.add_metric([description], count)
+            yield family
+
+
+def _count_query(execute):
+    def wrapped(self, *args, **kwargs):
+        _local.queries = getattr(_local, 'queries', 0) + 1
+        return execute(self, *args, **kwargs)
+    return wrapped
+
+
+def start(listen):
+    """
+    Serve metrics over HTTP on listen, "address:port". Also starts counting
+    database queries, which isn't free, so is only done when metrics are on.
+    """
+    global enabled
+    if not metricsServer.serve(listen):
+        return
+    from django.db.backends.utils import CursorWrapper
+    CursorWrapper.execute = _count_query(CursorWrapper.execute)
+    CursorWrapper.executemany = _count_query(CursorWrapper.executemany)
+    REGISTRY.register(_ActiveUnitsCollector())
+    enabled = True
+
+
+def db_queries():
+    """Return the number of database queries made so far by this thread."""
+    return getattr(_local, 'queries', 0)
+
+
+def task_submitted_to_gearman(task):
+    if enabled:
+        task_submitted.labels(task.execute).inc()
+
+
+def task_finished(task, duration):
+    if enabled:
+        task_completed.labels(task.execute).inc()
+        task_duration.labels(task.execute).observe(duration)
+        if getattr(task, 'results', {}).get('exitCode'):
+            task_failed.labels(task.execute).inc()
+
+
+def scheduled_work_finished(wait_time, run_time):
+    if enabled:
+        scheduler_wait.observe(wait_time)
+        scheduler_run.observe(run_time)
+
+
+def gearman_submit_retried():
+    if enabled:
+        gearman_retries.inc()
+
+
+@contextlib.contextmanager
+def measure_link():
+    """
+    Record the database queries made in the body as those of starting one
+    link. Links started from inside the body, when a link proceeds straight to
+    the next one, are recorded separately and not counted again.
+    """
+    if not enabled:
+        yield
+        return
+    start = db_queries()
+    outer_nested = getattr(_local, 'nested', 0)
+    _local.nested = 0
+    try:
+        yield
+    finally:
+        total = db_queries() - start
+        link_queries.observe(total - _local.nested)
+        _local.nested = outer_nested + total
+
+
+def chain_started(chain):
+    """Record that chain's unit is now running it."""
+    if enabled:
+        with _unit_chains_lock:
+            _unit_chains[chain.unit.UUID] = (chain, chain.description)
+
+
+def chain_completed(chain):
+    """Record that chain finished; its unit is no longer active unless it started another chain."""
+    if enabled:
+        with _unit_chains_lock:
+            if _unit_chains.get(chain.unit.UUID, (None,))[0] is chain:
+                del _unit_chains[chain.unit.UUID]
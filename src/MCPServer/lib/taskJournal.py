@@ -0,0 +1,216 @@
+#!/usr/bin/env python2
+
+# This file is part of Archivematica.
+#
+# Copyright 2010-2013 Artefactual Systems Inc. <http://artefactual.com>
+#
+# Archivematica is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Archivematica is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Archivematica.  If not, see <http://www.gnu.org/licenses/>.
+
+# @package Archivematica
+# @subpackage MCPServer
+
+#~DOC~
+#
+# Write-behind journal of Task rows.
+#
+# Link task managers record created and completed tasks here instead of
+# writing each one to the Tasks table. Records are written in batches: created
+# tasks with one bulk_create, completed tasks with one UPDATE per batch. A batch
+# is written when it reaches batchSize records, after flushInterval seconds, or
+# earlier when something depends on it:
+#
+#  - created tasks are written before the Gearman submitter sends any job, as
+#    the MCP client reads the task's row when it starts the job;
+#  - everything is written before a link proceeds to the next one, so a Task
+#    row is never behind the Job that follows it.
+#
+# If the MCP server stops before a batch is written, the lost records are of
+# tasks which either never reached a client (created) or whose link never moved
+# on (completed). Their rows are missing or still have no exit code, and are
+# handled by cleanupOldDbEntriesOnNewRun as tasks interrupted by the shutdown.
+
+import logging
+import sys
+import threading
+import time
+
+sys.path.append("/usr/lib/archivematica/archivematicaCommon")
+from django_mysqlpool import auto_close_db
+import databaseFunctions
+
+sys.path.append("/usr/share/archivematica/dashboard")
+from django.db import transaction
+from django.db.models import Case, Value, When
+from main.models import Task
+
+import archivematicaMCP
+from utils import log_exceptions
+
+LOGGER = logging.getLogger('archivematica.mcp.server')
+
+COMPLETED_FIELDS = ('endtime', 'exitcode', 'stdout', 'stderror')
+# Bytes of task output above which completed tasks are written without waiting
+# for batchSize records, to keep UPDATE statements well below max_allowed_packet
+MAX_BATCH_OUTPUT = 4 * 1024 * 1024
+
+
+class TaskJournal(object):
+    def __init__(self, batch_size, flush_interval):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.lock = threading.Lock()
+        self.full = threading.Condition(self.lock)
+        # Held while writing, so batches reach the database in order
+        self.flush_lock = threading.Lock()
+        self.created = []
+        self.completed = []
+        self.completed_output = 0
+
+        # Metrics
+        self.tasks_created = 0
+        self.tasks_completed = 0
+        self.flushes = 0
+        self.errors = 0
+
+        self.thread = threading.Thread(target=self.run, name='taskJournal')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def task_created(self, taskManager, commandReplacementDic, taskUUID, arguments):
+        """Journal a new task; arguments as databaseFunctions.logTaskCreatedSQL."""
+        task = databaseFunctions.createdTask(taskManager, commandReplacementDic, taskUUID, arguments)
+        with self.lock:
+            self.created.append(task)
+            if len(self.created) >= self.batch_size:
+                self.full.notify()
+
+    def task_completed(self, task):
+        """Journal the results of a completed taskStandard; see databaseFunctions.logTaskCompletedSQL."""
+        fields = databaseFunctions.completedTaskFields(task)
+        with self.lock:
+            self.completed.append((task.UUID.__str__(), fields))
+            self.completed_output += len(fields['stdout']) + len(fields['stderror'])
+            if len(self.completed) >= self.batch_size or self.completed_output >= MAX_BATCH_OUTPUT:
+                self.full.notify()
+
+    def flush(self, completed=True):
+        """
+        Write journaled records to the database now. With completed=False only
+        created tasks are written.
+        """
+        with self.flush_lock:
+            with self.lock:
+                created, self.created = self.created, []
+                if completed:
+                    done, self.completed = self.completed, []
+                    self.completed_output = 0
+                else:
+                    done = []
+            if created:
+                self._write_created(created)
+            if done:
+                self._write_completed(done)
+            if created or done:
+                self.flushes += 1
+
+    def _write_created(self, created):
+        try:
+            Task.objects.bulk_create(created, batch_size=self.batch_size)
+        except Exception:
+            LOGGER.exception('Unable to write %d created tasks in bulk; writing them one at a time', len(created))
+            for task in created:
+                try:
+                    task.save(force_insert=True)
+                except Exception:
+                    self.errors += 1
+                    LOGGER.exception('Unable to write created task %s', task.taskuuid)
+        self.tasks_created += len(created)
+
+    def _write_completed(self, completed):
+        for start in range(0, len(completed), self.batch_size):
+            batch = completed[start:start + self.batch_size]
+            updates = {}
+            for field in COMPLETED_FIELDS:
+                output_field = Task._meta.get_field(field)
+                whens = [When(taskuuid=uuid, then=Value(fields[field], output_field=output_field))
+                         for uuid, fields in batch]
+                updates[field] = Case(*whens, output_field=output_field)
+            try:
+                with transaction.atomic():
+                    Task.objects.filter(taskuuid__in=[uuid for uuid, _ in batch]).update(**updates)
+            except Exception:
+                LOGGER.exception('Unable to write %d completed tasks in bulk; writing them one at a time', len(batch))
+                for uuid, fields in batch:
+                    try:
+                        Task.objects.filter(taskuuid=uuid).update(**fields)
+                    except Exception:
+                        self.errors += 1
+                        LOGGER.exception('Unable to write completed task %s', uuid)
+            self.tasks_completed += len(batch)
+
+    @log_exceptions
+    @auto_close_db
+    def run(self):
+        while True:
+            with self.lock:
+                deadline = time.time() + self.flush_interval
+                while (len(self.created) < self.batch_size
+                       and len(self.completed) < self.batch_size
+                       and self.completed_output < MAX_BATCH_OUTPUT):
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        break
+                    self.full.wait(remaining)
+            try:
+                self.flush()
+            except Exception:
+                LOGGER.exception('Error flushing the task journal')
+
+    def stats(self):
+        with self.lock:
+            return {
+                'created_pending': len(self.created),
+                'completed_pending': len(self.completed),
+                'created': self.tasks_created,
+                'completed': self.tasks_completed,
+                'flushes': self.flushes,
+                'errors': self.errors,
+            }
+
+
+_journal = None
+_journal_lock = threading.Lock()
+
+
+def get_journal():
+    """Return the process-wide TaskJournal, starting it on first use."""
+    global _journal
+    with _journal_lock:
+        if _journal is None:
+            _journal = TaskJournal(archivematicaMCP.config.getint('Protocol', "taskJournalBatchSize"),
+                                   archivematicaMCP.config.getfloat('Protocol', "taskJournalFlushInterval"))
+        return _journal
+
+
+def task_created(taskManager, commandReplacementDic, taskUUID, arguments):
+    get_journal().task_created(taskManager, commandReplacementDic, taskUUID, arguments)
+
+
+def task_completed(task):
+    get_journal().task_completed(task)
+
+
+def flush(completed=True):
+    """Write everything journaled so far; see TaskJournal.flush."""
+    get_journal().flush(completed=completed)
@@ -0,0 +1,188 @@
+#!/usr/bin/env python2
+
+# This file is part of Archivematica.
+#
+# Copyright 2010-2013 Artefactual Systems Inc. <http://artefactual.com>
+#
+# Archivematica is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Archivematica is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Archivematica.  If not, see <http://www.gnu.org/licenses/>.
+
+# @package Archivematica
+# @subpackage MCPServer
+
+#~DOC~
+#
+# Fixed-size worker pool used for all work the MCP server does in the
+# background: starting units found in watched directories and running the
+# tasks created by link task managers.
+#
+# Work items are queued by priority, and within a priority round-robin by unit,
+# so a SIP with 50,000 files can't starve a SIP with 10.
+# The queue is bounded. When it is full, producers block until a worker takes
+# an item off the queue, except when the producer is itself a pool worker: it
+# then runs the item itself, since blocking would risk every worker waiting on
+# a queue that nobody drains.
+
+import collections
+import logging
+import threading
+import time
+
+import archivematicaMCP
+import metrics
+
+LOGGER = logging.getLogger('archivematica.mcp.server')
+
+# Work a whole unit is waiting on, e.g. the single task of a directory link
+PRIORITY_HIGH = 0
+# Per-file tasks
+PRIORITY_NORMAL = 1
+# Starting new units
+PRIORITY_LOW = 2
+PRIORITIES = (PRIORITY_HIGH, PRIORITY_NORMAL, PRIORITY_LOW)
+
+
+class TaskScheduler(object):
+    def __init__(self, workers, max_queued):
+        self.lock = threading.Lock()
+        self.not_empty = threading.Condition(self.lock)
+        self.not_full = threading.Condition(self.lock)
+        # One ordered dict of unit: deque of work items per priority; a unit
+        # is moved to the end of its dict each time one of its items is taken.
+        self.queues = [collections.OrderedDict() for _ in PRIORITIES]
+        self.queued = 0
+        self.max_queued = max_queued
+        self.local = threading.local()
+
+        # Metrics
+        self.busy = 0
+        self.submitted = 0
+        self.completed = 0
+        self.ran_inline = 0
+        self.blocked_producers = 0
+        self.wait_time_total = 0.0
+        self.wait_time_max = 0.0
+        self.run_time_total = 0.0
+
+        self.workers = []
+        for i in range(workers):
+            t = threading.Thread(target=self._work, name='taskScheduler-%d' % (i + 1))
+            t.daemon = True
+            t.start()
+            self.workers.append(t)
+
+    def submit(self, function, args=(), kwargs=None, priority=PRIORITY_NORMAL, unit=None):
+        """
+        Queue function(*args, **kwargs) to be run by a pool worker.
+
+        :param int priority: One of PRIORITY_HIGH, PRIORITY_NORMAL or PRIORITY_LOW.
+        :param unit: Key used to share workers fairly between units, usually the unit UUID.
+        """
+        item = (time.time(), function, args, kwargs or {})
+        with self.lock:
+            self.submitted += 1
+            if self.queued >= self.max_queued:
+                if getattr(self.local, 'is_worker', False):
+                    self.ran_inline += 1
+                    item = None
+                else:
+                    self.blocked_producers += 1
+                    while self.queued >= self.max_queued:
+                        self.not_full.wait()
+                    self.blocked_producers -= 1
+            if item is not None:
+                self.queues[priority].setdefault(unit, collections.deque()).append(item)
+                self.queued += 1
+                self.not_empty.notify()
+                return
+        self._run((time.time(), function, args, kwargs or {}))
+
+    def _pop(self):
+        for queue in self.queues:
+            if queue:
+                unit, items = next(queue.iteritems())
+                item = items.popleft()
+                del queue[unit]
+                if items:
+                    queue[unit] = items
+                self.queued -= 1
+                return item
+
+    def _work(self):
+        self.local.is_worker = True
+        while True:
+            with self.lock:
+                while not self.queued:
+                    self.not_empty.wait()
+                item = self._pop()
+                self.not_full.notify()
+            self._run(item)
+
+    def _run(self, item):
+        queued_at, function, args, kwargs = item
+        started = time.time()
+        wait_time = started - queued_at
+        with self.lock:
+            self.busy += 1
+            self.wait_time_total += wait_time
+            self.wait_time_max = max(self.wait_time_max, wait_time)
+        try:
+            function(*args, **kwargs)
+        except (Exception, SystemExit):
+            # Work items were written to run in their own thread, where
+            # calling exit() only ended that thread; keep the worker alive.
+            LOGGER.exception('Uncaught exception in scheduled work %s', function)
+        finally:
+            run_time = time.time() - started
+            with self.lock:
+                self.busy -= 1
+                self.completed += 1
+                self.run_time_total += run_time
+            metrics.scheduled_work_finished(wait_time, run_time)
+
+    def stats(self):
+        """Return a dict describing the current state of the pool and its queue."""
+        with self.lock:
+            return {
+                'workers': len(self.workers),
+                'busy': self.busy,
+                'queued': self.queued,
+                'queued_by_priority': [sum(len(items) for items in queue.itervalues()) for queue in self.queues],
+                'units_queued': len(set(unit for queue in self.queues for unit in queue)),
+                'blocked_producers': self.blocked_producers,
+                'submitted': self.submitted,
+                'completed': self.completed,
+                'ran_inline': self.ran_inline,
+                'wait_time_total': self.wait_time_total,
+                'wait_time_max': self.wait_time_max,
+                'wait_time_mean': self.wait_time_total / self.completed if self.completed else 0.0,
+                'run_time_total': self.run_time_total,
+            }
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler():
+    """Return the process-wide TaskScheduler, starting it on first use."""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = TaskScheduler(archivematicaMCP.limitTaskThreads, archivematicaMCP.limitTaskQueueSize)
+        return _scheduler
+
+
+def submit(function, args=(), kwargs=None, priority=PRIORITY_NORMAL, unit=None):
+    """Submit work to the process-wide TaskScheduler; see TaskScheduler.submit."""
+    get_scheduler().submit(function, args=args, kwargs=kwargs, priority=priority, unit=unit)
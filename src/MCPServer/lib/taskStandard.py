@@ -29,7 +29,8 @@ import sys
 import time
 import uuid
 
-import archivematicaMCP
+import gearmanSubmitter
+import metrics
 from utils import log_exceptions
 
 from django.utils import timezone
@@ -49,7 +50,7 @@ LOGGER = logging.getLogger('archivematica.mcp.server')
 class taskStandard():
     """A task to hand to gearman"""
 
-    def __init__(self, linkTaskManager, execute, arguments, standardOutputFile, standardErrorFile, outputLock=None, UUID=None):
+    def __init__(self, linkTaskManager, execute, arguments, standardOutputFile, standardErrorFile, outputLock=None, UUID=None, fullOutput=False):
         if UUID == None:
             UUID = uuid.uuid4().__str__()
         self.UUID = UUID
@@ -59,34 +60,32 @@ class taskStandard():
         self.standardOutputFile = standardOutputFile
         self.standardErrorFile = standardErrorFile
         self.outputLock = outputLock
+        # Output written to log files or parsed must not be truncated by the client
+        self.fullOutput = fullOutput or standardOutputFile is not None or standardErrorFile is not None
+        # Replaced by the client's results once the job completes
+        self.results = {'exitCode': -1, 'stdOut': '', 'stdError': ''}
 
     @log_exceptions
     @auto_close_db
     def performTask(self):
+        # Bounds the number of tasks in flight; released by the submitter
+        # when the job completes.
         from archivematicaMCP import limitGearmanConnectionsSemaphore
         limitGearmanConnectionsSemaphore.acquire()
-        gm_client = gearman.GearmanClient([archivematicaMCP.config.get('MCPServer', "MCPArchivematicaServer")])
         data = {"createdDate" : timezone.now().isoformat(' ')}
         data["arguments"] = self.arguments
+        if self.fullOutput:
+            data["fullOutput"] = True
         LOGGER.info('Executing %s %s', self.execute, data)
-        completed_job_request = None
-        failMaxSleep = 60
-        failSleepInitial = 1
-        failSleep = failSleepInitial
-        failSleepIncrementor = 2
-        while completed_job_request == None:
-            try:
-                completed_job_request = gm_client.submit_job(self.execute.lower(), cPickle.dumps(data), self.UUID)
-            except gearman.errors.ServerUnavailable:
-                completed_job_request = None
-                time.sleep(failSleep)
-                if failSleep == failSleepInitial:
-                    LOGGER.exception('Error submitting job. Retrying.')
-                if failSleep < failMaxSleep:
-                    failSleep += failSleepIncrementor
-        limitGearmanConnectionsSemaphore.release()
-        self.check_request_status(completed_job_request)
-        gm_client.shutdown()
+        self.submittedAt = time.time()
+        gearmanSubmitter.submit(self, data)
+
+    @log_exceptions
+    @auto_close_db
+    def requestCompleted(self, job_request):
+        """Called, from the task scheduler, once the Gearman job for this task has ended."""
+        self.check_request_status(job_request)
+        metrics.task_finished(self, time.time() - self.submittedAt)
         LOGGER.debug('Finished performing task %s', self.UUID)
 
     def check_request_status(self, job_request):
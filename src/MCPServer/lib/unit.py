@@ -23,7 +23,9 @@
 
 import logging
 import os
+import stat
 import sys
+import time
 
 import archivematicaFunctions
 
@@ -35,40 +37,108 @@ from main.models import File, UnitVariable
 
 LOGGER = logging.getLogger('archivematica.mcp.server')
 
+# A directory whose listing was cached less than this many seconds after it
+# was last modified is listed again, in case it changed within the same tick
+# of a coarse filesystem clock.
+MTIME_RESOLUTION = 1
+
+
 class unit:
     """A class to inherit from, to over-ride methods, defininging a processing object at the Job level"""
+    # Listing of each directory under the unit as of its last reload, by path:
+    # (mtime, time listed, file names, names of subdirectories to descend into)
+    directoryCache = None
+    directoryCacheRoot = None
+
     def __init__(self, currentPath, UUID):
         self.currentPath = currentPath.__str__()
         self.UUID = UUID
 
+    def listFiles(self, currentPath):
+        """
+        Returns the paths, relative to pathString, of every file under
+        currentPath, like os.walk would find them.
+
+        Directories whose mtime hasn't changed since the previous call are not
+        listed again; their cached listing is used and only their
+        subdirectories are checked.
+        """
+        if self.directoryCacheRoot != currentPath:
+            self.directoryCache = {}
+            self.directoryCacheRoot = currentPath
+        cache = self.directoryCache
+        newCache = {}
+        paths = []
+        stack = [currentPath]
+        while stack:
+            directory = stack.pop()
+            try:
+                mtime = os.stat(directory).st_mtime
+            except OSError:
+                continue
+            cached = cache.get(directory)
+            if cached is not None and cached[0] == mtime and mtime < cached[1] - MTIME_RESOLUTION:
+                entry = cached
+            else:
+                listed = time.time()
+                try:
+                    names = os.listdir(directory)
+                except OSError:
+                    continue
+                files, subDirectories = [], []
+                for name in names:
+                    path = os.path.join(directory, name)
+                    try:
+                        mode = os.lstat(path).st_mode
+                    except OSError:
+                        continue
+                    if stat.S_ISDIR(mode):
+                        subDirectories.append(name)
+                    # os.walk lists symlinks to directories as directories,
+                    # but doesn't follow them
+                    elif not (stat.S_ISLNK(mode) and os.path.isdir(path)):
+                        files.append(name)
+                entry = (mtime, listed, files, subDirectories)
+            newCache[directory] = entry
+
+            if directory == currentPath:
+                prefix = self.pathString
+            else:
+                prefix = os.path.join(self.pathString + directory[len(currentPath):], "")
+            paths.extend(prefix + name for name in entry[2])
+            stack.extend(os.path.join(directory, name) for name in entry[3])
+        self.directoryCache = newCache
+        return paths
+
     def reloadFileList(self):
         """Match files to their UUID's via their location and the File table's currentLocation"""
-        self.fileList = {}
         # currentPath must be a string to return all filenames as bytestrings,
         # and to safely concatenate with other bytestrings
         currentPath = os.path.join(self.currentPath.replace("%sharedPath%", archivematicaMCP.config.get('MCPServer', "sharedDirectory"), 1), "").encode('utf-8')
         try:
-            for directory, subDirectories, files in os.walk(currentPath):
-                directory = directory.replace(currentPath, self.pathString, 1)
-                for file_ in files:
-                    if self.pathString != directory:
-                        filePath = os.path.join(directory, file_)
-                    else:
-                        filePath = directory + file_
-                    self.fileList[filePath] = unitFile(filePath, owningUnit=self)
-
             if self.unitType == "Transfer":
                 files = File.objects.filter(transfer_id=self.UUID)
             else:
                 files = File.objects.filter(sip_id=self.UUID)
-            for f in files:
-                currentlocation = archivematicaFunctions.unicodeToStr(f.currentlocation)
-                if currentlocation in self.fileList:
-                    self.fileList[currentlocation].UUID = f.uuid
-                    self.fileList[currentlocation].fileGrpUse = f.filegrpuse
-                else:
-                    LOGGER.warning('%s %s has file (%s) %s in the database, but file does not exist in the file system',
-                        self.unitType, self.UUID, f.uuid, f.currentlocation)
+            dbFiles = {}
+            for currentlocation, fileUUID, fileGrpUse in files.values_list('currentlocation', 'uuid', 'filegrpuse'):
+                dbFiles[archivematicaFunctions.unicodeToStr(currentlocation)] = (fileUUID, fileGrpUse)
+
+            # unitFiles are shared with links still using the previous list,
+            # so unchanged ones are reused and changed ones replaced, never modified
+            oldFileList = getattr(self, 'fileList', {})
+            fileList = {}
+            for filePath in self.listFiles(currentPath):
+                fileUUID, fileGrpUse = dbFiles.pop(filePath, ("None", 'None'))
+                fileUnit = oldFileList.get(filePath)
+                if fileUnit is None or fileUnit.UUID != fileUUID or fileUnit.fileGrpUse != fileGrpUse:
+                    fileUnit = unitFile(filePath, UUID=fileUUID, owningUnit=self, fileGrpUse=fileGrpUse)
+                fileList[filePath] = fileUnit
+            self.fileList = fileList
+
+            for currentlocation, (fileUUID, _) in dbFiles.items():
+                LOGGER.warning('%s %s has file (%s) %s in the database, but file does not exist in the file system',
+                    self.unitType, self.UUID, fileUUID, currentlocation)
         except Exception:
             LOGGER.exception('Error reloading file list for %s', currentPath)
             exit(1)
@@ -107,6 +177,6 @@ class unit:
             var = UnitVariable.objects.get(unittype=self.unitType,
                                            unituuid=self.UUID,
                                            variable=variable)
-            return var.microservicechainlink
+            return var.microservicechainlink_id
         except UnitVariable.DoesNotExist:
             return defaultMicroServiceChainLink
@@ -31,16 +31,22 @@ LOGGER = logging.getLogger('archivematica.mcp.server')
 
 class unitFile(object):
     """For objects representing a File"""
-    def __init__(self, currentPath, UUID="None", owningUnit=None):
+    # A unit holds one of these per file, so keep them small
+    __slots__ = ('currentPath', 'UUID', 'owningUnit', 'fileGrpUse', 'pathString')
+
+    def __init__(self, currentPath, UUID="None", owningUnit=None, fileGrpUse='None'):
         self.currentPath = currentPath
         self.UUID = UUID
         self.owningUnit = owningUnit
-        self.fileGrpUse = 'None'
-        self.fileList = {currentPath: self}
+        self.fileGrpUse = fileGrpUse
         self.pathString = ""
         if owningUnit:
             self.pathString = owningUnit.pathString
 
+    @property
+    def fileList(self):
+        return {self.currentPath: self}
+
     def __str__(self):
         return 'unitFile: <UUID: {u.UUID}, path: {u.currentPath}>'.format(u=self)
 
@@ -21,12 +21,36 @@
 # @subpackage MCPServer
 # @author Joseph Perry <joseph@artefactual.com>
 # @thanks to http://timgolden.me.uk/python/win32_how_do_i/watch_directory_for_changes.html
+
+#~DOC~
+#
+# Watched directories are monitored by a single process-wide engine instead of
+# one polling thread per directory:
+#
+#  - Directories on local filesystems are watched with inotify (pyinotify), so
+#    additions and removals are reported as soon as the kernel sees them. If
+#    inotify's event queue overflows, they are rescanned for what was missed.
+#  - Directories on network filesystems (NFS, CIFS...), where inotify does not
+#    see changes made by other hosts, or all directories when pyinotify is not
+#    installed, are polled by one shared poller thread.
+#  - Every event, whatever its source, goes through one queue consumed by one
+#    dispatcher thread, which calls the callbacks registered for the directory.
+#
+# Running this module directly benchmarks the event-to-callback latency of the
+# available watch methods.
+
 import logging
 import os
+import Queue
 import time
 import threading
 import sys
 
+try:
+    import pyinotify
+except ImportError:
+    pyinotify = None
+
 sys.path.append("/usr/lib/archivematica/archivematicaCommon")
 from django_mysqlpool import auto_close_db
 from archivematicaFunctions import unicodeToStr
@@ -35,63 +59,247 @@ from utils import log_exceptions
 
 LOGGER = logging.getLogger('archivematica.mcp.server')
 
+METHOD_AUTO = 'auto'
+METHOD_INOTIFY = 'inotify'
+METHOD_POLL = 'poll'
+
+# Filesystem types on which inotify can't be trusted to report changes
+NETWORK_FILESYSTEMS = ('nfs', 'nfs4', 'cifs', 'smbfs', 'smb3', 'ncpfs',
+                       'afs', 'glusterfs', 'ceph', 'fuse.sshfs')
+
+
+def filesystem_type(path):
+    """Return the type of the filesystem holding path, as listed in /proc/mounts, or None if unknown."""
+    path = os.path.realpath(path)
+    best_mount, best_type = '', None
+    try:
+        with open('/proc/mounts') as mounts:
+            for line in mounts:
+                fields = line.split()
+                if len(fields) < 3:
+                    continue
+                # Mount points with spaces are octal-escaped in /proc/mounts
+                mount_point = fields[1].decode('string_escape')
+                if path == mount_point or path.startswith(mount_point.rstrip('/') + '/'):
+                    if len(mount_point) > len(best_mount):
+                        best_mount, best_type = mount_point, fields[2]
+    except IOError:
+        return None
+    return best_type
+
+
+def resolve_method(directory, method=METHOD_AUTO):
+    """
+    Choose how directory will be watched.
+
+    'auto' uses inotify unless pyinotify is unavailable or the directory is on
+    a network filesystem, in which case polling is used. Asking explicitly for
+    inotify when pyinotify isn't installed also falls back to polling.
+    """
+    if method == METHOD_POLL:
+        return METHOD_POLL
+    if pyinotify is None:
+        if method == METHOD_INOTIFY:
+            LOGGER.warning('pyinotify is not installed; polling %s instead', directory)
+        return METHOD_POLL
+    if method == METHOD_AUTO and filesystem_type(directory) in NETWORK_FILESYSTEMS:
+        LOGGER.info('%s is on a network filesystem; polling it instead of using inotify', directory)
+        return METHOD_POLL
+    return METHOD_INOTIFY
+
+
+class WatchDirectoryEngine(object):
+    """
+    Process-wide owner of the inotify notifier, the shared poller and the event
+    dispatcher. Watchers register with it; nothing is started until the first
+    watcher is added.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.events = Queue.Queue()
+        self.inotify_watchers = {}
+        self.polled_watchers = []
+        self.watch_manager = None
+        self.notifier = None
+        self.poller = None
+        self.dispatcher = None
+        self.poll_interval = None
+
+    def add(self, watcher, method):
+        with self.lock:
+            if self.dispatcher is None:
+                self.dispatcher = threading.Thread(target=self.dispatch, name='watchDirectoryDispatcher')
+                self.dispatcher.daemon = True
+                self.dispatcher.start()
+            if method == METHOD_INOTIFY:
+                self._add_inotify(watcher)
+            else:
+                self._add_polled(watcher)
+
+    def remove(self, watcher):
+        with self.lock:
+            if watcher in self.polled_watchers:
+                self.polled_watchers.remove(watcher)
+            for wd, w in self.inotify_watchers.items():
+                if w is watcher:
+                    self.watch_manager.rm_watch(wd)
+                    del self.inotify_watchers[wd]
+
+    def _add_inotify(self, watcher):
+        if self.watch_manager is None:
+            self.watch_manager = pyinotify.WatchManager()
+            self.notifier = pyinotify.ThreadedNotifier(self.watch_manager, _InotifyHandler(engine=self))
+            self.notifier.name = 'watchDirectoryInotify'
+            self.notifier.daemon = True
+            self.notifier.start()
+        mask = pyinotify.IN_CREATE | pyinotify.IN_MOVED_TO | pyinotify.IN_DELETE | pyinotify.IN_MOVED_FROM
+        # Kept up to date by the events, to resync from if the queue overflows
+        watcher.entries = set(os.listdir(watcher.directory))
+        wdd = self.watch_manager.add_watch(unicodeToStr(watcher.directory), mask, quiet=False)
+        for wd in wdd.values():
+            self.inotify_watchers[wd] = watcher
+
+    def _add_polled(self, watcher):
+        watcher.entries = set(os.listdir(watcher.directory))
+        self.polled_watchers.append(watcher)
+        if self.poll_interval is None or watcher.interval < self.poll_interval:
+            self.poll_interval = watcher.interval
+        if self.poller is None:
+            self.poller = threading.Thread(target=self.poll, name='watchDirectoryPoller')
+            self.poller.daemon = True
+            self.poller.start()
+
+    def queue_event(self, watcher, name, added):
+        path = os.path.join(unicodeToStr(watcher.directory), unicodeToStr(name))
+        self.events.put((time.time(), watcher, path, added))
+
+    def rescan(self, watcher):
+        """Diff the listing of watcher's directory against the previous one, queueing its changes."""
+        try:
+            after = set(os.listdir(watcher.directory))
+        except OSError:
+            LOGGER.warning('Unable to list watched directory %s', watcher.directory, exc_info=True)
+            return
+        added = after - watcher.entries
+        removed = watcher.entries - after
+        watcher.entries = after
+        if added:
+            LOGGER.debug('Added %s', added)
+        for name in added:
+            self.queue_event(watcher, name, True)
+        if removed:
+            LOGGER.debug('Removed %s', removed)
+        for name in removed:
+            self.queue_event(watcher, name, False)
+
+    def resync(self):
+        """Rescan every directory watched with inotify, after events may have been lost."""
+        with self.lock:
+            watchers = set(self.inotify_watchers.values())
+        for watcher in watchers:
+            self.rescan(watcher)
+
+    @log_exceptions
+    @auto_close_db
+    def poll(self):
+        """Diff the listing of every polled directory against the previous one."""
+        while True:
+            time.sleep(self.poll_interval)
+            with self.lock:
+                watchers = list(self.polled_watchers)
+            for watcher in watchers:
+                self.rescan(watcher)
+
+    @log_exceptions
+    @auto_close_db
+    def dispatch(self):
+        """Hand queued events to their watcher, one at a time, in arrival order."""
+        while True:
+            queued_at, watcher, path, added = self.events.get()
+            LOGGER.debug('Dispatching %s event for %s after %.3fs in queue',
+                         'added' if added else 'removed', path, time.time() - queued_at)
+            try:
+                if added:
+                    watcher.event(path, watcher.variablesAdded, watcher.callBackFunctionAdded)
+                else:
+                    watcher.event(path, watcher.variablesRemoved, watcher.callBackFunctionRemoved)
+            except Exception:
+                LOGGER.exception('Error handling watched directory event for %s', path)
+
+
+if pyinotify is not None:
+    class _InotifyHandler(pyinotify.ProcessEvent):
+        """Translates inotify events into queued watcher events."""
+        def my_init(self, engine):
+            self.engine = engine
+
+        def _queue(self, event, added):
+            watcher = self.engine.inotify_watchers.get(event.wd)
+            if watcher is not None:
+                if added:
+                    watcher.entries.add(event.name)
+                else:
+                    watcher.entries.discard(event.name)
+                self.engine.queue_event(watcher, event.name, added)
+
+        def process_IN_CREATE(self, event):
+            self._queue(event, True)
+
+        def process_IN_MOVED_TO(self, event):
+            self._queue(event, True)
+
+        def process_IN_DELETE(self, event):
+            self._queue(event, False)
+
+        def process_IN_MOVED_FROM(self, event):
+            self._queue(event, False)
+
+        def process_IN_Q_OVERFLOW(self, event):
+            LOGGER.error('inotify event queue overflowed; rescanning the watched directories')
+            self.engine.resync()
+
+
+ENGINE = WatchDirectoryEngine()
+
+
 class archivematicaWatchDirectory:
-    """Watches for new files/directories to process in a watched directory. Directories are defined in the WatchedDirectoriesTable.""" 
-    def __init__(self, directory, 
-                 variablesAdded=None, 
-                 callBackFunctionAdded=None, 
-                 variablesRemoved=None, 
-                 callBackFunctionRemoved=None, 
-                 alertOnDirectories=True, 
-                 alertOnFiles=True, 
-                 interval=1, 
-                 threaded=True):
+    """Watches for new files/directories to process in a watched directory. Directories are defined in the WatchedDirectoriesTable."""
+    def __init__(self, directory,
+                 variablesAdded=None,
+                 callBackFunctionAdded=None,
+                 variablesRemoved=None,
+                 callBackFunctionRemoved=None,
+                 alertOnDirectories=True,
+                 alertOnFiles=True,
+                 interval=1,
+                 threaded=True,
+                 method=METHOD_AUTO):
         self.run = False
         self.variablesAdded = variablesAdded
-        self.callBackFunctionAdded = callBackFunctionAdded 
-        self.variablesRemoved = variablesRemoved 
+        self.callBackFunctionAdded = callBackFunctionAdded
+        self.variablesRemoved = variablesRemoved
         self.callBackFunctionRemoved = callBackFunctionRemoved
         self.directory = directory
         self.alertOnDirectories = alertOnDirectories
         self.alertOnFiles = alertOnFiles
-        self.interval= interval
-        
+        self.interval = interval
+        self.entries = set()
+
         if not os.path.isdir(directory):
             os.makedirs(directory, mode=770)
-        
-        if threaded:
-            t = threading.Thread(target=self.start)
-            t.daemon = True
-            t.start()
-        else:
-            self.start()
 
-    @log_exceptions
-    @auto_close_db
+        self.method = resolve_method(directory, method)
+        self.start()
+        if not threaded:
+            # Callers asking for an unthreaded watcher expect to be blocked
+            while self.run:
+                time.sleep(self.interval)
+
     def start(self):
-        """Based on polling example: http://timgolden.me.uk/python/win32_how_do_i/watch_directory_for_changes.html"""
         self.run = True
-        LOGGER.info('Watching directory %s (Files: %s)', self.directory, self.alertOnFiles)
-        before = dict ([(f, None) for f in os.listdir (self.directory)])
-        while self.run:
-            time.sleep (self.interval)
-            after = dict ([(f, None) for f in os.listdir (self.directory)])
-            added = [f for f in after if not f in before]
-            removed = [f for f in before if not f in after]
-            if added: 
-                LOGGER.debug('Added %s', added)
-                for i in added:
-                    i = unicodeToStr(i)
-                    directory = unicodeToStr(self.directory)
-                    self.event(os.path.join(directory, i), self.variablesAdded, self.callBackFunctionAdded)
-            if removed:
-                LOGGER.debug('Removed %s', removed)
-                for i in removed:
-                    i = unicodeToStr(i)
-                    directory = unicodeToStr(self.directory)
-                    self.event(os.path.join(directory, i), self.variablesRemoved, self.callBackFunctionRemoved)
-            before = after
-    
+        LOGGER.info('Watching directory %s (Files: %s, method: %s)', self.directory, self.alertOnFiles, self.method)
+        ENGINE.add(self, self.method)
+
     def event(self, path, variables, function):
         if not function:
             return
@@ -99,6 +307,48 @@ class archivematicaWatchDirectory:
             function(path, variables)
         if os.path.isfile(path) and self.alertOnFiles:
             function(path, variables)
-    
+
     def stop(self):
         self.run = False
+        ENGINE.remove(self)
+
+
+def benchmark(count=500, methods=(METHOD_INOTIFY, METHOD_POLL), interval=1):
+    """
+    Measure the latency between an entry appearing in a watched directory and
+    its added callback being called, for each watch method. Returns a dict of
+    method: (mean, max) latency in seconds.
+    """
+    import shutil
+    import tempfile
+
+    results = {}
+    for method in methods:
+        directory = tempfile.mkdtemp()
+        created = {}
+        latencies = []
+        done = threading.Event()
+
+        def callback(path, variables):
+            latencies.append(time.time() - created[os.path.basename(path)])
+            if len(latencies) == count:
+                done.set()
+
+        watcher = archivematicaWatchDirectory(directory, callBackFunctionAdded=callback,
+                                              interval=interval, method=method)
+        for i in range(count):
+            name = 'unit-%d' % i
+            created[name] = time.time()
+            os.mkdir(os.path.join(directory, name))
+        done.wait(count + interval * 10)
+        watcher.stop()
+        shutil.rmtree(directory)
+        if latencies:
+            results[watcher.method] = (sum(latencies) / len(latencies), max(latencies))
+    return results
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    for method, (mean, maximum) in sorted(benchmark().items()):
+        print('%-8s mean %.4fs max %.4fs' % (method, mean, maximum))
@@ -0,0 +1,218 @@
+#!/usr/bin/env python2
+
+# This file is part of Archivematica.
+#
+# Copyright 2010-2013 Artefactual Systems Inc. <http://artefactual.com>
+#
+# Archivematica is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Archivematica is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Archivematica.  If not, see <http://www.gnu.org/licenses/>.
+
+# @package Archivematica
+# @subpackage MCPServer
+
+#~DOC~
+#
+# In-memory copy of the workflow graph: chains, links, exit codes, task
+# configs, task types, standard task configs and chain choices.
+#
+# The workflow tables only change on upgrade or when an administrator edits a
+# setting stored in them from the dashboard, so the whole graph is read with a
+# handful of queries when the MCP server starts, and jobChain, jobChainLink and
+# the link task managers look links up here instead of in the database.
+# A loaded graph is never modified. When the dashboard saves or deletes a
+# workflow row it asks the MCP server to reload (see the reloadWorkflow RPC);
+# the next lookup builds a new graph, while links already running keep the
+# objects they were given.
+#
+# Running this module directly compares the number of queries needed to set up
+# and finish a link with and without the graph.
+
+import collections
+import logging
+import os
+import sys
+import threading
+
+sys.path.append("/usr/share/archivematica/dashboard")
+if __name__ == '__main__':
+    import django
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'settings.common')
+    django.setup()
+from main.models import (MicroServiceChain, MicroServiceChainChoice, MicroServiceChainLink,
+    MicroServiceChainLinkExitCode, StandardTaskConfig, TaskConfig, TaskType)
+
+LOGGER = logging.getLogger('archivematica.mcp.server')
+
+# Immutable records mirroring the model fields used by the MCP server
+Chain = collections.namedtuple('Chain', 'id startinglink_id description')
+TaskConfigRecord = collections.namedtuple('TaskConfigRecord', 'id tasktype_id tasktypepkreference description')
+ExitCode = collections.namedtuple('ExitCode', 'exitcode nextmicroservicechainlink_id exitmessage')
+Link = collections.namedtuple('Link', 'id currenttask_id currenttask defaultnextchainlink_id microservicegroup '
+                                      'reloadfilelist defaultexitmessage')
+StandardTask = collections.namedtuple('StandardTask', 'id execute arguments filter_subdir filter_file_start '
+                                                      'filter_file_end requires_output_lock stdout_file stderr_file')
+Choice = collections.namedtuple('Choice', 'chainavailable_id description')
+
+# Stored for an exit code listed more than once for a link, which the
+# database lookups this replaces treated as no match
+AMBIGUOUS = object()
+
+
+class WorkflowGraph(object):
+    """
+    A read-only snapshot of the workflow tables. Lookups of missing rows raise
+    the model's DoesNotExist, like the queries they replace.
+    """
+    def __init__(self):
+        self.task_types = dict(TaskType.objects.values_list('id', 'description'))
+        self.task_type_ids = dict((description, pk) for pk, description in self.task_types.items())
+
+        task_configs = {}
+        for row in TaskConfig.objects.values_list('id', 'tasktype_id', 'tasktypepkreference', 'description'):
+            task_configs[row[0]] = TaskConfigRecord(*row)
+
+        self.links = {}
+        for row in MicroServiceChainLink.objects.values_list(
+                'id', 'currenttask_id', 'defaultnextchainlink_id', 'microservicegroup',
+                'reloadfilelist', 'defaultexitmessage'):
+            pk, currenttask_id = row[0], row[1]
+            self.links[pk] = Link(pk, currenttask_id, task_configs.get(currenttask_id), *row[2:])
+
+        self.exit_codes = {}
+        for link_id, exitcode, next_link_id, message in MicroServiceChainLinkExitCode.objects.values_list(
+                'microservicechainlink_id', 'exitcode', 'nextmicroservicechainlink_id', 'exitmessage'):
+            key = (link_id, exitcode)
+            if key in self.exit_codes:
+                self.exit_codes[key] = AMBIGUOUS
+            else:
+                self.exit_codes[key] = ExitCode(exitcode, next_link_id, message)
+
+        self.chains = {}
+        for row in MicroServiceChain.objects.values_list('id', 'startinglink_id', 'description'):
+            self.chains[row[0]] = Chain(*row)
+
+        self.choices = collections.defaultdict(list)
+        for link_id, chain_id in MicroServiceChainChoice.objects.values_list(
+                'choiceavailableatlink_id', 'chainavailable_id'):
+            chain = self.chains.get(chain_id)
+            self.choices[link_id].append(Choice(chain_id, chain.description if chain else None))
+        self.choices = dict((link_id, tuple(choices)) for link_id, choices in self.choices.items())
+
+        self.standard_tasks = {}
+        for row in StandardTaskConfig.objects.values_list(
+                'id', 'execute', 'arguments', 'filter_subdir', 'filter_file_start',
+                'filter_file_end', 'requires_output_lock', 'stdout_file', 'stderr_file'):
+            self.standard_tasks[row[0]] = StandardTask(*row)
+
+    def __str__(self):
+        return '%d chains, %d links, %d exit codes, %d task types, %d standard task configs' % (
+            len(self.chains), len(self.links), len(self.exit_codes), len(self.task_types), len(self.standard_tasks))
+
+    def get_chain(self, pk):
+        try:
+            return self.chains[str(pk)]
+        except KeyError:
+            raise MicroServiceChain.DoesNotExist('No MicroServiceChain %s' % pk)
+
+    def get_link(self, pk):
+        try:
+            return self.links[str(pk)]
+        except KeyError:
+            raise MicroServiceChainLink.DoesNotExist('No MicroServiceChainLink %s' % pk)
+
+    def get_exit_code(self, link_pk, exit_code):
+        """Return the ExitCode for a link and exit code, or None if there isn't exactly one."""
+        exit_code = self.exit_codes.get((str(link_pk), int(exit_code)))
+        if exit_code is AMBIGUOUS:
+            return None
+        return exit_code
+
+    def get_standard_task_config(self, pk):
+        try:
+            return self.standard_tasks[str(pk)]
+        except KeyError:
+            raise StandardTaskConfig.DoesNotExist('No StandardTaskConfig %s' % pk)
+
+    def get_choices(self, link_pk):
+        """Return the Choices of chain offered at a link."""
+        return self.choices.get(str(link_pk), ())
+
+    def get_task_type_pk(self, description):
+        try:
+            return self.task_type_ids[description]
+        except KeyError:
+            raise TaskType.DoesNotExist('No TaskType %s' % description)
+
+
+_graph = None
+_graph_lock = threading.Lock()
+
+
+def get_graph():
+    """Return the current WorkflowGraph, loading it if needed."""
+    global _graph
+    with _graph_lock:
+        if _graph is None:
+            _graph = WorkflowGraph()
+            LOGGER.info('Loaded workflow: %s', _graph)
+        return _graph
+
+
+def invalidate():
+    """Discard the current WorkflowGraph; the next get_graph() reloads it."""
+    global _graph
+    with _graph_lock:
+        _graph = None
+    LOGGER.info('Workflow invalidated')
+
+
+def benchmark(sample=500):
+    """
+    Count the queries needed to look up up to sample links, their task config
+    and the exit code used twice when they finish, using the database directly
+    and using the graph. Returns a dict of method: queries per link.
+    """
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+
+    link_ids = list(MicroServiceChainLink.objects.values_list('id', flat=True)[:sample])
+    if not link_ids:
+        return {}
+    results = {}
+
+    with CaptureQueriesContext(connection) as queries:
+        for pk in link_ids:
+            link = MicroServiceChainLink.objects.get(id=pk)
+            link.currenttask.tasktype_id
+            for _ in range(2):
+                try:
+                    MicroServiceChainLinkExitCode.objects.get(microservicechainlink_id=pk, exitcode=0)
+                except (MicroServiceChainLinkExitCode.DoesNotExist, MicroServiceChainLinkExitCode.MultipleObjectsReturned):
+                    pass
+    results['database'] = len(queries) / float(len(link_ids))
+
+    invalidate()
+    with CaptureQueriesContext(connection) as queries:
+        for pk in link_ids:
+            graph = get_graph()
+            graph.get_link(pk).currenttask.tasktype_id
+            for _ in range(2):
+                graph.get_exit_code(pk, 0)
+    results['graph'] = len(queries) / float(len(link_ids))
+    return results
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    for method, queries in sorted(benchmark().items()):
+        print('%-8s %.3f queries per link' % (method, queries))
@@ -0,0 +1,135 @@
+# -*- coding: UTF-8 -*-
+import ConfigParser
+import os
+import shutil
+import sys
+import tempfile
+import time
+import types
+
+from django.test import TestCase
+
+THIS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.abspath(os.path.join(THIS_DIR, '../lib')))
+
+# Importing the server itself starts it, so unit is given just its config
+if 'archivematicaMCP' not in sys.modules:
+    archivematicaMCP = types.ModuleType('archivematicaMCP')
+    archivematicaMCP.config = ConfigParser.SafeConfigParser()
+    archivematicaMCP.config.add_section('MCPServer')
+    archivematicaMCP.config.set('MCPServer', 'sharedDirectory', '/var/archivematica/sharedDirectory/')
+    sys.modules['archivematicaMCP'] = archivematicaMCP
+
+from main.models import File, Transfer
+
+import unit
+
+TRANSFER_UUID = 'e95ab50f-9c84-45d5-a3ca-1b0b3f58d9b6'
+
+
+class TestReloadFileList(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        for path in ('a.txt', 'objects/b.txt', 'objects/sub/c.txt', 'logs/d.log'):
+            self.write(path)
+        Transfer.objects.create(uuid=TRANSFER_UUID, currentlocation=self.directory)
+        self.file_uuids = {}
+        for path in ('objects/b.txt', 'objects/sub/c.txt'):
+            self.create_file(path, 'original')
+
+        self.unit = unit.unit(self.directory, TRANSFER_UUID)
+        self.unit.unitType = 'Transfer'
+        self.unit.pathString = '%transferDirectory%'
+
+        self.listed = []
+        listdir = os.listdir
+
+        def counting_listdir(path):
+            self.listed.append(path)
+            return listdir(path)
+
+        self.addCleanup(setattr, os, 'listdir', listdir)
+        os.listdir = counting_listdir
+
+    def write(self, path):
+        path = os.path.join(self.directory, path)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, 'w') as f:
+            f.write(path)
+
+    def create_file(self, path, use):
+        self.file_uuids[path] = str(len(self.file_uuids) + 1) * 8 + '-0000-0000-0000-000000000000'
+        File.objects.create(uuid=self.file_uuids[path], transfer_id=TRANSFER_UUID,
+                            currentlocation='%transferDirectory%' + path, filegrpuse=use)
+
+    def age_directories(self):
+        """ Makes the directories look modified long enough ago to be cached. """
+        past = time.time() - 60
+        for dirpath, _, _ in os.walk(self.directory):
+            os.utime(dirpath, (past, past))
+        # os.walk listed them too
+        del self.listed[:]
+
+    def file_list(self):
+        return dict((path[len('%transferDirectory%'):], (f.UUID, f.fileGrpUse))
+                    for path, f in self.unit.fileList.items())
+
+    def test_lists_files_like_os_walk(self):
+        os.symlink(os.path.join(self.directory, 'objects'), os.path.join(self.directory, 'link'))
+        expected = set()
+        for dirpath, _, filenames in os.walk(os.path.join(self.directory, '')):
+            expected.update(os.path.join(dirpath, name).replace(os.path.join(self.directory, ''), '%transferDirectory%', 1)
+                            for name in filenames)
+        assert set(self.unit.listFiles(os.path.join(self.directory, ''))) == expected
+
+    def test_files_are_matched_to_the_database(self):
+        self.unit.reloadFileList()
+        assert self.file_list() == {
+            'a.txt': ('None', 'None'),
+            'objects/b.txt': (self.file_uuids['objects/b.txt'], 'original'),
+            'objects/sub/c.txt': (self.file_uuids['objects/sub/c.txt'], 'original'),
+            'logs/d.log': ('None', 'None'),
+        }
+
+    def test_unchanged_tree_is_not_listed_again(self):
+        self.age_directories()
+        self.unit.reloadFileList()
+        assert len(self.listed) == 4
+        file_list = self.unit.fileList
+
+        del self.listed[:]
+        self.unit.reloadFileList()
+        assert self.listed == []
+        assert self.unit.fileList == file_list
+        # Unchanged files are the same objects
+        assert all(f is file_list[path] for path, f in self.unit.fileList.items())
+
+    def test_changes_between_reloads_are_found(self):
+        self.age_directories()
+        self.unit.reloadFileList()
+        old_file_list = self.unit.fileList
+
+        self.write('objects/sub/e.txt')
+        self.create_file('objects/sub/e.txt', 'original')
+        os.remove(os.path.join(self.directory, 'logs/d.log'))
+        File.objects.filter(uuid=self.file_uuids['objects/b.txt']).update(filegrpuse='preservation')
+        del self.listed[:]
+        self.unit.reloadFileList()
+
+        # Only the directories changed are listed again
+        assert sorted(self.listed) == [os.path.join(self.directory, 'logs'), os.path.join(self.directory, 'objects/sub')]
+        assert self.file_list() == {
+            'a.txt': ('None', 'None'),
+            'objects/b.txt': (self.file_uuids['objects/b.txt'], 'preservation'),
+            'objects/sub/c.txt': (self.file_uuids['objects/sub/c.txt'], 'original'),
+            'objects/sub/e.txt': (self.file_uuids['objects/sub/e.txt'], 'original'),
+        }
+        # Modified files are replaced, not changed, as links may still use them
+        path = '%transferDirectory%objects/b.txt'
+        assert self.unit.fileList[path] is not old_file_list[path]
+        assert old_file_list[path].fileGrpUse == 'original'
+        path = '%transferDirectory%a.txt'
+        assert self.unit.fileList[path] is old_file_list[path]
@@ -0,0 +1,60 @@
+# -*- coding: UTF-8 -*-
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+THIS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.abspath(os.path.join(THIS_DIR, '../lib')))
+
+import watchDirectory
+
+
+class Watcher(object):
+    def __init__(self, directory, entries):
+        self.directory = directory
+        self.entries = set(entries)
+
+
+class Event(object):
+    def __init__(self, wd, name):
+        self.wd = wd
+        self.name = name
+
+
+@unittest.skipIf(watchDirectory.pyinotify is None, 'pyinotify is not installed')
+class TestInotifyOverflow(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.engine = watchDirectory.WatchDirectoryEngine()
+        self.handler = watchDirectory._InotifyHandler(engine=self.engine)
+
+    def queued(self):
+        events = set()
+        while not self.engine.events.empty():
+            _, watcher, path, added = self.engine.events.get()
+            events.add((os.path.basename(path), added))
+        return events
+
+    def test_overflow_rescans_watched_directories(self):
+        for name in ('kept', 'new'):
+            os.mkdir(os.path.join(self.directory, name))
+        self.engine.inotify_watchers[1] = Watcher(self.directory, ['kept', 'gone'])
+
+        self.handler.process_IN_Q_OVERFLOW(Event(-1, None))
+
+        assert self.queued() == set([('new', True), ('gone', False)])
+        assert self.engine.inotify_watchers[1].entries == set(['kept', 'new'])
+
+    def test_events_seen_are_not_reported_again(self):
+        watcher = Watcher(self.directory, [])
+        self.engine.inotify_watchers[1] = watcher
+        os.mkdir(os.path.join(self.directory, 'unit'))
+        self.handler.process_IN_CREATE(Event(1, 'unit'))
+        assert self.queued() == set([('unit', True)])
+
+        self.handler.process_IN_Q_OVERFLOW(Event(-1, None))
+        assert self.queued() == set()
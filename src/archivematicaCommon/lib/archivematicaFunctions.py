@@ -24,6 +24,7 @@
 from __future__ import print_function
 import collections
 import hashlib
+import mmap
 import os
 import re
 import sys
@@ -49,6 +50,9 @@ MANUAL_NORMALIZATION_DIRECTORIES = [
     "objects/manualNormalization/preservation",
 ]
 
+# Bytes read at a time when computing checksums
+DEFAULT_READ_SIZE = 1024 * 1024
+
 def get_setting(setting, default=''):
     try:
         return DashboardSetting.objects.get(name=setting).value
@@ -127,7 +131,41 @@ def normalizeNonDcElementName(string):
     normalizedString = normalizedString.lower()
     return normalizedString
 
-def get_file_checksum(filename, algorithm='sha256'):
+def get_file_checksums(filename, algorithms, read_size=None, use_mmap=False):
+    """
+    Compute several checksums of the specified file, reading it only once.
+
+    :param filename: The path to the file we want to check
+    :param algorithms: Which algorithms to use for hashing, e.g. ['md5', 'sha256']
+    :param read_size: Bytes hashed at a time, DEFAULT_READ_SIZE by default.
+        Larger reads are faster on big files and network storage.
+    :param use_mmap: Hash a memory map of the file instead of reading it.
+    :return: Returns a dict of checksum strings by algorithm.
+    """
+    hashes = [(algorithm, hashlib.new(algorithm)) for algorithm in set(algorithms)]
+    if read_size is None:
+        read_size = DEFAULT_READ_SIZE
+
+    with open(filename, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size if use_mmap else 0
+        if size:
+            m = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                for offset in xrange(0, size, read_size):
+                    chunk = buffer(m, offset, read_size)
+                    for _, h in hashes:
+                        h.update(chunk)
+            finally:
+                m.close()
+        else:
+            for chunk in iter(lambda: f.read(read_size), b''):
+                for _, h in hashes:
+                    h.update(chunk)
+
+    return {algorithm: h.hexdigest() for algorithm, h in hashes}
+
+
+def get_file_checksum(filename, algorithm='sha256', read_size=None, use_mmap=False):
     """
     Perform a checksum on the specified file.
 
@@ -136,15 +174,11 @@ def get_file_checksum(filename, algorithm='sha256'):
 
     :param filename: The path to the file we want to check
     :param algorithm: Which algorithm to use for hashing, e.g. 'md5'
+    :param read_size: Bytes hashed at a time; see get_file_checksums.
+    :param use_mmap: Hash a memory map of the file instead of reading it.
     :return: Returns a checksum string for the specified file.
     """
-    h = hashlib.new(algorithm)
-
-    with open(filename, 'rb') as f:
-        for chunk in iter(lambda: f.read(1024 * h.block_size), b''):
-            h.update(chunk)
-
-    return h.hexdigest()
+    return get_file_checksums(filename, [algorithm], read_size=read_size, use_mmap=use_mmap)[algorithm]
 
 def find_metadata_files(sip_path, filename, only_transfers=False):
     """
@@ -0,0 +1,213 @@
+#!/usr/bin/env python2
+
+# This file is part of Archivematica.
+#
+# Copyright 2010-2013 Artefactual Systems Inc. <http://artefactual.com>
+#
+# Archivematica is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Archivematica is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Archivematica.  If not, see <http://www.gnu.org/licenses/>.
+
+# @package Archivematica
+# @subpackage archivematicaCommon
+
+"""
+Cache of characterization output by file contents.
+
+Output is stored zlib compressed in the CharacterizationCache table, keyed by
+the checksum and lower-cased extension of the file, the FPR rule and the
+version of its tool, so a file identical to one characterized before, in a
+reingested AIP or another transfer, needn't be characterized again. Tools
+such as FITS take the extension into account as well as the contents, so it
+is part of the key. When the cache grows beyond its
+maximum size, the least recently used entries are evicted.
+
+Output is XML which often describes the file it was made from, as FITS's,
+ExifTool's and MediaInfo's do. The text of elements naming the file, its directory or its
+times is stored as placeholders, and filled in from the file the output is
+reused for; its full path is replaced wherever else it appears.
+"""
+
+from __future__ import absolute_import
+import datetime
+import logging
+import os
+import sys
+import time
+import zlib
+
+from lxml import etree
+
+sys.path.append("/usr/share/archivematica/dashboard")
+from django.db import IntegrityError, transaction
+from django.db.models import Sum
+from django.utils import timezone
+from main.models import CharacterizationCache
+
+from env_configparser import CLIENT_CONFIG_PATH, read_client_config
+
+LOGGER = logging.getLogger('archivematica.common')
+
+# Bytes of compressed output
+DEFAULT_MAX_SIZE = 1024 * 1024 * 1024
+# The cache's size is checked after every EVICTION_INTERVAL entries added
+EVICTION_INTERVAL = 100
+# Eviction makes room for more entries than the one added, so that it isn't
+# needed again straight away
+LOW_WATER_MARK = 0.9
+DELETE_BATCH_SIZE = 500
+# Longest extension, lower cased, which is cached
+EXTENSION_MAX_LENGTH = 32
+
+PATH_PLACEHOLDER = '%fileFullName%'
+# Values of the file which are named by elements of these (lower cased, local)
+# names, from its path and its os.stat result
+FILE_ELEMENTS = {
+    'filepath': lambda path, stat: path,
+    'filename': lambda path, stat: os.path.basename(path),
+    'directory': lambda path, stat: os.path.dirname(path),
+    # MediaInfo's
+    'file_name': lambda path, stat: os.path.splitext(os.path.basename(path))[0],
+    'file_extension': lambda path, stat: os.path.splitext(path)[1][1:],
+    'file_name_extension': lambda path, stat: os.path.basename(path),
+    'folder_name': lambda path, stat: os.path.dirname(path),
+    'fslastmodified': lambda path, stat: str(int(stat().st_mtime * 1000)),
+    'filemodifydate': lambda path, stat: _exiftool_date(stat().st_mtime),
+    'fileaccessdate': lambda path, stat: _exiftool_date(stat().st_atime),
+    'fileinodechangedate': lambda path, stat: _exiftool_date(stat().st_ctime),
+}
+
+
+def max_size_from_client_config(config_path=CLIENT_CONFIG_PATH):
+    """Returns the MCP client's characterizationCacheSize; 0 disables the cache."""
+    config = read_client_config({'characterizationCacheSize': str(DEFAULT_MAX_SIZE)}, config_path)
+    return config.getint('MCPClient', 'characterizationCacheSize')
+
+
+def _extension(file_path):
+    """ Returns the lower-cased extension of file_path, or None if it is too long to cache. """
+    extension = _unicode(os.path.splitext(file_path)[1]).lower()
+    if len(extension) <= EXTENSION_MAX_LENGTH:
+        return extension
+    return None
+
+
+def _exiftool_date(timestamp):
+    """ Formats timestamp as ExifTool does, e.g. 2016:05:30 12:00:00-04:00. """
+    offset = datetime.datetime.fromtimestamp(int(timestamp)) - datetime.datetime.utcfromtimestamp(int(timestamp))
+    minutes = int(offset.total_seconds()) // 60
+    return '{}{}{:02d}:{:02d}'.format(time.strftime('%Y:%m:%d %H:%M:%S', time.localtime(timestamp)),
+                                      '-' if minutes < 0 else '+', abs(minutes) // 60, abs(minutes) % 60)
+
+
+def _file_elements(root):
+    """ Yields the elements under root naming a value of the file, with its name. """
+    for element in root.iter(tag=etree.Element):
+        name = etree.QName(element).localname.lower()
+        if name in FILE_ELEMENTS and element.text and not len(element):
+            yield element, name
+
+
+def _replace(root, old, new):
+    """ Replaces old with new in the text and attributes of every element under root. """
+    for element in root.iter(tag=etree.Element):
+        if element.text and old in element.text:
+            element.text = element.text.replace(old, new)
+        if element.tail and old in element.tail:
+            element.tail = element.tail.replace(old, new)
+        for name, value in element.attrib.items():
+            if old in value:
+                element.set(name, value.replace(old, new))
+
+
+def _unicode(value):
+    return value if isinstance(value, unicode) else value.decode('utf-8')
+
+
+def _generalize(output, file_path):
+    root = etree.fromstring(output)
+    for element, name in _file_elements(root):
+        element.text = '%' + name + '%'
+    _replace(root, _unicode(file_path), PATH_PLACEHOLDER)
+    return etree.tostring(root)
+
+
+def _specialize(output, file_path):
+    root = etree.fromstring(output)
+    stat = []
+
+    def stat_file():
+        if not stat:
+            stat.append(os.stat(file_path))
+        return stat[0]
+
+    for element, name in _file_elements(root):
+        if element.text == '%' + name + '%':
+            element.text = _unicode(FILE_ELEMENTS[name](file_path, stat_file))
+    _replace(root, PATH_PLACEHOLDER, _unicode(file_path))
+    return etree.tostring(root)
+
+
+def get(checksum_type, checksum, rule_uuid, tool_version, file_path):
+    """Returns the cached output for the file at file_path, or None if there is none."""
+    extension = _extension(file_path)
+    if extension is None:
+        return None
+    entries = CharacterizationCache.objects.filter(
+        checksum_type=checksum_type, checksum=checksum, extension=extension,
+        rule_uuid=rule_uuid, tool_version=tool_version)
+    for pk, content in entries.values_list('pk', 'content'):
+        try:
+            output = _specialize(zlib.decompress(content), file_path)
+        except (etree.XMLSyntaxError, OSError):
+            LOGGER.warning('Unable to reuse cached output for %s', file_path, exc_info=True)
+            return None
+        CharacterizationCache.objects.filter(pk=pk).update(last_used=timezone.now())
+        return output
+    return None
+
+
+def put(checksum_type, checksum, rule_uuid, tool_version, file_path, output, max_size=DEFAULT_MAX_SIZE):
+    """Caches output, which must be XML, for the file at file_path, evicting
+    old entries if the cache has grown beyond max_size bytes."""
+    extension = _extension(file_path)
+    if extension is None:
+        return
+    content = zlib.compress(_generalize(output, file_path))
+    try:
+        with transaction.atomic():
+            entry = CharacterizationCache.objects.create(
+                checksum_type=checksum_type, checksum=checksum, extension=extension,
+                rule_uuid=rule_uuid, tool_version=tool_version,
+                content=content, size=len(content), last_used=timezone.now())
+    except IntegrityError:
+        # An identical file was characterized at the same time
+        return
+    if entry.pk % EVICTION_INTERVAL == 0:
+        evict(max_size)
+
+
+def evict(max_size):
+    """Removes the least recently used entries if the cache is larger than max_size bytes."""
+    size = CharacterizationCache.objects.aggregate(size=Sum('size'))['size'] or 0
+    if size <= max_size:
+        return
+    target = max_size * LOW_WATER_MARK
+    pks = []
+    for pk, entry_size in CharacterizationCache.objects.order_by('last_used').values_list('pk', 'size').iterator():
+        if size <= target:
+            break
+        pks.append(pk)
+        size -= entry_size
+    for start in range(0, len(pks), DELETE_BATCH_SIZE):
+        CharacterizationCache.objects.filter(pk__in=pks[start:start + DELETE_BATCH_SIZE]).delete()
+    LOGGER.info('Evicted %d entries from the characterization cache', len(pks))
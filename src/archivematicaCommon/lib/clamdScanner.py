@@ -0,0 +1,221 @@
+#!/usr/bin/env python2
+
+# This file is part of Archivematica.
+#
+# Copyright 2010-2013 Artefactual Systems Inc. <http://artefactual.com>
+#
+# Archivematica is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Archivematica is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Archivematica.  If not, see <http://www.gnu.org/licenses/>.
+
+# @package Archivematica
+# @subpackage archivematicaCommon
+
+"""
+Virus scanning of many files by talking to clamd over its socket.
+
+Files are streamed to clamd with INSTREAM, as clamdscan - does, but over a pool
+of connections kept open in IDSESSION mode instead of a new clamdscan process
+for each file, and by several threads at once.
+"""
+
+from __future__ import print_function
+import collections
+import logging
+from multiprocessing.pool import ThreadPool
+import Queue
+import socket
+import struct
+import threading
+
+from env_configparser import CLIENT_CONFIG_PATH, read_client_config
+
+LOGGER = logging.getLogger('archivematica.common')
+
+DEFAULT_ADDRESS = '/var/run/clamav/clamd.ctl'
+DEFAULT_WORKERS = 4
+# Seconds to wait for clamd, which may be scanning a large file
+DEFAULT_TIMEOUT = 600
+# Bytes sent in each INSTREAM chunk
+CHUNK_SIZE = 1024 * 1024
+
+# virus is the name of the virus found, if any; error is why the file couldn't
+# be scanned, if it couldn't
+ScanResult = collections.namedtuple('ScanResult', 'key path virus error')
+
+
+class ClamdError(Exception):
+    pass
+
+
+def result_passed(result):
+    return result.virus is None and result.error is None
+
+
+def _connect(address, timeout):
+    """Connect to address, the path of a Unix socket or "host:port"."""
+    if '/' in address:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        target = address
+    else:
+        host, port = address.rsplit(':', 1)
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        target = (host, int(port))
+    sock.settimeout(timeout)
+    try:
+        sock.connect(target)
+    except socket.error:
+        sock.close()
+        raise
+    return sock
+
+
+class ClamdConnection(object):
+    """A connection to clamd in a session, in which it accepts any number of commands."""
+    def __init__(self, address, timeout=DEFAULT_TIMEOUT):
+        self.socket = _connect(address, timeout)
+        self._buffer = ''
+        self.socket.sendall('zIDSESSION\0')
+
+    def _reply(self):
+        while '\0' not in self._buffer:
+            data = self.socket.recv(4096)
+            if not data:
+                raise ClamdError('clamd closed the connection')
+            self._buffer += data
+        reply, self._buffer = self._buffer.split('\0', 1)
+        # Replies in a session start with the number of the command, "1: "
+        return reply.partition(': ')[2]
+
+    def version(self):
+        """Returns clamd's version string, e.g. "ClamAV 0.99.2/22345/Tue Oct 18 09:55:11 2016"."""
+        self.socket.sendall('zVERSION\0')
+        return self._reply()
+
+    def instream(self, f, chunk_size=CHUNK_SIZE):
+        """Scan the contents of the file object f, returning clamd's reply, e.g. "stream: OK"."""
+        self.socket.sendall('zINSTREAM\0')
+        try:
+            while True:
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    break
+                self.socket.sendall(struct.pack('!L', len(chunk)) + chunk)
+            self.socket.sendall(struct.pack('!L', 0))
+        except socket.error:
+            # clamd stops reading, and replies, when the stream is too long
+            return self._reply()
+        return self._reply()
+
+    def close(self):
+        try:
+            self.socket.sendall('zEND\0')
+        except socket.error:
+            pass
+        self.socket.close()
+
+
+def parse_reply(reply):
+    """Returns the virus found and the error in an INSTREAM reply; both are None if the file is clean."""
+    if reply.endswith(' FOUND'):
+        return reply[len('stream: '):-len(' FOUND')], None
+    if reply == 'stream: OK':
+        return None, None
+    return None, reply
+
+
+class ClamdScanner(object):
+    def __init__(self, address=DEFAULT_ADDRESS, workers=DEFAULT_WORKERS, timeout=DEFAULT_TIMEOUT,
+                 chunk_size=CHUNK_SIZE):
+        self.address = address
+        self.workers = workers
+        self.timeout = timeout
+        self.chunk_size = chunk_size
+        self._connections = Queue.Queue()
+        self._version = None
+        self._version_lock = threading.Lock()
+
+    def _connection(self):
+        """Returns an idle connection and whether it is new."""
+        try:
+            return self._connections.get_nowait(), False
+        except Queue.Empty:
+            return ClamdConnection(self.address, self.timeout), True
+
+    def _call(self, command):
+        """
+        Returns command(connection) run on a pooled connection. Connections
+        are closed after errors; an idle one may have been closed by clamd,
+        so the command is tried again on a new one.
+        """
+        while True:
+            connection, new = self._connection()
+            try:
+                ret = command(connection)
+            except (socket.error, ClamdError):
+                connection.close()
+                if new:
+                    raise
+                continue
+            self._connections.put(connection)
+            return ret
+
+    def version(self):
+        """Returns clamd's version, asking it only once."""
+        with self._version_lock:
+            if self._version is None:
+                self._version = self._call(lambda connection: connection.version())
+            return self._version
+
+    def scan_file(self, key, path):
+        try:
+            with open(path, 'rb') as f:
+                def instream(connection):
+                    f.seek(0)
+                    return connection.instream(f, self.chunk_size)
+                reply = self._call(instream)
+        except (IOError, OSError, ClamdError) as e:
+            return ScanResult(key, path, None, str(e))
+        virus, error = parse_reply(reply)
+        return ScanResult(key, path, virus, error)
+
+    def scan(self, files):
+        """
+        Scan files, an iterable of (key, path), workers files at a time.
+        Yields a ScanResult for each, in no particular order.
+        """
+        files = list(files)
+        pool = ThreadPool(max(1, min(self.workers, len(files))))
+        try:
+            for result in pool.imap_unordered(lambda args: self.scan_file(*args), files):
+                yield result
+        finally:
+            pool.terminate()
+
+    def close(self):
+        while True:
+            try:
+                self._connections.get_nowait().close()
+            except Queue.Empty:
+                return
+
+
+def from_client_config(config_path=CLIENT_CONFIG_PATH):
+    """Returns a ClamdScanner configured by the MCP client's clamav options."""
+    config = read_client_config({
+        'clamavServer': DEFAULT_ADDRESS,
+        'clamavScanWorkers': str(DEFAULT_WORKERS),
+        'clamavTimeout': str(DEFAULT_TIMEOUT),
+    }, config_path)
+    return ClamdScanner(address=config.get('MCPClient', 'clamavServer'),
+                        workers=config.getint('MCPClient', 'clamavScanWorkers'),
+                        timeout=config.getfloat('MCPClient', 'clamavTimeout'))
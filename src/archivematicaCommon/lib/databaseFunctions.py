@@ -22,21 +22,33 @@
 # @author Joseph Perry <joseph@artefactual.com>
 from __future__ import print_function
 
+import contextlib
 import logging
 import os
 import string
 import sys
+import threading
+import time
 import uuid
 
-from archivematicaFunctions import strToUnicode
+from archivematicaFunctions import strToUnicode, unicodeToStr
 
 sys.path.append("/usr/share/archivematica/dashboard")
+from django.db import transaction
 from django.db.models import Q
 from django.utils import timezone
-from main.models import Agent, Derivation, Event, File, FileID, FPCommandOutput, Job, SIP, Task, Transfer, UnitVariable
+from main.models import Agent, Derivation, Event, File, FileID, FPCommandOutput, Job, SIP, Task, Transfer, UnitStatus, UnitVariable
 
 LOGGER = logging.getLogger('archivematica.common')
 
+# Seconds the agents of a unit are cached for; see getAMAgentsForUnit
+AGENT_CACHE_TIMEOUT = 60
+AGENT_CACHE_SIZE = 100
+# (time cached, agents) by (SIP UUID, transfer UUID)
+_unit_agents = {}
+# Events being collected by bulkEvents
+_events = threading.local()
+
 def getUTCDate():
     """Returns a timezone-aware representation of the current datetime in UTC."""
     return timezone.now()
@@ -86,37 +98,74 @@ def insertIntoFiles(fileUUID, filePath, enteredSystem=None, transferUUID="", sip
 
     File.objects.create(**kwargs)
 
-def getAMAgentsForFile(fileUUID):
+def getUnitFiles(unitUUID, unitType, unitDirectory, fields=()):
     """
-    Fetches the IDs for the Archivematica agents associated with the given file.
+    Fetches the files of a unit by their current path.
+
+    :param str unitType: 'Transfer', or anything else for a SIP.
+    :param str unitDirectory: The unit's directory, which the paths start with.
+    :param fields: Names of other File fields to fetch.
+    :returns: A dict of tuples of each file's UUID and fields, by its path as a byte string. Files with no location are left out.
+    """
+    if unitType == 'Transfer':
+        unitFilter = {'transfer_id': unitUUID}
+        pathString = '%transferDirectory%'
+    else:
+        unitFilter = {'sip_id': unitUUID}
+        pathString = '%SIPDirectory%'
+    unitDirectory = unicodeToStr(os.path.join(unitDirectory, ''))
+
+    files = {}
+    for row in File.objects.filter(**unitFilter).values_list('uuid', 'currentlocation', *fields):
+        if row[1] is None:
+            continue
+        files[unicodeToStr(row[1]).replace(pathString, unitDirectory, 1)] = (row[0],) + tuple(row[2:])
+    return files
+
+def getUnitFilesWithEvent(unitUUID, unitType, eventType):
+    """
+    :param str unitType: 'Transfer', or anything else for a SIP.
+    :returns: A set of the UUIDs of the unit's files with an event of eventType.
+    """
+    if unitType == 'Transfer':
+        files = File.objects.filter(transfer_id=unitUUID)
+    else:
+        files = File.objects.filter(sip_id=unitUUID)
+    return set(Event.objects.filter(event_type=eventType, file_uuid__in=files).values_list('file_uuid_id', flat=True))
+
+def getAMAgentsForUnit(sipUUID=None, transferUUID=None):
+    """
+    Fetches the IDs for the Archivematica agents associated with files in the
+    given SIP, or transfer, or both.
 
     The current user may be an Agent.
-    The current user's agent ID is stored in a UnitVariable with the name "activeAgent", associated with either the SIP or the transfer containing the file.
-    This function will attempt to fetch the unit variable from a SIP first,
+    The current user's agent ID is stored in a UnitVariable with the name "activeAgent", associated with either the SIP or the transfer.
+    This function will attempt to fetch the unit variable from the SIP first,
     then the transfer.
 
+    Agents are cached for AGENT_CACHE_TIMEOUT seconds, as every file of a
+    unit has the same ones.
+
     :returns: A list of Agent IDs
     """
-    agents = []
-
-    try:
-        f = File.objects.get(uuid=fileUUID)
-    except File.DoesNotExist:
-        LOGGER.warning('File with UUID %s does not exist in database; unable to fetch Agents', fileUUID)
-        return []
+    key = (sipUUID, transferUUID)
+    cached = _unit_agents.get(key)
+    if cached is not None and time.time() - cached[0] < AGENT_CACHE_TIMEOUT:
+        return list(cached[1])
 
+    agents = []
     # Fetch Agent for the User
-    if f.sip:
+    if sipUUID:
         try:
-            var = UnitVariable.objects.get(unittype='SIP', unituuid=f.sip_id,
+            var = UnitVariable.objects.get(unittype='SIP', unituuid=sipUUID,
                                            variable='activeAgent')
             agents.append(int(var.variablevalue))
         except UnitVariable.DoesNotExist:
             pass
-    if f.transfer and not agents: # agent hasn't been found yet
+    if transferUUID and not agents: # agent hasn't been found yet
         try:
             var = UnitVariable.objects.get(unittype='Transfer',
-                                           unituuid=f.transfer_id,
+                                           unituuid=transferUUID,
                                            variable='activeAgent')
             agents.append(int(var.variablevalue))
         except UnitVariable.DoesNotExist:
@@ -124,12 +173,61 @@ def getAMAgentsForFile(fileUUID):
     # Fetch other Archivematica Agents
     am_agents = Agent.objects.filter(Q(identifiertype='repository code') | Q(identifiertype='preservation system')).values_list('pk', flat=True)
     agents.extend(am_agents)
+
+    if len(_unit_agents) >= AGENT_CACHE_SIZE:
+        _unit_agents.clear()
+    _unit_agents[key] = (time.time(), agents)
+    return list(agents)
+
+def getAMAgentsForFile(fileUUID):
+    """
+    Fetches the IDs for the Archivematica agents associated with the given file.
+
+    These are the agents of the SIP, or the transfer, containing the file;
+    see getAMAgentsForUnit.
+
+    :returns: A list of Agent IDs
+    """
+    units = File.objects.filter(uuid=fileUUID).values_list('sip_id', 'transfer_id').first()
+    if units is None:
+        LOGGER.warning('File with UUID %s does not exist in database; unable to fetch Agents', fileUUID)
+        return []
+    return getAMAgentsForUnit(*units)
+
+def getAMAgentsForFiles(fileUUIDs, batch_size=500):
+    """
+    Fetches the IDs for the Archivematica agents associated with each of the
+    given files, as getAMAgentsForFile does, with one query for each
+    batch_size files and the cached agents of their units.
+
+    :returns: A dict of lists of Agent IDs by file UUID
+    """
+    fileUUIDs = list(set(fileUUIDs))
+    agents = {}
+    for start in range(0, len(fileUUIDs), batch_size):
+        for fileUUID, sipUUID, transferUUID in File.objects.filter(uuid__in=fileUUIDs[start:start + batch_size]).values_list('uuid', 'sip_id', 'transfer_id'):
+            agents[fileUUID] = getAMAgentsForUnit(sipUUID, transferUUID)
+    for fileUUID in fileUUIDs:
+        if fileUUID not in agents:
+            LOGGER.warning('File with UUID %s does not exist in database; unable to fetch Agents', fileUUID)
+            agents[fileUUID] = []
     return agents
 
+def _addEventAgents(event_agents, batch_size=500):
+    """Relates events to agents, given a dict of lists of Agent IDs by Event primary key."""
+    EventAgent = Event.agents.through
+    EventAgent.objects.bulk_create([EventAgent(event_id=pk, agent_id=agent)
+                                    for pk, agents in event_agents.items()
+                                    for agent in set(agents)],
+                                   batch_size=batch_size)
+
 def insertIntoEvents(fileUUID, eventIdentifierUUID="", eventType="", eventDateTime=None, eventDetail="", eventOutcome="", eventOutcomeDetailNote="", agents=None):
     """
     Creates a new entry in the Events table using the supplied arguments.
 
+    Inside a bulkEvents block, the event is written with the others created
+    in the block when it ends.
+
     :param str fileUUID: The UUID of the file with which this event is associated. Must point to a valid File UUID.
     :param str eventIdentifierUUID: The UUID for the event being generated. If not provided, a new UUID will be calculated using the version 4 scheme.
     :param str eventType: Can be blank.
@@ -141,24 +239,100 @@ def insertIntoEvents(fileUUID, eventIdentifierUUID="", eventType="", eventDateTi
     """
     if eventDateTime is None:
         eventDateTime = getUTCDate()
+    if not eventIdentifierUUID:
+        eventIdentifierUUID = str(uuid.uuid4())
+
+    buffered = getattr(_events, 'buffer', None)
+    if buffered is not None:
+        buffered.append({
+            'fileUUID': fileUUID,
+            'eventIdentifierUUID': eventIdentifierUUID,
+            'eventType': eventType,
+            'eventDateTime': eventDateTime,
+            'eventDetail': eventDetail,
+            'eventOutcome': eventOutcome,
+            'eventOutcomeDetailNote': eventOutcomeDetailNote,
+            'agents': agents,
+        })
+        return
 
     # Assume the Agent is Archivematica & the current user
     if not agents:
         agents = getAMAgentsForFile(fileUUID)
-    if not eventIdentifierUUID:
-        eventIdentifierUUID = str(uuid.uuid4())
 
-    event = Event.objects.create(
-        event_id=eventIdentifierUUID,
-        file_uuid_id=fileUUID,
-        event_type=eventType,
-        event_datetime=eventDateTime,
-        event_detail=eventDetail,
-        event_outcome=eventOutcome,
-        event_outcome_detail=eventOutcomeDetailNote
-    )
-    # Splat agents list into multiple arguments
-    event.agents.add(*agents)
+    with transaction.atomic():
+        event = Event.objects.create(
+            event_id=eventIdentifierUUID,
+            file_uuid_id=fileUUID,
+            event_type=eventType,
+            event_datetime=eventDateTime,
+            event_detail=eventDetail,
+            event_outcome=eventOutcome,
+            event_outcome_detail=eventOutcomeDetailNote
+        )
+        _addEventAgents({event.pk: agents})
+
+def bulkInsertIntoEvents(events, agents=None, batch_size=500):
+    """
+    Creates many entries in the Events table with a few queries, instead of
+    several for each event as insertIntoEvents does.
+
+    :param list events: dicts of insertIntoEvents keyword arguments, one per event.
+    :param list agents: List of Agent IDs to associate with every event which doesn't have its own. If None provided, Agents are fetched for each file's unit as insertIntoEvents does.
+    :param int batch_size: Most rows created in one query.
+    """
+    now = getUTCDate()
+    rows = []
+    event_agents = {}
+    for event in events:
+        event_id = event.get('eventIdentifierUUID') or str(uuid.uuid4())
+        rows.append(Event(
+            event_id=event_id,
+            file_uuid_id=event['fileUUID'],
+            event_type=event.get('eventType', ''),
+            event_datetime=event.get('eventDateTime') or now,
+            event_detail=event.get('eventDetail', ''),
+            event_outcome=event.get('eventOutcome', ''),
+            event_outcome_detail=event.get('eventOutcomeDetailNote', ''),
+        ))
+        event_agents[event_id] = event.get('agents') or agents
+    if not rows:
+        return
+    file_agents = getAMAgentsForFiles([row.file_uuid_id for row in rows if not event_agents[row.event_id]],
+                                      batch_size=batch_size)
+
+    with transaction.atomic():
+        Event.objects.bulk_create(rows, batch_size=batch_size)
+        # bulk_create doesn't set primary keys with MySQL, so look them up
+        # for the agent relations
+        pk_agents = {}
+        for start in range(0, len(rows), batch_size):
+            batch = rows[start:start + batch_size]
+            pks = dict(Event.objects.filter(event_id__in=[row.event_id for row in batch]).values_list('event_id', 'pk'))
+            for row in batch:
+                pk_agents[pks[row.event_id]] = event_agents[row.event_id] or file_agents[row.file_uuid_id]
+        _addEventAgents(pk_agents, batch_size=batch_size)
+
+@contextlib.contextmanager
+def bulkEvents(batch_size=500):
+    """
+    Within this block, events created by insertIntoEvents in this thread are
+    written together with bulkInsertIntoEvents when the block ends, so
+    existing code writing one event at a time can write many in a few
+    queries. If the block raises, its events are discarded. Nested blocks
+    are part of the outermost one.
+    """
+    if getattr(_events, 'buffer', None) is not None:
+        yield
+        return
+    _events.buffer = []
+    try:
+        yield
+    except:
+        _events.buffer = None
+        raise
+    events, _events.buffer = _events.buffer, None
+    bulkInsertIntoEvents(events, batch_size=batch_size)
 
 def insertIntoDerivations(sourceFileUUID, derivedFileUUID, relatedEventUUID=None):
     """
@@ -203,6 +377,13 @@ def logTaskCreatedSQL(taskManager, commandReplacementDic, taskUUID, arguments):
     :param str taskUUID: The UUID to be used for this Task in the database.
     :param str arguments: The arguments to be passed to the command when it is executed, as a string. Can contain replacement variables; see ReplacementDict for supported values.
     """
+    createdTask(taskManager, commandReplacementDic, taskUUID, arguments).save(force_insert=True)
+
+def createdTask(taskManager, commandReplacementDic, taskUUID, arguments):
+    """
+    Returns an unsaved Task for the supplied data; see logTaskCreatedSQL.
+    Used by callers which insert Tasks in bulk.
+    """
     jobUUID = taskManager.jobChainLink.UUID
     fileUUID = ""
     if "%fileUUID%" in commandReplacementDic:
@@ -210,13 +391,13 @@ def logTaskCreatedSQL(taskManager, commandReplacementDic, taskUUID, arguments):
     taskexec = taskManager.execute
     fileName = os.path.basename(os.path.abspath(commandReplacementDic["%relativeLocation%"]))
 
-    Task.objects.create(taskuuid=taskUUID,
-                        job_id=jobUUID,
-                        fileuuid=fileUUID,
-                        filename=fileName,
-                        execution=taskexec,
-                        arguments=arguments,
-                        createdtime=getUTCDate())
+    return Task(taskuuid=taskUUID,
+                job_id=jobUUID,
+                fileuuid=fileUUID,
+                filename=fileName,
+                execution=taskexec,
+                arguments=arguments,
+                createdtime=getUTCDate())
 
 def logTaskCompletedSQL(task):
     """
@@ -227,20 +408,24 @@ def logTaskCompletedSQL(task):
     :param task:
     """
     print("Logging task output to db", task.UUID)
-    taskUUID = task.UUID.__str__()
-    exitCode = task.results["exitCode"].__str__()
-    stdOut = task.results["stdOut"]
-    stdError = task.results["stdError"]
-
-    task = Task.objects.get(taskuuid=taskUUID)
-    task.endtime = getUTCDate()
-    task.exitcode = exitCode
-    # ``strToUnicode`` here prevents the MCP server from crashing when, e.g.,
-    # stderr contains Latin-1-encoded chars such as \xa9, i.e., the copyright
-    # symbol, cf. #9967.
-    task.stdout = strToUnicode(stdOut, obstinate=True)
-    task.stderror = strToUnicode(stdError, obstinate=True)
-    task.save()
+    Task.objects.filter(taskuuid=task.UUID.__str__()).update(**completedTaskFields(task))
+
+def completedTaskFields(task):
+    """
+    Returns a dict of the Task fields to update for the completed task:
+    endtime, exitcode, stdout and stderror.
+
+    :param task: A completed MCPServer taskStandard.
+    """
+    return {
+        'endtime': getUTCDate(),
+        'exitcode': task.results["exitCode"].__str__(),
+        # ``strToUnicode`` here prevents the MCP server from crashing when, e.g.,
+        # stderr contains Latin-1-encoded chars such as \xa9, i.e., the copyright
+        # symbol, cf. #9967.
+        'stdout': strToUnicode(task.results["stdOut"], obstinate=True),
+        'stderror': strToUnicode(task.results["stdError"], obstinate=True),
+    }
 
 
 def logJobCreatedSQL(job):
@@ -267,6 +452,7 @@ def logJobCreatedSQL(job):
                        createdtimedec=decDate,
                        microservicechainlink_id=str(job.pk),
                        subjobof=str(job.subJobOf))
+    UnitStatus.objects.refresh(unitUUID, job.unit.__class__.__name__)
 
     # TODO -un hardcode executing exeCommand
 
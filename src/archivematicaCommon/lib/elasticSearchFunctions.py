@@ -26,6 +26,7 @@ from __future__ import absolute_import
 from __future__ import division
 import ConfigParser
 import datetime
+import itertools
 import json
 import logging
 import os
@@ -39,7 +40,7 @@ from django.db.models import Q
 from main.models import File, Transfer
 
 # archivematicaCommon
-from archivematicaFunctions import get_dashboard_uuid
+from archivematicaFunctions import get_dashboard_uuid, unicodeToStr
 import namespaces as ns
 import version
 
@@ -50,7 +51,11 @@ from elasticsearch import Elasticsearch, ImproperlyConfigured
 
 logger = logging.getLogger('archivematica.common')
 
-MAX_QUERY_SIZE = 50000  # TODO Check that this is a reasonable number
+# Hits fetched per request, and how long Elasticsearch keeps a scroll open
+# between requests, when iterating over all results of a query
+SCROLL_PAGE_SIZE = 1000
+SCROLL_TIMEOUT = '5m'
+
 MATCH_ALL_QUERY = {
     "query": {
         "match_all": {}
@@ -108,6 +113,12 @@ _es_hosts = None
 _es_client = None
 DEFAULT_TIMEOUT = 10
 
+# Most documents, and bytes of documents, sent in one _bulk request
+BULK_MAX_DOCUMENTS = 500
+BULK_MAX_BYTES = 5 * 1024 * 1024
+# Statuses of bulk items the cluster was too busy to index, which are sent again
+BULK_RETRY_STATUSES = (429, 503)
+
 
 def setup(hosts, timeout=DEFAULT_TIMEOUT):
     """
@@ -223,13 +234,10 @@ def create_indexes_if_needed(client):
         raise ElasticsearchError('The AIP index mapping is incorrect. The "aips" index should be re-created.')
 
 
-def search_all_results(client, body, index=None, doc_type=None, **query_params):
+def iter_all_results(client, body, index=None, doc_type=None, page_size=SCROLL_PAGE_SIZE, **query_params):
     """
-    Performs client.search with the size set to MAX_QUERY_SIZE.
-
-    By default search_raw returns only 10 results.  Since we usually want all
-    results, this is a wrapper that fetches MAX_QUERY_SIZE results and logs a
-    warning if more results were available.
+    Yields every hit of a search, fetching them page_size at a time with a
+    scroll, so any number of results can be processed in constant memory.
     """
     if isinstance(index, list):
         index = ','.join(index)
@@ -241,12 +249,39 @@ def search_all_results(client, body, index=None, doc_type=None, **query_params):
         body=body,
         index=index,
         doc_type=doc_type,
-        size=MAX_QUERY_SIZE,
+        scroll=SCROLL_TIMEOUT,
+        size=page_size,
         **query_params)
+    scroll_id = results.get('_scroll_id')
+    total = results['hits']['total']
+    fetched = 0
 
-    if results['hits']['total'] > MAX_QUERY_SIZE:
-        logger.warning('Number of items in backlog (%s) exceeds maximum amount fetched (%s)', results['hits']['total'], MAX_QUERY_SIZE)
-    return results
+    try:
+        while results['hits']['hits']:
+            for hit in results['hits']['hits']:
+                yield hit
+            fetched += len(results['hits']['hits'])
+            if fetched >= total:
+                break
+            results = client.scroll(scroll_id=scroll_id, scroll=SCROLL_TIMEOUT)
+            scroll_id = results.get('_scroll_id', scroll_id)
+    finally:
+        if scroll_id:
+            try:
+                client.clear_scroll(scroll_id=scroll_id)
+            except Exception:
+                logger.debug('Unable to clear scroll %s', scroll_id, exc_info=True)
+
+
+def search_all_results(client, body, index=None, doc_type=None, **query_params):
+    """
+    Performs client.search, returning all results rather than the first 10.
+
+    The hits are fetched with iter_all_results, which should be used instead
+    when results can be processed one at a time.
+    """
+    hits = list(iter_all_results(client, body, index=index, doc_type=doc_type, **query_params))
+    return {'hits': {'total': len(hits), 'hits': hits}}
 
 
 def get_type_mapping(client, index, type):
@@ -421,9 +456,14 @@ def index_aip(client, uuid, name, filePath, pathToMETS, size=None, aips_in_aic=N
             aic_identifier = dublincore.findtext('dc:identifier', namespaces=ns.NSMAP) or dublincore.findtext('dcterms:identifier', namespaces=ns.NSMAP)
         is_part_of = dublincore.findtext('dcterms:isPartOf', namespaces=ns.NSMAP)
 
-    # convert METS XML to dict
+    transfer_metadata = _extract_transfer_metadata(root)
+
+    # convert METS XML to dict. The AIP document holds the whole METS, but
+    # the tree can go before the dict is built.
     xml = ElementTree.tostring(root)
+    del tree, root, dublincore
     mets_data = rename_dict_keys_with_child_dicts(normalize_dict_values(xmltodict.parse(xml)))
+    del xml
 
     aipData = {
         'uuid': uuid,
@@ -437,7 +477,7 @@ def index_aip(client, uuid, name, filePath, pathToMETS, size=None, aips_in_aic=N
         'isPartOf': is_part_of,
         'countAIPsinAIC': aips_in_aic,
         'identifiers': identifiers,
-        'transferMetadata': _extract_transfer_metadata(root),
+        'transferMetadata': transfer_metadata,
     }
     wait_for_cluster_yellow_status(client)
     try_to_index(client, aipData, 'aips', 'aip')
@@ -460,6 +500,149 @@ def try_to_index(client, data, index, doc_type, wait_between_tries=10, max_tries
     raise
 
 
+class BulkIndexer(object):
+    """
+    Indexes documents in _bulk requests of up to max_documents documents or
+    max_bytes bytes, waiting for the cluster to be yellow or green once per
+    request. Documents the cluster rejects because it is busy are sent again,
+    up to max_tries times; any other error raises ElasticsearchError.
+
+    Use as a context manager, or call close() to index the last documents.
+    """
+    def __init__(self, client, max_documents=BULK_MAX_DOCUMENTS, max_bytes=BULK_MAX_BYTES,
+                 wait_between_tries=10, max_tries=10):
+        self.client = client
+        self.serializer = client.transport.serializer
+        self.max_documents = max_documents
+        self.max_bytes = max_bytes
+        self.wait_between_tries = wait_between_tries
+        self.max_tries = max_tries
+        self.pending = []
+        self.pending_bytes = 0
+        self.started = time.time()
+        self.indexed = 0
+        self.requests = 0
+        self.retried = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+
+    def index(self, data, index, doc_type):
+        # Serialized straight away, as callers reuse parts of data for the next document
+        action = self.serializer.dumps({'index': {'_index': index, '_type': doc_type}})
+        source = self.serializer.dumps(data)
+        self.pending.append(action + '\n' + source + '\n')
+        self.pending_bytes += len(self.pending[-1])
+        if len(self.pending) >= self.max_documents or self.pending_bytes >= self.max_bytes:
+            self.flush()
+
+    def flush(self):
+        pending, self.pending, self.pending_bytes = self.pending, [], 0
+        tries = 0
+        while pending:
+            if tries:
+                time.sleep(self.wait_between_tries)
+            tries += 1
+            wait_for_cluster_yellow_status(self.client)
+            try:
+                response = self.client.bulk(body=''.join(pending))
+            except Exception as e:
+                print("ERROR: error trying to index.")
+                print(e)
+                if tries >= self.max_tries:
+                    raise
+                continue
+            self.requests += 1
+
+            retry = []
+            errors = []
+            for document, item in zip(pending, response['items']):
+                result = item.values()[0]
+                if result.get('status') in BULK_RETRY_STATUSES:
+                    retry.append(document)
+                elif 'error' in result:
+                    errors.append(result['error'])
+                else:
+                    self.indexed += 1
+            if errors:
+                raise ElasticsearchError('Unable to index {} documents: {}'.format(len(errors), errors[0]))
+            if retry and tries >= self.max_tries:
+                raise ElasticsearchError('{} documents were still rejected after {} tries'.format(len(retry), tries))
+            self.retried += len(retry)
+            pending = retry
+
+    def close(self):
+        """Index any remaining documents and return the number indexed."""
+        self.flush()
+        return self.indexed
+
+    def report(self):
+        elapsed = time.time() - self.started
+        return 'Indexed {} documents in {:.1f} seconds ({:.1f} documents/s, {} requests, {} retried)'.format(
+            self.indexed, elapsed, self.indexed / elapsed if elapsed else 0, self.requests, self.retried)
+
+
+def _bulk_actions(client, actions, max_documents=BULK_MAX_DOCUMENTS):
+    """
+    Sends (action, source) pairs in _bulk requests of up to max_documents
+    actions. source is None for actions without one, like delete. Returns
+    the number of successful actions; failed ones are logged.
+    """
+    serializer = client.transport.serializer
+    succeeded = 0
+
+    def send(lines):
+        response = client.bulk(body=''.join(lines))
+        done = 0
+        for item in response['items']:
+            result = item.values()[0]
+            if 'error' in result:
+                logger.error('Unable to %s document %s: %s', item.keys()[0], result.get('_id'), result['error'])
+            elif result.get('found', True):
+                done += 1
+        return done
+
+    lines = []
+    count = 0
+    for action, source in actions:
+        lines.append(serializer.dumps(action) + '\n')
+        if source is not None:
+            lines.append(serializer.dumps(source) + '\n')
+        count += 1
+        if count >= max_documents:
+            succeeded += send(lines)
+            lines = []
+            count = 0
+    if count:
+        succeeded += send(lines)
+    return succeeded
+
+
+def delete_documents(client, index, doc_type, document_ids):
+    """
+    Deletes the documents with the given IDs, which may be any iterable, in
+    _bulk requests. Returns the number of documents deleted.
+    """
+    return _bulk_actions(client, (
+        ({'delete': {'_index': index, '_type': doc_type, '_id': document_id}}, None)
+        for document_id in document_ids))
+
+
+def update_documents(client, index, doc_type, document_ids, doc):
+    """
+    Applies the partial document doc to the documents with the given IDs,
+    which may be any iterable, in _bulk requests. Returns the number of
+    documents updated.
+    """
+    return _bulk_actions(client, (
+        ({'update': {'_index': index, '_type': doc_type, '_id': document_id}}, {'doc': doc})
+        for document_id in document_ids))
+
+
 def get_aip_data(client, uuid, fields=None):
     search_params = {
         'body': {
@@ -525,31 +708,87 @@ def _extract_transfer_metadata(doc):
             for el in doc.findall("mets:amdSec/mets:sourceMD/mets:mdWrap/mets:xmlData/transfer_metadata", namespaces=ns.NSMAP)]
 
 
-def index_mets_file_metadata(client, uuid, metsFilePath, index, type_, sipName, identifiers=[]):
-    # parse XML
-    tree = ElementTree.parse(metsFilePath)
-    root = tree.getroot()
+def _iter_mets_sections(metsFilePath):
+    """
+    Yields each child of the METS root element (metsHdr, dmdSec, amdSec,
+    fileSec...) as soon as it has been parsed. Each is discarded once the
+    caller is done with it, so only one is in memory at a time.
+    """
+    depth = 0
+    root = None
+    for event, elem in ElementTree.iterparse(metsFilePath, events=('start', 'end')):
+        if event == 'start':
+            if root is None:
+                root = elem
+            depth += 1
+        else:
+            depth -= 1
+            if depth == 1:
+                yield elem
+                elem.clear()
+                root.clear()
 
-    # TODO add a conditional to toggle this
-    remove_tool_output_from_mets(tree)
 
-    # get SIP-wide dmdSec
-    dmdSec = root.findall("mets:dmdSec/mets:mdWrap/mets:xmlData", namespaces=ns.NSMAP)
-    dmdSecData = {}
-    for item in dmdSec:
-        xml = ElementTree.tostring(item)
-        dmdSecData = xmltodict.parse(xml)
+def _remove_tool_output_from_amdsec(amdSec):
+    """Like remove_tool_output_from_mets, for a single amdSec."""
+    for parent in amdSec.findall("mets:techMD/mets:mdWrap/mets:xmlData/premis:object/premis:objectCharacteristics/premis:objectCharacteristicsExtension", namespaces=ns.NSMAP):
+        parent.clear()
 
-    # Extract isPartOf (for AIPs) or identifier (for AICs) from DublinCore
-    dublincore = root.find('mets:dmdSec/mets:mdWrap/mets:xmlData/dcterms:dublincore', namespaces=ns.NSMAP)
+
+def _read_mets_structure(metsFilePath):
+    """
+    First pass over a METS file for index_mets_file_metadata. Returns the
+    SIP-wide dmdSec as a dict, the AIC identifier and isPartOf from its
+    DublinCore, the transfer metadata and, for each file in the original and
+    metadata fileGrps, a tuple of its ADMID, ID and path.
+    """
+    dmdSecData = {}
+    dublincore_found = False
     aic_identifier = None
     is_part_of = None
-    if dublincore is not None:
-        aip_type = dublincore.findtext('dc:type', namespaces=ns.NSMAP) or dublincore.findtext('dcterms:type', namespaces=ns.NSMAP)
-        if aip_type == "Archival Information Collection":
-            aic_identifier = dublincore.findtext('dc:identifier', namespaces=ns.NSMAP) or dublincore.findtext('dcterms:identifier', namespaces=ns.NSMAP)
-        elif aip_type == "Archival Information Package":
-            is_part_of = dublincore.findtext('dcterms:isPartOf', namespaces=ns.NSMAP)
+    transfer_metadata = []
+    files = []
+
+    for section in _iter_mets_sections(metsFilePath):
+        if section.tag == ns.metsBNS + 'dmdSec':
+            for item in section.findall("mets:mdWrap/mets:xmlData", namespaces=ns.NSMAP):
+                xml = ElementTree.tostring(item)
+                dmdSecData = xmltodict.parse(xml)
+
+            # Extract isPartOf (for AIPs) or identifier (for AICs) from the first DublinCore
+            dublincore = section.find('mets:mdWrap/mets:xmlData/dcterms:dublincore', namespaces=ns.NSMAP)
+            if dublincore is not None and not dublincore_found:
+                dublincore_found = True
+                aip_type = dublincore.findtext('dc:type', namespaces=ns.NSMAP) or dublincore.findtext('dcterms:type', namespaces=ns.NSMAP)
+                if aip_type == "Archival Information Collection":
+                    aic_identifier = dublincore.findtext('dc:identifier', namespaces=ns.NSMAP) or dublincore.findtext('dcterms:identifier', namespaces=ns.NSMAP)
+                elif aip_type == "Archival Information Package":
+                    is_part_of = dublincore.findtext('dcterms:isPartOf', namespaces=ns.NSMAP)
+
+        elif section.tag == ns.metsBNS + 'amdSec':
+            transfer_metadata.extend(
+                xmltodict.parse(ElementTree.tostring(el))['transfer_metadata']
+                for el in section.findall("mets:sourceMD/mets:mdWrap/mets:xmlData/transfer_metadata", namespaces=ns.NSMAP))
+
+        elif section.tag == ns.metsBNS + 'fileSec':
+            # Index all files in a fileGrup with USE='original' or USE='metadata'
+            for use in ('original', 'metadata'):
+                for file_ in section.findall("mets:fileGrp[@USE='{}']/mets:file".format(use), namespaces=ns.NSMAP):
+                    filePath = file_.find('mets:FLocat', namespaces=ns.NSMAP).attrib['{http://www.w3.org/1999/xlink}href']
+                    files.append((file_.attrib.get('ADMID', None), file_.attrib['ID'], filePath))
+
+    return dmdSecData, aic_identifier, is_part_of, transfer_metadata, files
+
+
+def index_mets_file_metadata(client, uuid, metsFilePath, index, type_, sipName, identifiers=[]):
+    """
+    Indexes each original and metadata file listed in the METS file of an AIP.
+
+    The METS file is read twice, without ever being held in memory: first
+    for the SIP-wide metadata and the list of files, then for the amdSec of
+    each file, which is indexed as soon as its amdSec has been read.
+    """
+    dmdSecData, aic_identifier, is_part_of, transfer_metadata, files = _read_mets_structure(metsFilePath)
 
     # establish structure to be indexed for each file item
     fileData = {
@@ -568,57 +807,59 @@ def index_mets_file_metadata(client, uuid, metsFilePath, index, type_, sipName,
         },
         'origin': get_dashboard_uuid(),
         'identifiers': identifiers,
-        'transferMetadata': _extract_transfer_metadata(root),
+        'transferMetadata': transfer_metadata,
     }
 
-    # Index all files in a fileGrup with USE='original' or USE='metadata'
-    original_files = root.findall("mets:fileSec/mets:fileGrp[@USE='original']/mets:file", namespaces=ns.NSMAP)
-    metadata_files = root.findall("mets:fileSec/mets:fileGrp[@USE='metadata']/mets:file", namespaces=ns.NSMAP)
-    files = original_files + metadata_files
+    bulk = BulkIndexer(client)
 
-    # Index AIC METS file if it exists
-    for file_ in files:
+    def index_file(filePath, fileUUID, amdSec):
         indexData = fileData.copy() # Deep copy of dict, not of dict contents
+        indexData['METS'] = dict(fileData['METS'], amdSec=amdSec)
+        indexData['FILEUUID'] = fileUUID
+        indexData['filePath'] = filePath
+        _, fileExtension = os.path.splitext(filePath)
+        if fileExtension:
+            indexData['fileExtension'] = fileExtension[1:].lower()
+        bulk.index(indexData, index, type_)
 
-        # Get file UUID.  If and ADMID exists, look in the amdSec for the UUID,
-        # otherwise parse it out of the file ID.
-        # 'Original' files have ADMIDs, 'Metadata' files don't
-        admID = file_.attrib.get('ADMID', None)
+    # Files with an ADMID, by ADMID
+    files_by_admid = {}
+    for admID, fileID, filePath in files:
         if admID is None:
-            # Parse UUID from file ID
-            fileUUID = None
-            uuix_regex = r'\w{8}-?\w{4}-?\w{4}-?\w{4}-?\w{12}'
-            uuids = re.findall(uuix_regex, file_.attrib['ID'])
+            # 'Metadata' files don't have an ADMID; parse the UUID from the file ID.
             # Multiple UUIDs may be returned - if they are all identical, use that
             # UUID, otherwise use None.
             # To determine all UUIDs are identical, use the size of the set
+            fileUUID = None
+            uuix_regex = r'\w{8}-?\w{4}-?\w{4}-?\w{4}-?\w{12}'
+            uuids = re.findall(uuix_regex, fileID)
             if len(set(uuids)) == 1:
                 fileUUID = uuids[0]
+            index_file(filePath, fileUUID, {})
         else:
-            amdSecInfo = root.find("mets:amdSec[@ID='{}']".format(admID), namespaces=ns.NSMAP)
-            fileUUID = amdSecInfo.findtext("mets:techMD/mets:mdWrap/mets:xmlData/premis:object/premis:objectIdentifier/premis:objectIdentifierValue", namespaces=ns.NSMAP)
-
-            # Index amdSec information
-            xml = ElementTree.tostring(amdSecInfo)
-            indexData['METS']['amdSec'] = rename_dict_keys_with_child_dicts(normalize_dict_values(xmltodict.parse(xml)))
-
-        indexData['FILEUUID'] = fileUUID
-
-        # Get file path from FLocat and extension
-        filePath = file_.find('mets:FLocat', namespaces=ns.NSMAP).attrib['{http://www.w3.org/1999/xlink}href']
-        indexData['filePath'] = filePath
-        _, fileExtension = os.path.splitext(filePath)
-        if fileExtension:
-            indexData['fileExtension'] = fileExtension[1:].lower()
-
-        # index data
-        wait_for_cluster_yellow_status(client)
-        result = try_to_index(client, indexData, index, type_)
-
-        # Reset fileData['METS']['amdSec'], since it is updated in the loop
-        # above. See http://stackoverflow.com/a/3975388 for explanation
-        fileData['METS']['amdSec'] = {}
-
+            files_by_admid.setdefault(admID, []).append((fileID, filePath))
+
+    # 'Original' files: look in the amdSec for the UUID, and index the amdSec
+    if files_by_admid:
+        for section in _iter_mets_sections(metsFilePath):
+            if section.tag != ns.metsBNS + 'amdSec' or section.attrib.get('ID') not in files_by_admid:
+                continue
+            # TODO add a conditional to toggle this
+            _remove_tool_output_from_amdsec(section)
+            fileUUID = section.findtext("mets:techMD/mets:mdWrap/mets:xmlData/premis:object/premis:objectIdentifier/premis:objectIdentifierValue", namespaces=ns.NSMAP)
+            xml = ElementTree.tostring(section)
+            for fileID, filePath in files_by_admid.pop(section.attrib['ID']):
+                # Converted for each file, as normalize_dict_values changes it in place
+                amdSec = rename_dict_keys_with_child_dicts(normalize_dict_values(xmltodict.parse(xml)))
+                index_file(filePath, fileUUID, amdSec)
+
+    for admID, admid_files in files_by_admid.items():
+        logger.warning('amdSec %s not found in %s', admID, metsFilePath)
+        for fileID, filePath in admid_files:
+            index_file(filePath, None, {})
+
+    bulk.close()
+    print(bulk.report())
     print('Indexed AIP files and corresponding METS XML.')
 
     return len(files)
@@ -677,19 +918,28 @@ def normalize_list_dict_elements(data):
     return data
 
 
-def _get_file_formats(f):
-    formats = []
-    fields = ['format_version__pronom_id',
-              'format_version__description',
-              'format_version__format__group__description']
-    for puid, format, group in f.fileformatversion_set.all().values_list(*fields):
-        formats.append({
-            'puid': puid,
-            'format': format,
-            'group': group,
-        })
-
-    return formats
+def _get_transfer_files(uuid):
+    """
+    Returns a dict of the current location of each file in the Transfer
+    with UUID `uuid` to its UUID and the formats it was identified as, read in
+    one query.
+    """
+    files = {}
+    fields = ['currentlocation',
+              'uuid',
+              'fileformatversion__format_version__pronom_id',
+              'fileformatversion__format_version__description',
+              'fileformatversion__format_version__format__group__description']
+    for location, file_uuid, puid, format, group in File.objects.filter(transfer_id=uuid).values_list(*fields):
+        _, formats = files.setdefault(unicodeToStr(location), (file_uuid, []))
+        if format is not None:
+            formats.append({
+                'puid': puid,
+                'format': format,
+                'group': group,
+            })
+
+    return files
 
 
 def _list_bulk_extractor_reports(transfer_path, file_uuid):
@@ -766,18 +1016,17 @@ def index_transfer_files(client, uuid, pathToTransfer, index, type_, status=''):
     # Get dashboard UUID
     dashboard_uuid = get_dashboard_uuid()
 
+    transfer_files = _get_transfer_files(uuid)
+    bulk = BulkIndexer(client)
+
     for filepath in list_files_in_dir(pathToTransfer):
         if os.path.isfile(filepath):
             # Get file UUID
-            file_uuid = ''
             relative_path = filepath.replace(pathToTransfer, '%transferDirectory%')
-            try:
-                f = File.objects.get(currentlocation=relative_path,
-                                     transfer_id=uuid)
-                file_uuid = f.uuid
-                formats = _get_file_formats(f)
+            if unicodeToStr(relative_path) in transfer_files:
+                file_uuid, formats = transfer_files[unicodeToStr(relative_path)]
                 bulk_extractor_reports = _list_bulk_extractor_reports(pathToTransfer, file_uuid)
-            except File.DoesNotExist:
+            else:
                 file_uuid = ''
                 formats = []
                 bulk_extractor_reports = []
@@ -811,13 +1060,14 @@ def index_transfer_files(client, uuid, pathToTransfer, index, type_, status=''):
                   'format'       : formats,
                 }
 
-                wait_for_cluster_yellow_status(client)
-                try_to_index(client, indexData, index, type_)
+                bulk.index(indexData, index, type_)
 
                 files_indexed = files_indexed + 1
             else:
                 print('Skipping indexing {}'.format(relative_path))
 
+    bulk.close()
+    print(bulk.report())
     if files_indexed > 0:
         client.indices.refresh()
 
@@ -838,9 +1088,7 @@ def list_files_in_dir(path, filepaths=[]):
     return filepaths
 
 
-def _document_ids_from_field_query(client, index, doc_types, field, value):
-    document_ids = []
-
+def _iter_document_ids_from_field_query(client, index, doc_types, field, value):
     # Escape /'s with \\
     searchvalue = value.replace('/', '\\/')
     query = {
@@ -850,16 +1098,12 @@ def _document_ids_from_field_query(client, index, doc_types, field, value):
             }
         }
     }
-    documents = search_all_results(
-        client,
-        body=query,
-        doc_type=doc_types
-    )
+    for document in iter_all_results(client, body=query, doc_type=doc_types, _source='false'):
+        yield document['_id']
 
-    if len(documents['hits']['hits']) > 0:
-        document_ids = [d['_id'] for d in documents['hits']['hits']]
 
-    return document_ids
+def _document_ids_from_field_query(client, index, doc_types, field, value):
+    return list(_iter_document_ids_from_field_query(client, index, doc_types, field, value))
 
 
 def document_id_from_field_query(client, index, doc_types, field, value):
@@ -871,13 +1115,10 @@ def document_id_from_field_query(client, index, doc_types, field, value):
             }
         }
     }
-    documents = search_all_results(
-        client,
-        body=query,
-        doc_type=doc_types
-    )
-    if len(documents['hits']['hits']) == 1:
-        document_id = documents['hits']['hits'][0]['_id']
+    documents = list(itertools.islice(
+        iter_all_results(client, body=query, doc_type=doc_types, page_size=2, _source='false'), 2))
+    if len(documents) == 1:
+        document_id = documents[0]['_id']
     return document_id
 
 
@@ -988,6 +1229,28 @@ def get_transfer_file_info(client, field, value):
     return results
 
 
+def get_transfer_file_uuids(client, transfer_uuid):
+    """
+    Returns the UUIDs of the indexed files of the transfer with UUID
+    transfer_uuid, by their relative_path, in a single scroll rather than a
+    query per file. Files indexed without a UUID are left out.
+    """
+    query = {
+        'query': {
+            'term': {
+                'sipuuid': transfer_uuid
+            }
+        }
+    }
+    file_uuids = {}
+    for hit in iter_all_results(client, body=query, index='transfers', doc_type='transferfile',
+                                fields='relative_path,fileuuid'):
+        fields = hit.get('fields', {})
+        if fields.get('fileuuid', [''])[0] and 'relative_path' in fields:
+            file_uuids[fields['relative_path'][0]] = fields['fileuuid'][0]
+    return file_uuids
+
+
 def remove_backlog_transfer(client, uuid):
     return delete_matching_documents(client, 'transfers', 'transfer', 'uuid', uuid)
 
@@ -1009,10 +1272,8 @@ def remove_transfer_files(client, uuid, unit_type=None):
 
     if len(transfers) > 0:
         for transfer in transfers:
-            files = _document_ids_from_field_query(client, 'transfers', ['transferfile'], 'sipuuid', transfer)
-            if len(files) > 0:
-                for f in files:
-                    client.delete('transfers', 'transferfile', f)
+            files = _iter_document_ids_from_field_query(client, 'transfers', ['transferfile'], 'sipuuid', transfer)
+            delete_documents(client, 'transfers', 'transferfile', files)
     else:
         if not unit_type:
             unit_type = 'transfer or SIP'
@@ -1057,23 +1318,20 @@ def delete_matching_documents(client, index, doc_type, field, value):
     return results['_indices'][index]['_shards']['successful'] == results['_indices'][index]['_shards']['total']
 
 
+def update_matching_documents(client, index, doc_type, field, value, doc):
+    """
+    Applies the partial document doc to all documents in index & doc_type
+    where field = value. Returns the number of documents updated.
+    """
+    document_ids = _iter_document_ids_from_field_query(client, index, [doc_type], field, value)
+    return update_documents(client, index, doc_type, document_ids, doc)
+
+
 def update_field(client, uuid, index, doc_type, field, status):
-    document_id = document_id_from_field_query(client, index, [doc_type], 'uuid', uuid)
+    updated = update_matching_documents(client, index, doc_type, 'uuid', uuid, {field: status})
 
-    if document_id is None:
+    if not updated:
         logger.error('Unable to find document with UUID {} in index {}'.format(uuid, index))
-        return
-
-    client.update(
-        body={
-            'doc': {
-                field: status
-            }
-        },
-        index=index,
-        doc_type=doc_type,
-        id=document_id
-    )
 
 
 def mark_aip_deletion_requested(client, uuid):
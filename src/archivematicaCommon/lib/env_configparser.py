@@ -2,6 +2,21 @@ import os
 import ConfigParser
 import functools
 
+CLIENT_CONFIG_PATH = '/etc/archivematica/MCPClient/clientConfig.conf'
+
+
+def read_client_config(defaults, config_path=CLIENT_CONFIG_PATH):
+    """
+    Returns a parser of the MCP client's configuration, whose MCPClient
+    section falls back on defaults, a dict of strings by option name, even if
+    the file is missing.
+    """
+    config = ConfigParser.SafeConfigParser(defaults)
+    config.read(config_path)
+    if not config.has_section('MCPClient'):
+        config.add_section('MCPClient')
+    return config
+
 
 def fallback_option(fn):
     def wrapper(*args, **kwargs):
@@ -21,14 +21,87 @@
 # @author Joseph Perry <joseph@artefactual.com>
 
 from __future__ import print_function
+import errno
 import subprocess
 import shlex
 import uuid
 import os
 import sys
+import time
 
+# Bytes kept in memory from the start and from the end of spooled output
+DEFAULT_HEAD_SIZE = 64 * 1024
+DEFAULT_TAIL_SIZE = 64 * 1024
 
-def launchSubProcess(command, stdIn="", printing=True, arguments=[], env_updates={}):
+
+def readSpool(path, head_size=DEFAULT_HEAD_SIZE, tail_size=DEFAULT_TAIL_SIZE):
+    """
+    Returns the output spooled to ``path``. Output of up to head_size +
+    tail_size bytes is returned whole and the spool file removed; longer
+    output is returned as its head and tail around a note of how much was
+    left out and where the spool file, which is kept, can be found.
+    """
+    size = os.path.getsize(path)
+    with open(path, 'rb') as f:
+        if size <= head_size + tail_size:
+            output = f.read()
+        else:
+            head = f.read(head_size)
+            f.seek(-tail_size, os.SEEK_END)
+            tail = f.read()
+            return "%s\n[... %d bytes omitted; full output in %s ...]\n%s" % (head, size - head_size - tail_size, path, tail)
+    os.remove(path)
+    return output
+
+
+def removeOldSpools(directory, max_age):
+    """
+    Removes the spool files in ``directory`` last written more than max_age
+    seconds ago: those of long output, which readSpool keeps, and any left
+    by a process which stopped while a task ran. Returns how many were
+    removed.
+    """
+    removed = 0
+    cutoff = time.time() - max_age
+    for name in os.listdir(directory):
+        path = os.path.join(directory, name)
+        try:
+            if os.path.isfile(path) and os.path.getmtime(path) < cutoff:
+                os.remove(path)
+                removed += 1
+        except OSError:
+            # Removed meanwhile, e.g. by another client sharing the directory
+            pass
+    return removed
+
+
+def _wait(p, stdin_string):
+    """
+    Like p.communicate(stdin_string) for a process whose output goes to files,
+    but reaps it with os.wait4. Returns its resource usage.
+    """
+    if p.stdin:
+        try:
+            p.stdin.write(stdin_string)
+        except IOError as e:
+            if e.errno != errno.EPIPE:
+                raise
+        p.stdin.close()
+    while True:
+        try:
+            _, status, rusage = os.wait4(p.pid, 0)
+            break
+        except OSError as e:
+            if e.errno != errno.EINTR:
+                raise
+    if os.WIFSIGNALED(status):
+        p.returncode = -os.WTERMSIG(status)
+    else:
+        p.returncode = os.WEXITSTATUS(status)
+    return rusage
+
+
+def launchSubProcess(command, stdIn="", printing=True, arguments=[], env_updates={}, spool_path=None, head_size=DEFAULT_HEAD_SIZE, tail_size=DEFAULT_TAIL_SIZE, rusage_callback=None):
     """
     Launches a subprocess using ``command``, where ``command`` is either:
     a) a single string containing a commandline statement, or
@@ -49,6 +122,13 @@ def launchSubProcess(command, stdIn="", printing=True, arguments=[], env_updates
                 only honoured if ``command`` is an array, and will be ignored
                 if ``command`` is a string.
     env_updates: Dict of changes to apply to the started process' environment.
+    spool_path: If given, standard output and error are written to the files
+                ``spool_path``.stdout and ``spool_path``.stderr as the process
+                runs instead of being buffered in memory, and only the first
+                head_size and last tail_size bytes of each are returned; see
+                readSpool.
+    rusage_callback: If given with spool_path, called with the process'
+                resource usage (see os.wait4) once it has exited.
     """
     stdError = ""
     stdOut = ""
@@ -77,8 +157,26 @@ def launchSubProcess(command, stdIn="", printing=True, arguments=[], env_updates
         else:
             raise Exception("stdIn must be a string or a file object")
 
-        p = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, stdin=stdin_pipe, env=my_env)
-        stdOut, stdError = p.communicate(input=stdin_string)
+        if spool_path is None:
+            p = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, stdin=stdin_pipe, env=my_env)
+            stdOut, stdError = p.communicate(input=stdin_string)
+        else:
+            spool_dir = os.path.dirname(spool_path)
+            if spool_dir and not os.path.isdir(spool_dir):
+                os.makedirs(spool_dir)
+            with open(spool_path + '.stdout', 'wb') as out, open(spool_path + '.stderr', 'wb') as err:
+                try:
+                    p = subprocess.Popen(command, stdout=out, stderr=err, stdin=stdin_pipe, env=my_env)
+                except OSError:
+                    os.remove(out.name)
+                    os.remove(err.name)
+                    raise
+                if rusage_callback is None:
+                    p.communicate(input=stdin_string)
+                else:
+                    rusage_callback(_wait(p, stdin_string))
+            stdOut = readSpool(spool_path + '.stdout', head_size, tail_size)
+            stdError = readSpool(spool_path + '.stderr', head_size, tail_size)
         #append the output to stderror and stdout
         if printing:
             print(stdOut)
@@ -95,7 +193,7 @@ def launchSubProcess(command, stdIn="", printing=True, arguments=[], env_updates
     return retcode, stdOut, stdError
 
 
-def createAndRunScript(text, stdIn="", printing=True, arguments=[], env_updates={}):
+def createAndRunScript(text, stdIn="", printing=True, arguments=[], env_updates={}, **capture):
     # Output the text to a /tmp/ file
     scriptPath = "/tmp/" + uuid.uuid4().__str__()
     FILE = os.open(scriptPath, os.O_WRONLY | os.O_CREAT, 0o770)
@@ -105,7 +203,7 @@ def createAndRunScript(text, stdIn="", printing=True, arguments=[], env_updates=
     cmd.extend(arguments)
 
     # Run it
-    ret = launchSubProcess(cmd, stdIn="", printing=True, env_updates=env_updates)
+    ret = launchSubProcess(cmd, stdIn="", printing=True, env_updates=env_updates, **capture)
 
     # Remove the temp file
     os.remove(scriptPath)
@@ -113,7 +211,7 @@ def createAndRunScript(text, stdIn="", printing=True, arguments=[], env_updates=
     return ret
 
 
-def executeOrRun(type, text, stdIn="", printing=True, arguments=[], env_updates={}):
+def executeOrRun(type, text, stdIn="", printing=True, arguments=[], env_updates={}, **capture):
     """
     Attempts to run the provided command on the shell, with the text of
     "stdIn" passed as standard input if provided. The type parameter
@@ -141,14 +239,17 @@ def executeOrRun(type, text, stdIn="", printing=True, arguments=[], env_updates=
                 honoured if ``command`` is an array, and will be ignored if ``command``
                 is a string.
     env_updates: Dict of changes to apply to the started process' environment.
+
+    spool_path, head_size, tail_size and rusage_callback are passed on to
+    launchSubProcess.
     """
     if type == "command":
-        return launchSubProcess(text, stdIn=stdIn, printing=printing, arguments=arguments, env_updates=env_updates)
+        return launchSubProcess(text, stdIn=stdIn, printing=printing, arguments=arguments, env_updates=env_updates, **capture)
     if type == "bashScript":
         text = "#!/bin/bash\n" + text
-        return createAndRunScript(text, stdIn=stdIn, printing=printing, arguments=arguments, env_updates=env_updates)
+        return createAndRunScript(text, stdIn=stdIn, printing=printing, arguments=arguments, env_updates=env_updates, **capture)
     if type == "pythonScript":
         text = "#!/usr/bin/env python2\n" + text
-        return createAndRunScript(text, stdIn=stdIn, printing=printing, arguments=arguments, env_updates=env_updates)
+        return createAndRunScript(text, stdIn=stdIn, printing=printing, arguments=arguments, env_updates=env_updates, **capture)
     if type == "as_is":
-        return createAndRunScript(text, stdIn=stdIn, printing=printing, arguments=arguments, env_updates=env_updates)
+        return createAndRunScript(text, stdIn=stdIn, printing=printing, arguments=arguments, env_updates=env_updates, **capture)
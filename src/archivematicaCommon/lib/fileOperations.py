@@ -22,6 +22,8 @@
 
 from __future__ import absolute_import, print_function
 import csv
+import datetime
+import logging
 import os
 import uuid
 import sys
@@ -29,27 +31,87 @@ import shutil
 
 from databaseFunctions import insertIntoFiles
 from executeOrRunSubProcess import executeOrRun
-from databaseFunctions import insertIntoEvents
+from databaseFunctions import bulkInsertIntoEvents, insertIntoEvents
 import MySQLdb
-from archivematicaFunctions import unicodeToStr, get_setting, get_file_checksum
+from archivematicaFunctions import unicodeToStr, get_setting, get_file_checksums
 
 sys.path.append("/usr/share/archivematica/dashboard")
-from main.models import File, Transfer
+from django.db import IntegrityError, transaction
+from django.db.models import Case, TextField, Value, When
+from django.utils import timezone
+from main.models import File, FileDigest, Transfer
 
-def updateSizeAndChecksum(fileUUID, filePath, date, eventIdentifierUUID, fileSize=None, checksum=None, checksumType=None, add_event=True):
+LOGGER = logging.getLogger('archivematica.common')
+
+# Cached digests older than this are removed
+DIGEST_CACHE_MAX_AGE = datetime.timedelta(days=7)
+_digest_cache_pruned = False
+
+
+def _digest_key(stat):
+    """ Returns the FileDigest fields identifying the file stat was made of. """
+    # Inode numbers are only unique within a filesystem
+    return {'device': stat.st_dev, 'inode': stat.st_ino, 'size': stat.st_size, 'mtime': stat.st_mtime}
+
+
+def _cache_digests(stat, checksums):
+    global _digest_cache_pruned
+    key = _digest_key(stat)
+    try:
+        with transaction.atomic():
+            FileDigest.objects.filter(algorithm__in=checksums.keys(), **key).delete()
+            FileDigest.objects.bulk_create([
+                FileDigest(algorithm=algorithm, checksum=checksum, **key)
+                for algorithm, checksum in checksums.items()])
+    except IntegrityError:
+        # Another process cached the same file's digests at the same time
+        LOGGER.debug('Digests of inode %s already cached', stat.st_ino)
+    if not _digest_cache_pruned:
+        _digest_cache_pruned = True
+        FileDigest.objects.filter(created__lt=timezone.now() - DIGEST_CACHE_MAX_AGE).delete()
+
+
+def get_cached_checksums(filePath, algorithms, refresh=False, read_size=None):
+    """
+    Returns a dict of checksums of filePath by algorithm.
+
+    Digests are cached in the FileDigest table by the file's device, inode,
+    size and modification time, so later microservices working on the same file can
+    reuse them instead of reading it again. Those not cached are computed in
+    one read of the file. With refresh, all of them are computed and the
+    cache updated, as when checking a file's fixity.
+    """
+    stat = os.stat(filePath)
+    checksums = {}
+    if not refresh:
+        checksums.update(FileDigest.objects.filter(
+            algorithm__in=algorithms, **_digest_key(stat)).values_list('algorithm', 'checksum'))
+    missing = [algorithm for algorithm in algorithms if algorithm not in checksums]
+    if missing:
+        computed = get_file_checksums(filePath, missing, read_size=read_size)
+        checksums.update(computed)
+        after = os.stat(filePath)
+        # Don't cache the digests of a file which changed while it was read
+        if _digest_key(after) == _digest_key(stat):
+            _cache_digests(stat, computed)
+    return {algorithm: checksums[algorithm] for algorithm in algorithms}
+
+
+def updateSizeAndChecksum(fileUUID, filePath, date, eventIdentifierUUID, fileSize=None, checksum=None, checksumType=None, add_event=True, agents=None):
     """
     Update a File with its size, checksum and checksum type. These are
     parameters that can be either generated or provided via keywords.
 
     Finally, insert the corresponding Event. This behavior can be cancelled
-    using the boolean keyword 'add_event'.
+    using the boolean keyword 'add_event'. Its agents are looked up unless
+    given by 'agents'.
     """
     if not fileSize:
         fileSize = os.path.getsize(filePath)
     if not checksumType:
         checksumType = get_setting('checksum_type', 'sha256')
     if not checksum:
-        checksum = get_file_checksum(filePath, checksumType)
+        checksum = get_cached_checksums(filePath, [checksumType])[checksumType]
 
     File.objects.filter(uuid=fileUUID).update(size=fileSize, checksum=checksum, checksumtype=checksumType)
 
@@ -58,7 +120,8 @@ def updateSizeAndChecksum(fileUUID, filePath, date, eventIdentifierUUID, fileSiz
                          eventType='message digest calculation',
                          eventDateTime=date,
                          eventDetail='program="python"; module="hashlib.{}()"'.format(checksumType),
-                         eventOutcomeDetailNote=checksum)
+                         eventOutcomeDetailNote=checksum,
+                         agents=agents)
 
 
 def addFileToTransfer(filePathRelativeToSIP, fileUUID, transferUUID, taskUUID, date, sourceType="ingestion", eventDetail="", use="original"):
@@ -183,12 +246,13 @@ def updateFileLocation2(src, dst, unitPath, unitIdentifier, unitIdentifierType,
     f.currentlocation = dstDB
     f.save()
 
-def updateFileLocation(src, dst, eventType="", eventDateTime="", eventDetail="", eventIdentifierUUID=uuid.uuid4().__str__(), fileUUID="None", sipUUID=None, transferUUID=None, eventOutcomeDetailNote="", createEvent=True):
+def updateFileLocation(src, dst, eventType="", eventDateTime="", eventDetail="", eventIdentifierUUID=uuid.uuid4().__str__(), fileUUID="None", sipUUID=None, transferUUID=None, eventOutcomeDetailNote="", createEvent=True, agents=None):
     """
     Updates file location in the database, and optionally writes an event for the sanitization to the database.
     Note that this does not actually move a file on disk.
     If the file uuid is not provided, will use the SIP uuid and the old path to find the file uuid.
     To suppress creation of an event, pass the createEvent keyword argument (for example, if the file moved due to the renaming of a parent directory and not the file itself).
+    The event's agents are looked up unless given by the agents keyword argument.
     """
 
     src = unicodeToStr(src)
@@ -221,7 +285,34 @@ def updateFileLocation(src, dst, eventType="", eventDateTime="", eventDetail="",
     if eventOutcomeDetailNote == "":
         eventOutcomeDetailNote = "Original name=\"%s\"; cleaned up name=\"%s\"" %(src, dst)
     # CREATE THE EVENT
-    insertIntoEvents(fileUUID=f.uuid, eventType=eventType, eventDateTime=eventDateTime, eventDetail=eventDetail, eventOutcome="", eventOutcomeDetailNote=eventOutcomeDetailNote)
+    insertIntoEvents(fileUUID=f.uuid, eventType=eventType, eventDateTime=eventDateTime, eventDetail=eventDetail, eventOutcome="", eventOutcomeDetailNote=eventOutcomeDetailNote, agents=agents)
+
+def updateFileLocations(moves, eventType="", eventDateTime="", eventDetail="", agents=None, createEvents=True, batch_size=500):
+    """
+    Updates the locations of many files in the database with a few queries,
+    and optionally writes an event for each, as updateFileLocation does for one.
+    Note that this does not actually move files on disk.
+
+    :param list moves: (fileUUID, src, dst) of each file moved.
+    :param list agents: Agent IDs of the events; see bulkInsertIntoEvents.
+    """
+    moves = [(fileUUID, unicodeToStr(src), unicodeToStr(dst)) for fileUUID, src, dst in moves]
+    with transaction.atomic():
+        for start in range(0, len(moves), batch_size):
+            batch = moves[start:start + batch_size]
+            File.objects.filter(uuid__in=[fileUUID for fileUUID, _, _ in batch]).update(
+                currentlocation=Case(*[When(uuid=fileUUID, then=Value(dst)) for fileUUID, _, dst in batch],
+                                     output_field=TextField()))
+
+    if not createEvents:
+        return
+    bulkInsertIntoEvents([{
+        'fileUUID': fileUUID,
+        'eventType': eventType,
+        'eventDateTime': eventDateTime,
+        'eventDetail': eventDetail,
+        'eventOutcomeDetailNote': "Original name=\"%s\"; cleaned up name=\"%s\"" % (src, dst),
+    } for fileUUID, src, dst in moves], agents=agents, batch_size=batch_size)
 
 def getFileUUIDLike(filePath, unitPath, unitIdentifier, unitIdentifierType, unitPathReplaceWith):
     """Dest needs to be the actual full destination path with filename."""
@@ -0,0 +1,204 @@
+#!/usr/bin/env python2
+
+# This file is part of Archivematica.
+#
+# Copyright 2010-2013 Artefactual Systems Inc. <http://artefactual.com>
+#
+# Archivematica is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Archivematica is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Archivematica.  If not, see <http://www.gnu.org/licenses/>.
+
+# @package Archivematica
+# @subpackage archivematicaCommon
+
+"""
+Verification of the checksums of all of a unit's files in one task.
+
+Files are hashed by a pool of threads; hashlib and file reads release the GIL,
+so threads hash several files at once. Results are handed back in batches to
+be recorded, as PREMIS events for example, and each recorded batch is added to
+a checkpoint file. If the run is interrupted, the next run over the same unit
+only hashes files which are not in the checkpoint, or have changed since.
+"""
+
+from __future__ import print_function
+import collections
+import json
+import logging
+from multiprocessing.pool import ThreadPool
+import os
+import time
+
+from archivematicaFunctions import get_file_checksum
+from env_configparser import CLIENT_CONFIG_PATH, read_client_config
+
+LOGGER = logging.getLogger('archivematica.common')
+
+DEFAULT_WORKERS = 4
+DEFAULT_READ_SIZE = 4 * 1024 * 1024
+# Results recorded, and checkpointed, at a time
+DEFAULT_BATCH_SIZE = 100
+# Checkpoints older than this are from a run long finished, not an
+# interrupted one, and are ignored
+CHECKPOINT_MAX_AGE = 7 * 24 * 60 * 60
+
+# key identifies the file to the caller, e.g. its UUID; it is checkpointed as
+# its repr, so must have a stable one
+Expected = collections.namedtuple('Expected', 'key path checksum algorithm')
+# checksum is None if the file couldn't be read, and error says why. resumed
+# is True for results recorded by an interrupted run.
+Result = collections.namedtuple('Result', 'expected checksum error resumed')
+
+
+def result_passed(result):
+    return result.checksum is not None and result.checksum == result.expected.checksum
+
+
+class FixityCheck(object):
+    def __init__(self, checkpoint_path=None, workers=DEFAULT_WORKERS, read_size=DEFAULT_READ_SIZE,
+                 use_mmap=False, batch_size=DEFAULT_BATCH_SIZE):
+        self.checkpoint_path = checkpoint_path
+        self.workers = workers
+        self.read_size = read_size
+        self.use_mmap = use_mmap
+        self.batch_size = batch_size
+
+    def _hash(self, expected):
+        try:
+            stat = os.stat(expected.path)
+            checksum = get_file_checksum(expected.path, expected.algorithm,
+                                         read_size=self.read_size, use_mmap=self.use_mmap)
+        except (IOError, OSError, ValueError) as e:
+            return Result(expected, None, str(e), False), None
+        return Result(expected, checksum, None, False), stat
+
+    def _load_checkpoint(self):
+        """Return the checkpoint's entries by key; see _checkpoint_entry."""
+        entries = {}
+        if not self.checkpoint_path or not os.path.exists(self.checkpoint_path):
+            return entries
+        if time.time() - os.path.getmtime(self.checkpoint_path) > CHECKPOINT_MAX_AGE:
+            LOGGER.info('Removing old fixity checkpoint %s', self.checkpoint_path)
+            os.remove(self.checkpoint_path)
+            return entries
+        with open(self.checkpoint_path) as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # The last line may be incomplete
+                    continue
+                entries[entry['key']] = entry
+        LOGGER.info('Resuming fixity check of %d files from %s', len(entries), self.checkpoint_path)
+        return entries
+
+    @staticmethod
+    def _checkpoint_entry(result, stat):
+        expected = result.expected
+        return {
+            'key': repr(expected.key),
+            'expected': expected.checksum,
+            'algorithm': expected.algorithm,
+            'size': stat.st_size,
+            'mtime': stat.st_mtime,
+            'checksum': result.checksum,
+        }
+
+    @staticmethod
+    def _resume(expected, entry):
+        """Return the Result entry recorded for expected, or None if the file needs hashing again."""
+        if entry is None or entry['expected'] != expected.checksum or entry['algorithm'] != expected.algorithm:
+            return None
+        try:
+            stat = os.stat(expected.path)
+        except OSError:
+            return None
+        if stat.st_size != entry['size'] or stat.st_mtime != entry['mtime']:
+            return None
+        return Result(expected, entry['checksum'], None, True)
+
+    def run(self, files, record):
+        """
+        Verify the checksums of files, an iterable of Expected.
+
+        record is called with lists of new Results, in no particular order,
+        and must record them before it returns; readable files are then
+        added to the checkpoint. Files which couldn't be read are recorded
+        but not checkpointed, so they are tried again by the next run.
+
+        Returns every Result, including those resumed from the checkpoint.
+        The checkpoint is removed once all files have been recorded.
+        """
+        checkpoint = self._load_checkpoint()
+        results = []
+        to_hash = []
+        for expected in files:
+            resumed = self._resume(expected, checkpoint.get(repr(expected.key)))
+            if resumed is not None:
+                results.append(resumed)
+            else:
+                to_hash.append(expected)
+
+        checkpoint_file = None
+        if self.checkpoint_path:
+            directory = os.path.dirname(self.checkpoint_path)
+            if directory and not os.path.isdir(directory):
+                os.makedirs(directory)
+            checkpoint_file = open(self.checkpoint_path, 'a')
+        pool = ThreadPool(max(1, min(self.workers, len(to_hash))))
+        try:
+            batch = []
+            for result_and_stat in pool.imap_unordered(self._hash, to_hash):
+                batch.append(result_and_stat)
+                if len(batch) >= self.batch_size:
+                    self._record(batch, record, checkpoint_file)
+                    results.extend(result for result, _ in batch)
+                    batch = []
+            if batch:
+                self._record(batch, record, checkpoint_file)
+                results.extend(result for result, _ in batch)
+        finally:
+            pool.terminate()
+            if checkpoint_file is not None:
+                checkpoint_file.close()
+
+        if self.checkpoint_path:
+            os.remove(self.checkpoint_path)
+        return results
+
+    def _record(self, batch, record, checkpoint_file):
+        record([result for result, _ in batch])
+        if checkpoint_file is not None:
+            for result, stat in batch:
+                if stat is not None:
+                    checkpoint_file.write(json.dumps(self._checkpoint_entry(result, stat)) + '\n')
+            checkpoint_file.flush()
+            os.fsync(checkpoint_file.fileno())
+
+
+def from_client_config(unit_uuid, name, config_path=CLIENT_CONFIG_PATH):
+    """
+    Return a FixityCheck configured by the MCP client's fixityCheck options,
+    checkpointing to a file named after unit_uuid and name in its temp_dir.
+    """
+    config = read_client_config({
+        'temp_dir': '/var/archivematica/sharedDirectory/tmp',
+        'fixityCheckWorkers': str(DEFAULT_WORKERS),
+        'fixityCheckReadSize': str(DEFAULT_READ_SIZE),
+        'fixityCheckMmap': 'false',
+    }, config_path)
+    checkpoint_path = os.path.join(config.get('MCPClient', 'temp_dir'), 'fixityCheck',
+                                   '{}-{}.checkpoint'.format(unit_uuid, name))
+    return FixityCheck(checkpoint_path=checkpoint_path,
+                       workers=config.getint('MCPClient', 'fixityCheckWorkers'),
+                       read_size=config.getint('MCPClient', 'fixityCheckReadSize'),
+                       use_mmap=config.getboolean('MCPClient', 'fixityCheckMmap'))
@@ -0,0 +1,60 @@
+#!/usr/bin/env python2
+
+# This file is part of Archivematica.
+#
+# Copyright 2010-2013 Artefactual Systems Inc. <http://artefactual.com>
+#
+# Archivematica is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Archivematica is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Archivematica.  If not, see <http://www.gnu.org/licenses/>.
+
+# @package Archivematica
+# @subpackage archivematicaCommon
+
+"""
+HTTP exposition of the Prometheus metrics of the MCP server and clients.
+"""
+
+from BaseHTTPServer import HTTPServer
+import logging
+import socket
+import threading
+
+try:
+    import prometheus_client
+except ImportError:
+    prometheus_client = None
+
+LOGGER = logging.getLogger('archivematica.common')
+
+
+def serve(listen):
+    """
+    Serve this process's metrics over HTTP on listen, "address:port", from a
+    daemon thread. Returns whether they are being served.
+    """
+    if not listen:
+        return False
+    if prometheus_client is None:
+        LOGGER.warning('prometheus_client is not installed; not serving metrics on %s', listen)
+        return False
+    address, port = listen.rsplit(':', 1)
+    try:
+        server = HTTPServer((address, int(port)), prometheus_client.MetricsHandler)
+    except (socket.error, ValueError):
+        LOGGER.exception('Unable to serve metrics on %s', listen)
+        return False
+    thread = threading.Thread(target=server.serve_forever, name='metrics')
+    thread.daemon = True
+    thread.start()
+    LOGGER.info('Serving metrics on %s', listen)
+    return True
@@ -1,11 +1,14 @@
 from __future__ import absolute_import
 import base64
+import copy
 import logging
 import os
 import platform
 import requests
 from requests.auth import AuthBase
 import slumber
+import threading
+import time
 import urllib
 
 # archivematicaCommon
@@ -13,6 +16,20 @@ from archivematicaFunctions import get_setting
 
 LOGGER = logging.getLogger("archivematica.common")
 
+# Seconds the storage service settings are cached for
+SETTINGS_CACHE_TIMEOUT = 60
+# Seconds locations and pipelines fetched from the storage service are cached for
+RESPONSE_CACHE_TIMEOUT = 30
+# Files looked up in a single request by get_files_info
+BATCH_SIZE = 50
+
+# Cached settings and responses, as (time, value) tuples by key
+_cache = {}
+# The storage API client, shared by the whole process so its connections
+# are kept alive, and the settings it was created with
+_api = {'settings': None, 'api': None}
+_lock = threading.Lock()
+
 
 class ResourceNotFound(Exception):
     pass
@@ -37,9 +54,37 @@ class TastypieApikeyAuth(AuthBase):
         return r
 
 
+def _cached(key, timeout, fetch, cache_none=True):
+    """ Returns fetch(), cached under key for timeout seconds.
+
+    If cache_none is False, None isn't cached, so that a lookup which failed
+    is tried again. """
+    with _lock:
+        entry = _cache.get(key)
+    if entry is not None and time.time() - entry[0] < timeout:
+        return copy.deepcopy(entry[1])
+    value = fetch()
+    if value is not None or cache_none:
+        with _lock:
+            _cache[key] = (time.time(), value)
+    return copy.deepcopy(value)
+
+
+def clear_cache():
+    """ Forgets the cached settings and responses, e.g. once the storage service settings changed. """
+    with _lock:
+        _cache.clear()
+
+
+def _get_setting(setting, default=''):
+    """ Returns get_setting(setting, default), cached for SETTINGS_CACHE_TIMEOUT seconds. """
+    return _cached(('setting', setting, default), SETTINGS_CACHE_TIMEOUT,
+                   lambda: get_setting(setting, default))
+
+
 def _storage_service_url():
     # Get storage service URL from DashboardSetting model
-    storage_service_url = get_setting('storage_service_url', None)
+    storage_service_url = _get_setting('storage_service_url', None)
     if storage_service_url is None:
         LOGGER.error("Storage server not configured.")
         storage_service_url = 'http://localhost:8000/'
@@ -52,19 +97,40 @@ def _storage_service_url():
 
 
 def _storage_api():
-    """ Returns slumber access to storage API. """
+    """ Returns slumber access to storage API.
+
+    The same client, and so the same pool of connections, is returned until
+    the storage service settings change. """
     storage_service_url = _storage_service_url()
-    username = get_setting('storage_service_user', 'test')
-    api_key = get_setting('storage_service_apikey', None)
-    api = slumber.API(storage_service_url, auth=TastypieApikeyAuth(username, api_key))
-    return api
+    username = _get_setting('storage_service_user', 'test')
+    api_key = _get_setting('storage_service_apikey', None)
+    settings = (storage_service_url, username, api_key)
+    with _lock:
+        if _api['settings'] != settings:
+            session = requests.Session()
+            session.auth = TastypieApikeyAuth(username, api_key)
+            _api['api'] = slumber.API(storage_service_url, session=session)
+            _api['settings'] = settings
+        return _api['api']
 
 def _storage_api_params():
     """ Returns API GET params username=USERNAME&api_key=KEY """
-    username = get_setting('storage_service_user', 'test')
-    api_key = get_setting('storage_service_apikey', None)
+    username = _get_setting('storage_service_user', 'test')
+    api_key = _get_setting('storage_service_apikey', None)
     return urllib.urlencode({'username': username, 'api_key': api_key})
 
+def _get_all(resource, **params):
+    """ Returns the objects of every page of resource.get(**params). """
+    offset = 0
+    objects = []
+    while True:
+        page = resource.get(offset=offset, **params)
+        objects += page['objects']
+        if not page['meta']['next']:
+            break
+        offset += page['meta']['limit']
+    return objects
+
 def _storage_relative_from_absolute(location_path, space_path):
     """ Strip space_path and next / from location_path. """
     location_path = os.path.normpath(location_path)
@@ -101,7 +167,7 @@ def create_pipeline(create_default_locations=False, shared_path=None, api_userna
             raise
     return True
 
-def _get_pipeline(uuid):
+def _fetch_pipeline(uuid):
     api = _storage_api()
     try:
         pipeline = api.pipeline(uuid).get()
@@ -112,6 +178,10 @@ def _get_pipeline(uuid):
         pipeline = None
     return pipeline
 
+def _get_pipeline(uuid):
+    return _cached(('pipeline', uuid), RESPONSE_CACHE_TIMEOUT,
+                   lambda: _fetch_pipeline(uuid), cache_none=False)
+
 ############# LOCATIONS #############
 
 def get_location(path=None, purpose=None, space=None):
@@ -125,26 +195,16 @@ def get_location(path=None, purpose=None, space=None):
     path: Path to location.  If a space is passed in, paths starting with /
         have the space's path stripped.
     """
-    api = _storage_api()
-    offset = 0
-    return_locations = []
     if space and path:
         path = _storage_relative_from_absolute(path, space['path'])
         space = space['uuid']
-    pipeline = _get_pipeline(get_setting('dashboard_uuid'))
+    pipeline = _get_pipeline(_get_setting('dashboard_uuid'))
     if pipeline is None:
         return None
-    while True:
-        locations = api.location.get(pipeline__uuid=pipeline['uuid'],
-                                     relative_path=path,
-                                     purpose=purpose,
-                                     space=space,
-                                     offset=offset)
-        LOGGER.debug("Storage locations retrieved: {}".format(locations))
-        return_locations += locations['objects']
-        if not locations['meta']['next']:
-            break
-        offset += locations['meta']['limit']
+    return_locations = _cached(
+        ('location', pipeline['uuid'], path, purpose, space), RESPONSE_CACHE_TIMEOUT,
+        lambda: _get_all(_storage_api().location, pipeline__uuid=pipeline['uuid'],
+                         relative_path=path, purpose=purpose, space=space))
 
     LOGGER.info("Storage locations returned: {}".format(return_locations))
     return return_locations
@@ -179,7 +239,7 @@ def copy_files(source_location, destination_location, files, api=None):
     """
     if api is None:
         api = _storage_api()
-    pipeline = _get_pipeline(get_setting('dashboard_uuid'))
+    pipeline = _get_pipeline(_get_setting('dashboard_uuid'))
     move_files = {
         'origin_location': source_location['resource_uri'],
         'files': files,
@@ -239,17 +299,7 @@ def get_space(access_protocol=None, path=None):
         service purposes, in storage_service.locations.models.py
     """
     api = _storage_api()
-    offset = 0
-    return_spaces = []
-    while True:
-        spaces = api.space.get(access_protocol=access_protocol,
-                               path=path,
-                               offset=offset)
-        LOGGER.debug("Storage spaces retrieved: {}".format(spaces))
-        return_spaces += spaces['objects']
-        if not spaces['meta']['next']:
-            break
-        offset += spaces['meta']['limit']
+    return_spaces = _get_all(api.space, access_protocol=access_protocol, path=path)
 
     LOGGER.info("Storage spaces returned: {}".format(return_spaces))
     return return_spaces
@@ -264,7 +314,7 @@ def create_file(uuid, origin_location, origin_path, current_location,
     """
 
     api = _storage_api()
-    pipeline = _get_pipeline(get_setting('dashboard_uuid'))
+    pipeline = _get_pipeline(_get_setting('dashboard_uuid'))
     if pipeline is None:
         return (None, 'Pipeline not available, see logs.')
     new_file = {
@@ -307,23 +357,44 @@ def get_file_info(uuid=None, origin_location=None, origin_path=None,
     # TODO Need a better way to deal with mishmash of relative and absolute
     # paths coming in
     api = _storage_api()
-    offset = 0
-    return_files = []
-    while True:
-        files = api.file.get(uuid=uuid,
-                             origin_location=origin_location,
-                             origin_path=origin_path,
-                             current_location=current_location,
-                             current_path=current_path,
-                             package_type=package_type,
-                             status=status,
-                             offset=offset)
-        LOGGER.debug("Files retrieved: {}".format(files))
-        return_files += files['objects']
-        if not files['meta']['next']:
-            break
-        offset += files['meta']['limit']
+    return_files = _get_all(api.file,
+                            uuid=uuid,
+                            origin_location=origin_location,
+                            origin_path=origin_path,
+                            current_location=current_location,
+                            current_path=current_path,
+                            package_type=package_type,
+                            status=status)
+
+    LOGGER.info("Files returned: {}".format(return_files))
+    return return_files
 
+def get_files_info(uuids, batch_size=BATCH_SIZE):
+    """ Returns the files with the given UUIDs, as get_file_info does, by UUID.
+
+    Files are looked up batch_size at a time, or one at a time from storage
+    services which don't allow filtering by uuid__in; those the storage
+    service doesn't know about are left out.
+    """
+    api = _storage_api()
+    uuids = list(uuids)
+    return_files = {}
+    batched = True
+    for start in range(0, len(uuids), batch_size):
+        batch = uuids[start:start + batch_size]
+        files = []
+        if batched:
+            try:
+                files = _get_all(api.file, uuid__in=','.join(batch))
+            except slumber.exceptions.HttpClientError:
+                LOGGER.warning('Unable to look up files in batches; looking them up one at a time', exc_info=True)
+                batched = False
+        if not batched:
+            for uuid in batch:
+                files += _get_all(api.file, uuid=uuid)
+        for file_ in files:
+            if file_['uuid'] in batch:
+                return_files[file_['uuid']] = file_
     LOGGER.info("Files returned: {}".format(return_files))
     return return_files
 
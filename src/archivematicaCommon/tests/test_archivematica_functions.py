@@ -0,0 +1,39 @@
+# -*- coding: UTF-8 -*-
+import hashlib
+import os
+import shutil
+import tempfile
+import unittest
+
+from archivematicaFunctions import get_file_checksum, get_file_checksums
+
+
+class TestFileChecksums(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.contents = 'Archivematica' * 10000
+        self.path = os.path.join(self.tmpdir, 'file')
+        with open(self.path, 'wb') as f:
+            f.write(self.contents)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_several_checksums(self):
+        checksums = get_file_checksums(self.path, ['md5', 'sha1', 'sha256'], read_size=1000)
+        assert checksums == {
+            'md5': hashlib.md5(self.contents).hexdigest(),
+            'sha1': hashlib.sha1(self.contents).hexdigest(),
+            'sha256': hashlib.sha256(self.contents).hexdigest(),
+        }
+
+    def test_mmap(self):
+        checksums = get_file_checksums(self.path, ['md5', 'sha512'], read_size=1000, use_mmap=True)
+        assert checksums['sha512'] == hashlib.sha512(self.contents).hexdigest()
+
+    def test_empty_file(self):
+        empty = os.path.join(self.tmpdir, 'empty')
+        open(empty, 'wb').close()
+        assert get_file_checksum(empty, 'md5') == hashlib.md5('').hexdigest()
+        assert get_file_checksum(empty, 'md5', use_mmap=True) == hashlib.md5('').hexdigest()
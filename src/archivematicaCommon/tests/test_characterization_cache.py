@@ -0,0 +1,84 @@
+# -*- coding: UTF-8 -*-
+import datetime
+import os
+import shutil
+import tempfile
+
+from django.test import TestCase
+from django.utils import timezone
+
+import characterizationCache
+from main.models import CharacterizationCache
+
+RULE = 'd3e0e5ba-c5b7-4e2d-a8b2-f6b3d6ac9d5e'
+OUTPUT = '<fits><filepath>/tmp/transfer/objects/image.jpg</filepath><filename>image.jpg</filename></fits>'
+
+
+class TestCharacterizationCache(TestCase):
+
+    def test_output_is_reused_for_other_paths(self):
+        characterizationCache.put('sha256', 'abc', RULE, '0.8.4', '/tmp/transfer/objects/image.jpg', OUTPUT)
+        assert characterizationCache.get('sha256', 'abc', RULE, '0.8.4', '/tmp/transfer/objects/image.jpg') == OUTPUT
+        assert characterizationCache.get('sha256', 'abc', RULE, '0.8.4', '/tmp/other/objects/copy.jpg') == \
+            '<fits><filepath>/tmp/other/objects/copy.jpg</filepath><filename>copy.jpg</filename></fits>'
+
+    def test_output_is_keyed_by_tool_version(self):
+        characterizationCache.put('sha256', 'abc', RULE, '0.8.4', '/tmp/image.jpg', OUTPUT)
+        assert characterizationCache.get('sha256', 'abc', RULE, '0.10.2', '/tmp/image.jpg') is None
+        assert characterizationCache.get('sha256', 'abd', RULE, '0.8.4', '/tmp/image.jpg') is None
+
+    def test_output_is_keyed_by_extension(self):
+        characterizationCache.put('sha256', 'abc', RULE, '0.8.4', '/tmp/image.jpg', OUTPUT)
+        assert characterizationCache.get('sha256', 'abc', RULE, '0.8.4', '/tmp/image.jpeg') is None
+        assert characterizationCache.get('sha256', 'abc', RULE, '0.8.4', '/tmp/image') is None
+        assert characterizationCache.get('sha256', 'abc', RULE, '0.8.4', '/tmp/IMAGE.JPG') == \
+            '<fits><filepath>/tmp/IMAGE.JPG</filepath><filename>IMAGE.JPG</filename></fits>'
+
+    def test_least_recently_used_entries_are_evicted(self):
+        for checksum in ('a', 'b', 'c'):
+            characterizationCache.put('sha256', checksum, RULE, '0.8.4', '/tmp/image.jpg', OUTPUT)
+        CharacterizationCache.objects.update(last_used=timezone.now() - datetime.timedelta(days=1))
+        # Using an entry makes it the most recently used
+        characterizationCache.get('sha256', 'a', RULE, '0.8.4', '/tmp/image.jpg')
+        size = CharacterizationCache.objects.get(checksum='a').size
+        characterizationCache.evict(size * 2)
+        assert sorted(CharacterizationCache.objects.values_list('checksum', flat=True)) == ['a']
+
+    def test_only_elements_naming_the_file_are_replaced(self):
+        # A file name which is also the value of another element
+        output = '<fits><filename>8</filename><bitsPerSample>8</bitsPerSample></fits>'
+        characterizationCache.put('sha256', 'abc', RULE, '0.8.4', '/tmp/transfer/objects/8', output)
+        assert characterizationCache.get('sha256', 'abc', RULE, '0.8.4', '/tmp/other/photo') == \
+            '<fits><filename>photo</filename><bitsPerSample>8</bitsPerSample></fits>'
+
+    def test_mediainfo_file_names_are_those_of_the_file(self):
+        output = ('<Mediainfo><File><track type="General"><Complete_name>/tmp/transfer/objects/video.mp4</Complete_name>'
+                  '<Folder_name>/tmp/transfer/objects</Folder_name><File_name>video</File_name>'
+                  '<File_extension>mp4</File_extension></track></File></Mediainfo>')
+        characterizationCache.put('sha256', 'abc', RULE, '0.7.64', '/tmp/transfer/objects/video.mp4', output)
+        assert characterizationCache.get('sha256', 'abc', RULE, '0.7.64', '/tmp/other/clip.MP4') == \
+            ('<Mediainfo><File><track type="General"><Complete_name>/tmp/other/clip.MP4</Complete_name>'
+             '<Folder_name>/tmp/other</Folder_name><File_name>clip</File_name>'
+             '<File_extension>MP4</File_extension></track></File></Mediainfo>')
+
+    def test_directory_and_times_are_those_of_the_file(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        original, copy = os.path.join(directory, 'image.jpg'), os.path.join(directory, 'copy', 'copy.jpg')
+        os.mkdir(os.path.dirname(copy))
+        for path, mtime in ((original, 1000000000), (copy, 1400000000)):
+            open(path, 'w').close()
+            os.utime(path, (mtime, mtime))
+        output = ('<fits><fileinfo><filepath>{0}</filepath><fslastmodified>1000000000000</fslastmodified></fileinfo>'
+                  '<exiftool xmlns:System="http://ns.exiftool.ca/File/System/1.0/">'
+                  '<System:Directory>{1}</System:Directory><System:FileModifyDate>2001:09:09 01:46:40+00:00</System:FileModifyDate>'
+                  '</exiftool><toolOutput source="{0}"/></fits>').format(original, directory)
+        characterizationCache.put('sha256', 'abc', RULE, '0.8.4', original, output)
+
+        cached = characterizationCache.get('sha256', 'abc', RULE, '0.8.4', copy)
+        assert '<filepath>{}</filepath>'.format(copy) in cached
+        assert '<fslastmodified>1400000000000</fslastmodified>' in cached
+        assert '<System:Directory>{}</System:Directory>'.format(os.path.dirname(copy)) in cached
+        assert '<System:FileModifyDate>{}</System:FileModifyDate>'.format(characterizationCache._exiftool_date(1400000000)) in cached
+        assert 'source="{}"'.format(copy) in cached
+        assert original not in cached
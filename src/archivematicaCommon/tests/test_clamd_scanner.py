@@ -0,0 +1,146 @@
+# -*- coding: UTF-8 -*-
+import os
+import shutil
+import socket
+import struct
+import tempfile
+import threading
+import unittest
+
+import pytest
+
+import clamdScanner
+
+VERSION = 'ClamAV 0.99.2/22345/Tue Oct 18 09:55:11 2016'
+EICAR = 'X5O!P%@AP[4\\PZX54(P^)7CC)7}$EICAR-STANDARD-ANTIVIRUS-TEST-FILE!$H+H*'
+
+
+class FakeClamd(object):
+    """Serves the IDSESSION, VERSION, INSTREAM and END commands, finding EICAR in streams."""
+    def __init__(self, path):
+        self.sessions = 0
+        self.commands = []
+        self.server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.server.bind(path)
+        self.server.listen(5)
+        thread = threading.Thread(target=self._accept)
+        thread.daemon = True
+        thread.start()
+
+    def _accept(self):
+        while True:
+            try:
+                connection, _ = self.server.accept()
+            except socket.error:
+                return
+            self.sessions += 1
+            thread = threading.Thread(target=self._serve, args=(connection,))
+            thread.daemon = True
+            thread.start()
+
+    @staticmethod
+    def _read(connection, size):
+        data = ''
+        while len(data) < size:
+            chunk = connection.recv(size - len(data))
+            if not chunk:
+                raise EOFError()
+            data += chunk
+        return data
+
+    def _command(self, connection):
+        command = ''
+        while not command.endswith('\0'):
+            command += self._read(connection, 1)
+        return command[1:-1]
+
+    def _serve(self, connection):
+        number = 0
+        try:
+            assert self._command(connection) == 'IDSESSION'
+            while True:
+                command = self._command(connection)
+                self.commands.append(command)
+                number += 1
+                if command == 'END':
+                    break
+                elif command == 'VERSION':
+                    reply = VERSION
+                elif command == 'INSTREAM':
+                    data = ''
+                    while True:
+                        size = struct.unpack('!L', self._read(connection, 4))[0]
+                        if not size:
+                            break
+                        data += self._read(connection, size)
+                    reply = 'stream: Eicar-Test-Signature FOUND' if EICAR in data else 'stream: OK'
+                connection.sendall('{}: {}\0'.format(number, reply))
+        except EOFError:
+            pass
+        finally:
+            connection.close()
+
+    def close(self):
+        self.server.close()
+
+
+class TestClamdScanner(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.clamd = FakeClamd(os.path.join(self.tmpdir, 'clamd.ctl'))
+        self.scanner = clamdScanner.ClamdScanner(os.path.join(self.tmpdir, 'clamd.ctl'),
+                                                 workers=2, timeout=5, chunk_size=10)
+        self.files = []
+        for i in range(5):
+            path = os.path.join(self.tmpdir, 'file{}'.format(i))
+            with open(path, 'wb') as f:
+                f.write(EICAR if i == 0 else 'contents {}'.format(i) * 10)
+            self.files.append(('uuid{}'.format(i), path))
+
+    def tearDown(self):
+        self.scanner.close()
+        self.clamd.close()
+        shutil.rmtree(self.tmpdir)
+
+    def test_scans_files(self):
+        results = {result.key: result for result in self.scanner.scan(self.files)}
+        assert results['uuid0'].virus == 'Eicar-Test-Signature'
+        assert not clamdScanner.result_passed(results['uuid0'])
+        assert all(clamdScanner.result_passed(results['uuid{}'.format(i)]) for i in range(1, 5))
+        # Connections are reused for several files
+        assert self.clamd.sessions <= 2
+        assert self.clamd.commands.count('INSTREAM') == 5
+
+    def test_version_is_cached(self):
+        assert self.scanner.version() == VERSION
+        assert self.scanner.version() == VERSION
+        assert self.clamd.commands.count('VERSION') == 1
+
+    def test_unreadable_files(self):
+        result = self.scanner.scan_file('missing', os.path.join(self.tmpdir, 'missing'))
+        assert result.virus is None
+        assert result.error
+
+    def test_closed_connections_are_replaced(self):
+        self.scanner.scan_file(*self.files[1])
+        # e.g. by clamd, when the connection was idle for too long
+        self.scanner._connections.queue[0].socket.shutdown(socket.SHUT_RDWR)
+        assert clamdScanner.result_passed(self.scanner.scan_file(*self.files[2]))
+        assert self.clamd.sessions == 2
+
+    def test_unreachable_clamd(self):
+        self.clamd.close()
+        scanner = clamdScanner.ClamdScanner(os.path.join(self.tmpdir, 'missing.ctl'))
+        with pytest.raises(socket.error):
+            scanner.version()
+        result = scanner.scan_file(*self.files[1])
+        assert result.error
+
+
+class TestParseReply(unittest.TestCase):
+
+    def test_parse_reply(self):
+        assert clamdScanner.parse_reply('stream: OK') == (None, None)
+        assert clamdScanner.parse_reply('stream: Eicar-Test-Signature FOUND') == ('Eicar-Test-Signature', None)
+        assert clamdScanner.parse_reply('INSTREAM size limit exceeded. ERROR') == (None, 'INSTREAM size limit exceeded. ERROR')
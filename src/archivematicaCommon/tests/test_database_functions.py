@@ -18,6 +18,9 @@ class TestDatabaseFunctions(TestCase):
     fixture_files = ['agents.json', 'test_database_functions.json']
     fixtures = [os.path.join(THIS_DIR, 'fixtures', p) for p in fixture_files]
 
+    def setUp(self):
+        databaseFunctions._unit_agents.clear()
+
     # insertIntoFiles
 
     def test_insert_into_files_with_sip(self):
@@ -37,6 +40,25 @@ class TestDatabaseFunctions(TestCase):
             databaseFunctions.insertIntoFiles("both", "both_path", sipUUID="sip", transferUUID="transfer")
         assert "both SIP and transfer UUID" in str(excinfo.value)
 
+    # getUnitFiles
+
+    def test_get_unit_files(self):
+        sip_uuid = "742b0443-cf18-442a-94f9-6d5b4948227d"
+        File.objects.create(uuid="c4b7b1f0-5f4e-4a2a-9d1c-0a7c6ea4d8f5", sip_id=sip_uuid,
+                            currentlocation="%SIPDirectory%objects/a.txt", checksum="abc")
+        File.objects.create(uuid="0e4f3e8a-5c8d-4b0b-9a3e-2f1d6a7b8c9d", sip_id=sip_uuid,
+                            currentlocation=None)
+        files = databaseFunctions.getUnitFiles(sip_uuid, "SIP", "/sip", fields=("checksum",))
+        assert files["/sip/objects/a.txt"] == ("c4b7b1f0-5f4e-4a2a-9d1c-0a7c6ea4d8f5", "abc")
+        assert "0e4f3e8a-5c8d-4b0b-9a3e-2f1d6a7b8c9d" not in [f[0] for f in files.values()]
+
+    def test_get_unit_files_with_event(self):
+        databaseFunctions.insertIntoEvents(fileUUID="88c8f115-80bc-4da4-a1e6-0158f5df13b9", eventType="virus check")
+        assert databaseFunctions.getUnitFilesWithEvent("742b0443-cf18-442a-94f9-6d5b4948227d", "SIP", "virus check") == \
+            set(["88c8f115-80bc-4da4-a1e6-0158f5df13b9"])
+        assert databaseFunctions.getUnitFilesWithEvent("742b0443-cf18-442a-94f9-6d5b4948227d", "SIP", "fixity check") == set()
+        assert databaseFunctions.getUnitFilesWithEvent("742b0443-cf18-442a-94f9-6d5b4948227d", "Transfer", "virus check") == set()
+
     # getAMAgentsForFile
 
     def test_get_agent_for_file_with_sip_agent(self):
@@ -81,6 +103,59 @@ class TestDatabaseFunctions(TestCase):
         assert agents.get(id=2)
         assert agents.get(id=5)
 
+    # bulkInsertIntoEvents
+
+    def test_bulk_insert_into_events(self):
+        databaseFunctions.bulkInsertIntoEvents([
+            {'fileUUID': "88c8f115-80bc-4da4-a1e6-0158f5df13b9", 'eventIdentifierUUID': "bulk_event_1"},
+            {'fileUUID': "88c8f115-80bc-4da4-a1e6-0158f5df13b9", 'eventIdentifierUUID': "bulk_event_2", 'eventType': 'fixity check'},
+        ])
+        assert Event.objects.get(event_id="bulk_event_2").event_type == 'fixity check'
+        agents = Event.objects.get(event_id="bulk_event_1").agents
+        assert sorted(agents.values_list('id', flat=True)) == [1, 2, 5]
+
+    def test_bulk_insert_into_events_with_agents(self):
+        databaseFunctions.bulkInsertIntoEvents([
+            {'fileUUID': "88c8f115-80bc-4da4-a1e6-0158f5df13b9", 'eventIdentifierUUID': "bulk_event_agents"},
+        ], agents=[1])
+        assert list(Event.objects.get(event_id="bulk_event_agents").agents.values_list('id', flat=True)) == [1]
+
+    def test_get_agents_for_files(self):
+        agents = databaseFunctions.getAMAgentsForFiles(["88c8f115-80bc-4da4-a1e6-0158f5df13b9", "1f4af873-8d60-4907-a92e-d1889e643524", "no such file"])
+        assert sorted(agents["88c8f115-80bc-4da4-a1e6-0158f5df13b9"]) == [1, 2, 5]
+        assert sorted(agents["1f4af873-8d60-4907-a92e-d1889e643524"]) == [1, 2, 10]
+        assert agents["no such file"] == []
+
+    def test_unit_agents_are_cached(self):
+        databaseFunctions.getAMAgentsForFile("88c8f115-80bc-4da4-a1e6-0158f5df13b9")
+        # Only the file is looked up for another file of the same SIP
+        with self.assertNumQueries(1):
+            agents = databaseFunctions.getAMAgentsForFile("88c8f115-80bc-4da4-a1e6-0158f5df13b9")
+        assert sorted(agents) == [1, 2, 5]
+
+    # bulkEvents
+
+    def test_bulk_events(self):
+        with databaseFunctions.bulkEvents():
+            databaseFunctions.insertIntoEvents(fileUUID="88c8f115-80bc-4da4-a1e6-0158f5df13b9", eventIdentifierUUID="buffered_event_1")
+            with databaseFunctions.bulkEvents():
+                databaseFunctions.insertIntoEvents(fileUUID="88c8f115-80bc-4da4-a1e6-0158f5df13b9", eventIdentifierUUID="buffered_event_2", agents=[1])
+            assert Event.objects.filter(event_id__startswith="buffered_event").count() == 0
+        agents = Event.objects.get(event_id="buffered_event_1").agents
+        assert sorted(agents.values_list('id', flat=True)) == [1, 2, 5]
+        agents = Event.objects.get(event_id="buffered_event_2").agents
+        assert list(agents.values_list('id', flat=True)) == [1]
+
+    def test_bulk_events_discarded_on_error(self):
+        with pytest.raises(ValueError):
+            with databaseFunctions.bulkEvents():
+                databaseFunctions.insertIntoEvents(fileUUID="88c8f115-80bc-4da4-a1e6-0158f5df13b9", eventIdentifierUUID="buffered_event_1")
+                raise ValueError()
+        assert Event.objects.filter(event_id="buffered_event_1").count() == 0
+        # Events are written one at a time again afterwards
+        databaseFunctions.insertIntoEvents(fileUUID="88c8f115-80bc-4da4-a1e6-0158f5df13b9", eventIdentifierUUID="unbuffered_event")
+        assert Event.objects.filter(event_id="unbuffered_event").count() == 1
+
     # getAccessionNumberFromTransfer
 
     def test_get_accession_number_from_transfer(self):
@@ -50,6 +50,24 @@ def test_replacementdict_replace():
     assert d.replace("%PREFIX%/bin/") == ["/usr/local/bin/"]
 
 
+def test_replacementdict_replace_overlapping_keys():
+    d = ReplacementDict({"%SIPDirectory": "short", "%SIPDirectory%": "long"})
+    assert d.replace("%SIPDirectory%/ %SIPDirectory/", None) == ["long/ short/", None]
+
+
+def test_replacementdict_replace_does_not_replace_in_values():
+    d = ReplacementDict({"%a%": "%b%", "%b%": "b"})
+    assert d.replace("%a% %b%") == ["%b% b"]
+
+
+def test_replacementdict_compile():
+    d = ReplacementDict({"%PREFIX%": "/usr/local"})
+    compiled = d.compile()
+    d["%PREFIX%"] = "/opt"
+    assert compiled.replace("%PREFIX%/bin/", "%PREFIX%/lib/") == ["/usr/local/bin/", "/usr/local/lib/"]
+    assert d.replace("%PREFIX%/bin/") == ["/opt/bin/"]
+
+
 def test_replacementdict_model_constructor_transfer():
     rd = ReplacementDict.frommodel(sip=TRANSFER, file_=FILE, type_='transfer')
 
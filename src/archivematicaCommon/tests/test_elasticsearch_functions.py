@@ -1,3 +1,4 @@
+import json
 import os
 import sys
 
@@ -90,3 +91,165 @@ class TestElasticSearchFunctions(unittest.TestCase):
     def test_set_tags_fails_when_file_cant_be_found(self):
         with pytest.raises(elasticSearchFunctions.EmptySearchResultError):
             elasticSearchFunctions.set_file_tags(self.client, 'no_such_file', [])
+
+
+class FakeBulkClient(object):
+    """Records _bulk requests, answering each item with the next of statuses."""
+    def __init__(self, statuses=()):
+        self.transport = Elasticsearch().transport
+        self.cluster = self
+        self.statuses = list(statuses)
+        self.requests = []
+
+    def health(self):
+        return {'status': 'green'}
+
+    def bulk(self, body):
+        lines = body.splitlines()
+        self.requests.append([json.loads(line) for line in lines[1::2]])
+        items = []
+        for _ in lines[::2]:
+            status = self.statuses.pop(0) if self.statuses else 201
+            result = {'status': status}
+            if status >= 300:
+                result['error'] = 'Error {}'.format(status)
+            items.append({'index': result})
+        return {'errors': any('error' in item['index'] for item in items), 'items': items}
+
+
+class TestBulkIndexer(unittest.TestCase):
+
+    def test_batches_by_document_count(self):
+        client = FakeBulkClient()
+        with elasticSearchFunctions.BulkIndexer(client, max_documents=2) as bulk:
+            for i in range(5):
+                bulk.index({'n': i}, 'transfers', 'transferfile')
+        assert [len(request) for request in client.requests] == [2, 2, 1]
+        assert bulk.indexed == 5
+
+    def test_batches_by_size(self):
+        client = FakeBulkClient()
+        with elasticSearchFunctions.BulkIndexer(client, max_bytes=100) as bulk:
+            for i in range(3):
+                bulk.index({'text': 'x' * 60}, 'transfers', 'transferfile')
+        assert [len(request) for request in client.requests] == [1, 1, 1]
+
+    def test_documents_are_serialized_when_added(self):
+        client = FakeBulkClient()
+        data = {'n': 0}
+        with elasticSearchFunctions.BulkIndexer(client) as bulk:
+            bulk.index(data, 'transfers', 'transferfile')
+            data['n'] = 1
+            bulk.index(data, 'transfers', 'transferfile')
+        assert client.requests == [[{'n': 0}, {'n': 1}]]
+
+    def test_retries_rejected_documents(self):
+        client = FakeBulkClient([201, 429, 201])
+        with elasticSearchFunctions.BulkIndexer(client, wait_between_tries=0) as bulk:
+            for i in range(3):
+                bulk.index({'n': i}, 'transfers', 'transferfile')
+        assert client.requests == [[{'n': 0}, {'n': 1}, {'n': 2}], [{'n': 1}]]
+        assert bulk.indexed == 3
+        assert bulk.retried == 1
+
+    def test_raises_on_errors(self):
+        client = FakeBulkClient([400])
+        bulk = elasticSearchFunctions.BulkIndexer(client)
+        bulk.index({'n': 0}, 'transfers', 'transferfile')
+        with pytest.raises(elasticSearchFunctions.ElasticsearchError):
+            bulk.close()
+
+
+class FakeScrollClient(object):
+    """Answers searches and scrolls from a list of hits, and records deletions made with _bulk."""
+    def __init__(self, hit_count):
+        self.transport = Elasticsearch().transport
+        self.hits = [{'_id': str(i)} for i in range(hit_count)]
+        self.position = 0
+        self.page_size = None
+        self.scrolls = 0
+        self.cleared = []
+        self.requests = []
+
+    def _page(self):
+        page = self.hits[self.position:self.position + self.page_size]
+        self.position += len(page)
+        return {'_scroll_id': 'scroll', 'hits': {'total': len(self.hits), 'hits': page}}
+
+    def search(self, body, index, doc_type, scroll, size, **params):
+        self.page_size = size
+        return self._page()
+
+    def scroll(self, scroll_id, scroll):
+        self.scrolls += 1
+        return self._page()
+
+    def clear_scroll(self, scroll_id):
+        self.cleared.append(scroll_id)
+
+    def bulk(self, body):
+        actions = [json.loads(line) for line in body.splitlines()]
+        self.requests.append(actions)
+        return {'errors': False, 'items': [{'delete': {'_id': action['delete']['_id'], 'found': True}} for action in actions]}
+
+
+class TestIterAllResults(unittest.TestCase):
+
+    def test_fetches_all_pages(self):
+        client = FakeScrollClient(5)
+        hits = list(elasticSearchFunctions.iter_all_results(client, {}, page_size=2))
+        assert [hit['_id'] for hit in hits] == ['0', '1', '2', '3', '4']
+        assert client.scrolls == 2
+        assert client.cleared == ['scroll']
+
+    def test_stops_at_total(self):
+        client = FakeScrollClient(4)
+        assert len(list(elasticSearchFunctions.iter_all_results(client, {}, page_size=2))) == 4
+        assert client.scrolls == 1
+
+    def test_clears_scroll_when_abandoned(self):
+        client = FakeScrollClient(5)
+        hits = elasticSearchFunctions.iter_all_results(client, {}, page_size=2)
+        next(hits)
+        hits.close()
+        assert client.cleared == ['scroll']
+
+    def test_search_all_results(self):
+        client = FakeScrollClient(3)
+        results = elasticSearchFunctions.search_all_results(client, {})
+        assert results['hits']['total'] == 3
+        assert len(results['hits']['hits']) == 3
+
+    def test_delete_documents_in_batches(self):
+        client = FakeScrollClient(5)
+        document_ids = (hit['_id'] for hit in elasticSearchFunctions.iter_all_results(client, {}, page_size=2))
+        deleted = elasticSearchFunctions._bulk_actions(client, (
+            ({'delete': {'_index': 'transfers', '_type': 'transferfile', '_id': document_id}}, None)
+            for document_id in document_ids), max_documents=2)
+        assert deleted == 5
+        assert [len(request) for request in client.requests] == [2, 2, 1]
+
+
+class TestReadMETSStructure(unittest.TestCase):
+
+    def test_read_mets_structure(self):
+        dmdSec, aic_identifier, is_part_of, transfer_metadata, files = \
+            elasticSearchFunctions._read_mets_structure(os.path.join(THIS_DIR, 'fixtures', 'test_index_mets_METS.xml'))
+        assert dmdSec['ns0:xmlData']['ns1:dublincore']['dc:title'] == 'T'
+        assert aic_identifier is None
+        assert is_part_of == 'AIC#1'
+        assert transfer_metadata == [{'a': '1', 'b': '2'}]
+        assert files == [
+            ('amdSec_0', 'file-00000000-0000-0000-0000-000000000001', 'objects/f0.TXT'),
+            ('amdSec_1', 'file-00000000-0000-0000-0000-000000000002', 'objects/f1.TXT'),
+            (None, 'file-00000000-0000-0000-0000-0000000f423f', 'objects/metadata/m.csv'),
+        ]
+
+    def test_sections_are_discarded(self):
+        sections = elasticSearchFunctions._iter_mets_sections(os.path.join(THIS_DIR, 'fixtures', 'test_index_mets_METS.xml'))
+        first = next(sections)
+        assert first.tag == '{http://www.loc.gov/METS/}metsHdr'
+        next(sections)
+        # The previous section has been cleared
+        assert len(first.attrib) == 0
+        assert len(first) == 0
@@ -1,12 +1,13 @@
 from __future__ import absolute_import
 import os
 import StringIO
+import tempfile
 import ConfigParser
 
 from django.test import TestCase
 import pytest
 
-from env_configparser import EnvConfigParser
+from env_configparser import EnvConfigParser, read_client_config
 
 
 class TestConfigReader(TestCase):
@@ -93,3 +94,17 @@ foo = bar
 """)
         assert config.getboolean('main', 'undefined_option', fallback=True) == True
         assert config.getint('undefined_section', 'undefined_option', fallback=12345) == 12345
+
+    def test_read_client_config(self):
+        """
+        The client's configuration falls back on the defaults given, even if
+        the file is missing.
+        """
+        with tempfile.NamedTemporaryFile() as f:
+            f.write('[MCPClient]\nworkers = 8\n')
+            f.flush()
+            config = read_client_config({'workers': '4', 'size': '10'}, f.name)
+            assert config.getint('MCPClient', 'workers') == 8
+            assert config.getint('MCPClient', 'size') == 10
+        config = read_client_config({'workers': '4'}, '/no/such/file.conf')
+        assert config.getint('MCPClient', 'workers') == 4
@@ -0,0 +1,68 @@
+# -*- coding: UTF-8 -*-
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from executeOrRunSubProcess import executeOrRun, removeOldSpools
+
+
+class TestSpooledOutput(unittest.TestCase):
+    """Test capturing subprocess output through spool files."""
+
+    def setUp(self):
+        self.spool_dir = tempfile.mkdtemp()
+        self.spool_path = os.path.join(self.spool_dir, 'task')
+
+    def tearDown(self):
+        shutil.rmtree(self.spool_dir)
+
+    def test_short_output(self):
+        """It should return short output whole, and remove the spool files."""
+        ret = executeOrRun('command', 'echo hello', printing=False, spool_path=self.spool_path)
+        assert ret == (0, 'hello\n', '')
+        assert os.listdir(self.spool_dir) == []
+
+    def test_long_output(self):
+        """It should return the head and tail of long output, and keep its spool file."""
+        script = 'import sys; sys.stdout.write("a" * 1000 + "z" * 10); sys.stderr.write("error")'
+        exit_code, stdout, stderr = executeOrRun('command', ['python', '-c', script], printing=False,
+                                                 spool_path=self.spool_path, head_size=100, tail_size=10)
+        assert exit_code == 0
+        assert stdout.startswith('a' * 100 + '\n[... 900 bytes omitted; full output in ')
+        assert stdout.endswith('\n' + 'z' * 10)
+        assert stderr == 'error'
+        assert os.listdir(self.spool_dir) == ['task.stdout']
+        assert os.path.getsize(self.spool_path + '.stdout') == 1010
+
+    def test_stdin(self):
+        """It should still pass standard input to the process."""
+        ret = executeOrRun('command', 'cat', stdIn='input', printing=False, spool_path=self.spool_path)
+        assert ret == (0, 'input', '')
+
+    def test_remove_old_spools(self):
+        """It should remove only spool files older than the retention period."""
+        for name, age in (('old.stdout', 3600), ('new.stdout', 0)):
+            path = os.path.join(self.spool_dir, name)
+            open(path, 'w').close()
+            os.utime(path, (time.time() - age, time.time() - age))
+        assert removeOldSpools(self.spool_dir, 60) == 1
+        assert os.listdir(self.spool_dir) == ['new.stdout']
+
+    def test_rusage_callback(self):
+        """It should report the process' resource usage and its exit code."""
+        usage = []
+        ret = executeOrRun('command', ['sh', '-c', 'cat; exit 3'], stdIn='input', printing=False,
+                           spool_path=self.spool_path, rusage_callback=usage.append)
+        assert ret == (3, 'input', '')
+        assert len(usage) == 1
+        assert usage[0].ru_maxrss > 0
+
+    def test_rusage_callback_signal(self):
+        """It should report a process killed by a signal like subprocess does."""
+        usage = []
+        ret = executeOrRun('command', ['sh', '-c', 'kill -9 $$'], printing=False,
+                           spool_path=self.spool_path, rusage_callback=usage.append)
+        assert ret[0] == -9
+        assert len(usage) == 1
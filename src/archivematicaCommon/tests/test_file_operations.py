@@ -0,0 +1,46 @@
+# -*- coding: UTF-8 -*-
+import hashlib
+import os
+import shutil
+import tempfile
+
+from django.test import TestCase
+
+import fileOperations
+from main.models import FileDigest
+
+
+class TestCachedChecksums(TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'file')
+        with open(self.path, 'wb') as f:
+            f.write('contents')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_checksums_are_cached(self):
+        checksums = fileOperations.get_cached_checksums(self.path, ['md5', 'sha256'])
+        assert checksums['md5'] == hashlib.md5('contents').hexdigest()
+        assert FileDigest.objects.filter(inode=os.stat(self.path).st_ino).count() == 2
+
+        # Cached digests are used without reading the file
+        FileDigest.objects.filter(algorithm='md5').update(checksum='cached')
+        assert fileOperations.get_cached_checksums(self.path, ['md5'])['md5'] == 'cached'
+        # unless refreshed
+        assert fileOperations.get_cached_checksums(self.path, ['md5'], refresh=True)['md5'] == hashlib.md5('contents').hexdigest()
+
+    def test_changed_files_are_read_again(self):
+        fileOperations.get_cached_checksums(self.path, ['md5'])
+        with open(self.path, 'ab') as f:
+            f.write(' changed')
+        assert fileOperations.get_cached_checksums(self.path, ['md5'])['md5'] == hashlib.md5('contents changed').hexdigest()
+
+    def test_files_on_other_devices_are_read(self):
+        fileOperations.get_cached_checksums(self.path, ['md5'])
+        # Digests of a file with the same inode on another filesystem
+        FileDigest.objects.update(device=os.stat(self.path).st_dev + 1, checksum='other')
+        assert fileOperations.get_cached_checksums(self.path, ['md5'])['md5'] == hashlib.md5('contents').hexdigest()
+        assert FileDigest.objects.count() == 2
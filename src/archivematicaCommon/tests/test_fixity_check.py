@@ -0,0 +1,85 @@
+# -*- coding: UTF-8 -*-
+import hashlib
+import os
+import shutil
+import tempfile
+import unittest
+
+import pytest
+
+import fixityCheck
+
+
+class TestFixityCheck(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.checkpoint_path = os.path.join(self.tmpdir, 'checkpoint', 'unit.checkpoint')
+        self.files = []
+        for i in range(5):
+            path = os.path.join(self.tmpdir, 'file{}'.format(i))
+            with open(path, 'wb') as f:
+                f.write('contents {}'.format(i) * 1000)
+            checksum = hashlib.md5(open(path, 'rb').read()).hexdigest()
+            self.files.append(fixityCheck.Expected('uuid{}'.format(i), path, checksum, 'md5'))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def _check(self, **kwargs):
+        return fixityCheck.FixityCheck(checkpoint_path=self.checkpoint_path, workers=2, read_size=100, **kwargs)
+
+    def test_verifies_all_files(self):
+        recorded = []
+        bad = self.files[0]._replace(checksum='0' * 32)
+        results = self._check(batch_size=2).run([bad] + self.files[1:], recorded.extend)
+        assert sorted(r.expected.key for r in recorded) == ['uuid0', 'uuid1', 'uuid2', 'uuid3', 'uuid4']
+        passed = {r.expected.key: fixityCheck.result_passed(r) for r in results}
+        assert passed == {'uuid0': False, 'uuid1': True, 'uuid2': True, 'uuid3': True, 'uuid4': True}
+        assert not os.path.exists(self.checkpoint_path)
+
+    def test_unreadable_files(self):
+        missing = fixityCheck.Expected('missing', os.path.join(self.tmpdir, 'missing'), '0' * 32, 'md5')
+        results = self._check().run([missing], lambda results: None)
+        assert results[0].checksum is None
+        assert results[0].error
+
+    def test_resumes_from_checkpoint(self):
+        recorded = []
+
+        def interrupted(results):
+            if recorded:
+                raise KeyboardInterrupt()
+            recorded.extend(results)
+
+        with pytest.raises(KeyboardInterrupt):
+            self._check(batch_size=2).run(self.files, interrupted)
+        assert len(recorded) == 2
+        assert os.path.exists(self.checkpoint_path)
+
+        # Files recorded by the interrupted run aren't hashed or recorded again
+        rerecorded = []
+        results = self._check(batch_size=2).run(self.files, rerecorded.extend)
+        assert len(results) == 5
+        assert all(fixityCheck.result_passed(r) for r in results)
+        assert {r.expected.key for r in results if r.resumed} == {r.expected.key for r in recorded}
+        assert len(rerecorded) == 3
+        assert not os.path.exists(self.checkpoint_path)
+
+    def test_changed_files_are_hashed_again(self):
+        recorded = []
+
+        def interrupted(results):
+            if recorded:
+                raise KeyboardInterrupt()
+            recorded.extend(results)
+
+        with pytest.raises(KeyboardInterrupt):
+            self._check(batch_size=1).run(self.files, interrupted)
+        with open(recorded[0].expected.path, 'ab') as f:
+            f.write('changed')
+
+        results = self._check().run(self.files, lambda results: None)
+        changed = [r for r in results if r.expected.key == recorded[0].expected.key][0]
+        assert not changed.resumed
+        assert not fixityCheck.result_passed(changed)
@@ -0,0 +1,28 @@
+# -*- coding: UTF-8 -*-
+import socket
+import unittest
+import urllib2
+
+import pytest
+
+import metricsServer
+
+
+class TestMetricsServer(unittest.TestCase):
+
+    def test_not_served_without_listen(self):
+        assert metricsServer.serve('') is False
+        assert metricsServer.serve(None) is False
+
+    def test_not_served_on_bad_listen(self):
+        assert metricsServer.serve('localhost:port') is False
+
+    @pytest.mark.skipif(metricsServer.prometheus_client is None, reason='prometheus_client is not installed')
+    def test_serves_metrics(self):
+        sock = socket.socket()
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+        sock.close()
+        assert metricsServer.serve('127.0.0.1:{}'.format(port)) is True
+        response = urllib2.urlopen('http://127.0.0.1:{}/metrics'.format(port), timeout=10)
+        assert response.getcode() == 200
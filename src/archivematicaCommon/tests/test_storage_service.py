@@ -0,0 +1,126 @@
+# -*- coding: UTF-8 -*-
+import json
+
+from django.test import TestCase
+import requests
+
+import storageService as storage_service
+from main.models import DashboardSetting
+
+
+class PagedResource(object):
+    """ Serves objects in pages of two, as the storage service's API does. """
+
+    def __init__(self, objects):
+        self.objects = objects
+        self.requests = []
+
+    def get(self, offset=0, **params):
+        self.requests.append(dict(params, offset=offset))
+        next_page = offset + 2 < len(self.objects)
+        return {
+            'objects': self.objects[offset:offset + 2],
+            'meta': {'limit': 2, 'next': 'next' if next_page else None},
+        }
+
+
+class FakeSession(object):
+    """ Serves the storage service's file resource from files, in pages of
+    two, recording the params of each request. """
+
+    def __init__(self, files, allow_uuid_in=True):
+        self.files = files
+        self.allow_uuid_in = allow_uuid_in
+        self.requests = []
+
+    def request(self, method, url, params=None, **kwargs):
+        params = params or {}
+        self.requests.append(params)
+        response = requests.Response()
+        response.headers['content-type'] = 'application/json'
+        if 'uuid__in' in params and not self.allow_uuid_in:
+            response.status_code = 400
+            response._content = json.dumps({'error': 'The \'uuid\' field does not allow filtering.'})
+            return response
+        if 'uuid__in' in params:
+            files = [f for f in self.files if f['uuid'] in params['uuid__in'].split(',')]
+        else:
+            files = [f for f in self.files if f['uuid'] == params['uuid']]
+        offset = params.get('offset', 0)
+        response.status_code = 200
+        response._content = json.dumps({
+            'objects': files[offset:offset + 2],
+            'meta': {'limit': 2, 'next': 'next' if offset + 2 < len(files) else None},
+        })
+        return response
+
+
+class TestStorageService(TestCase):
+
+    def setUp(self):
+        storage_service.clear_cache()
+        DashboardSetting.objects.create(name='storage_service_url', value='http://localhost:8000')
+        DashboardSetting.objects.create(name='storage_service_user', value='test')
+        DashboardSetting.objects.create(name='storage_service_apikey', value='key')
+
+    def test_api_is_reused_until_settings_change(self):
+        api = storage_service._storage_api()
+        assert storage_service._storage_api() is api
+
+        DashboardSetting.objects.filter(name='storage_service_apikey').update(value='other')
+        # The settings are cached
+        assert storage_service._storage_api() is api
+        storage_service.clear_cache()
+        assert storage_service._storage_api() is not api
+
+    def test_responses_are_cached(self):
+        fetched = []
+
+        def fetch():
+            fetched.append(1)
+            return [{'uuid': 'a'}]
+
+        locations = storage_service._cached('key', 30, fetch)
+        # Callers can't change what is cached
+        locations[0]['uuid'] = 'b'
+        assert storage_service._cached('key', 30, fetch) == [{'uuid': 'a'}]
+        assert len(fetched) == 1
+
+        # Failed lookups are tried again if asked
+        assert storage_service._cached('none', 30, lambda: None, cache_none=False) is None
+        assert storage_service._cached('none', 30, lambda: 'found', cache_none=False) == 'found'
+
+    def test_get_all_follows_pages(self):
+        resource = PagedResource([1, 2, 3, 4, 5])
+        assert storage_service._get_all(resource, uuid__in='a,b') == [1, 2, 3, 4, 5]
+        assert [request['offset'] for request in resource.requests] == [0, 2, 4]
+        assert all(request['uuid__in'] == 'a,b' for request in resource.requests)
+
+    def use_session(self, session):
+        """ Makes a new storage API client, which uses session. """
+        self.addCleanup(storage_service._api.update, settings=None)
+        self.addCleanup(setattr, requests, 'Session', requests.Session)
+        requests.Session = lambda: session
+        storage_service._api['settings'] = None
+
+    def test_files_info_are_looked_up_in_batches(self):
+        files = [{'uuid': str(i), 'status': 'UPLOADED'} for i in range(5)]
+        session = FakeSession(files)
+        self.use_session(session)
+
+        files_info = storage_service.get_files_info(['0', '1', '2', '4', 'unknown'], batch_size=3)
+        assert files_info == {f['uuid']: f for f in files if f['uuid'] != '3'}
+        # Each batch is fetched page by page
+        assert [(request['uuid__in'], request['offset']) for request in session.requests] == [
+            ('0,1,2', 0), ('0,1,2', 2), ('4,unknown', 0)]
+
+    def test_files_info_are_looked_up_one_at_a_time_if_batches_are_refused(self):
+        files = [{'uuid': str(i), 'status': 'DELETED'} for i in range(3)]
+        session = FakeSession(files, allow_uuid_in=False)
+        self.use_session(session)
+
+        files_info = storage_service.get_files_info(['0', '1', '2', 'unknown'], batch_size=2)
+        assert files_info == {f['uuid']: f for f in files}
+        # Batches aren't tried again once refused
+        assert [request.get('uuid__in', request.get('uuid')) for request in session.requests] == [
+            '0,1', '0', '1', '2', 'unknown']
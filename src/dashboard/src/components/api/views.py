@@ -82,27 +82,22 @@ def get_unit_status(unit_uuid, unit_type):
     :return: Dict with status info.
     """
     ret = {}
-    job = models.Job.objects.filter(sipuuid=unit_uuid).filter(unittype=unit_type).order_by('-createdtime', '-createdtimedec')[0]
-    ret['microservice'] = job.jobtype
-    if job.currentstep == 'Awaiting decision':
-        ret['status'] = 'USER_INPUT'
-    elif 'failed' in job.microservicegroup.lower():
-        ret['status'] = 'FAILED'
-    elif 'reject' in job.microservicegroup.lower():
-        ret['status'] = 'REJECTED'
-    elif job.jobtype == 'Remove the processing directory':  # Done storing AIP
-        ret['status'] = 'COMPLETE'
-    elif models.Job.objects.filter(sipuuid=unit_uuid).filter(jobtype='Create SIP from transfer objects').exists():
-        ret['status'] = 'COMPLETE'
-        # Get SIP UUID
-        sips = models.File.objects.filter(transfer_id=unit_uuid, sip__isnull=False).values('sip').distinct()
-        if sips:
-            ret['sip_uuid'] = sips[0]['sip']
-    elif models.Job.objects.filter(sipuuid=unit_uuid).filter(jobtype='Move transfer to backlog').exists():
-        ret['status'] = 'COMPLETE'
-        ret['sip_uuid'] = 'BACKLOG'
+    try:
+        unit_status = models.UnitStatus.objects.get(unit_uuid=unit_uuid, unit_type=unit_type)
+    except models.UnitStatus.DoesNotExist:
+        unit_status = models.UnitStatus.objects.refresh(unit_uuid, unit_type)
     else:
+        if unit_status.status == 'COMPLETE' and unit_status.sip_uuid is None:
+            # The transfer's files may not have been in a SIP yet
+            unit_status = models.UnitStatus.objects.refresh(unit_uuid, unit_type)
+    if unit_status is None:  # No jobs yet
+        ret['microservice'] = None
         ret['status'] = 'PROCESSING'
+        return ret
+    ret['microservice'] = unit_status.microservice
+    ret['status'] = unit_status.status
+    if unit_status.sip_uuid is not None:
+        ret['sip_uuid'] = unit_status.sip_uuid
 
     return ret
 
@@ -299,14 +294,11 @@ def _completed_units(unit_type='transfer'):
     'ingest'.
     """
     model_name = {'transfer': 'Transfer', 'ingest': 'SIP'}.get(unit_type)
-    model = getattr(models, model_name)
-    completed = []
-    units = model.objects.filter(hidden=False)
-    for unit in units:
-        status = get_unit_status(unit.uuid, 'unit{0}'.format(model_name))
-        if status.get('status') == 'COMPLETE':
-            completed.append(unit.uuid)
-    return completed
+    return list(models.UnitStatus.objects.filter(
+        unit_type='unit{0}'.format(model_name),
+        hidden=False,
+        status='COMPLETE',
+    ).values_list('unit_uuid', flat=True))
 
 
 def unapproved_transfers(request):
@@ -514,6 +506,7 @@ def reingest(request, target):
     # TODO Clear DB of residual stuff related to SIP
     models.Task.objects.filter(job__sipuuid=sip_uuid).delete()
     models.Job.objects.filter(sipuuid=sip_uuid).delete()
+    models.UnitStatus.objects.filter(unit_uuid=sip_uuid).delete()
     models.SIP.objects.filter(uuid=sip_uuid).delete()  # Delete is cascading
     models.RightsStatement.objects.filter(metadataappliestoidentifier=sip_uuid).delete()  # Not actually a foreign key
     models.DublinCore.objects.filter(metadataappliestoidentifier=sip_uuid).delete()
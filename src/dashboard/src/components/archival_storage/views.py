@@ -265,12 +265,12 @@ def create_aic(request, *args, **kwargs):
             }
         }
         es_client = elasticSearchFunctions.get_client()
-        results = es_client.search(
+        results = elasticSearchFunctions.search_all_results(
+            es_client,
             body=query,
             index='aips',
             doc_type='aip',
             fields='uuid,name',
-            size=elasticSearchFunctions.MAX_QUERY_SIZE,  # return all records
         )
 
         # Create files in staging directory with AIP information
@@ -465,13 +465,14 @@ def list_display(request):
             }
         }
     }
-    deleted_aip_results = es_client.search(
+    deleted_aip_results = elasticSearchFunctions.iter_all_results(
+        es_client,
         body=query,
         index='aips',
         doc_type='aip',
         fields='uuid,status'
     )
-    for deleted_aip in deleted_aip_results['hits']['hits']:
+    for deleted_aip in deleted_aip_results:
         aips_deleted_or_pending_deletion.append(deleted_aip['fields']['uuid'][0])
 
     # Fetch results and paginate
@@ -509,16 +510,20 @@ def list_display(request):
         current_page_number
     )
 
+    # check with storage server to see current status of the AIPs on this
+    # page which were deleted or are pending deletion
+    aips_info = storage_service.get_files_info(
+        aip['uuid'] for aip in page.object_list
+        if aip['uuid'] in aips_deleted_or_pending_deletion)
+
     # process deletion, etc., and format results
     aips = []
     for aip in page.object_list:
         # If an AIP was deleted or is pending deletion, react if status changed
         if aip['uuid'] in aips_deleted_or_pending_deletion:
-            # check with storage server to see current status
-            api_results = storage_service.get_file_info(uuid=aip['uuid'])
             try:
-                aip_status = api_results[0]['status']
-            except IndexError:
+                aip_status = aips_info[aip['uuid']]['status']
+            except KeyError:
                 # Storage service does not know about this AIP
                 # TODO what should happen here?
                 logger.info("AIP not found in storage service: {}".format(aip))
@@ -57,20 +57,21 @@ def check_and_remove_deleted_transfers(es_client):
         }
     }
 
-    deletion_pending_results = es_client.search(
+    deletion_pending_results = elasticSearchFunctions.iter_all_results(
+        es_client,
         body=query,
         index='transfers',
         doc_type='transfer',
         fields='uuid,status'
     )
 
-    for hit in deletion_pending_results['hits']['hits']:
-        transfer_uuid = hit['fields']['uuid'][0]
+    transfer_uuids = [hit['fields']['uuid'][0] for hit in deletion_pending_results]
+    transfers_info = storage_service.get_files_info(transfer_uuids)
 
-        api_results = storage_service.get_file_info(uuid=transfer_uuid)
+    for transfer_uuid in transfer_uuids:
         try:
-            status = api_results[0]['status']
-        except IndexError:
+            status = transfers_info[transfer_uuid]['status']
+        except KeyError:
             logger.info('Transfer not found in storage service: {}'.format(transfer_uuid))
             continue
 
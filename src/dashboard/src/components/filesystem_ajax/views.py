@@ -24,7 +24,7 @@ import shutil
 import tempfile
 import uuid
 
-from django.db import IntegrityError
+from django.db import IntegrityError, transaction
 import django.http
 import django.template.defaultfilters
 
@@ -34,6 +34,7 @@ from main import models
 
 import archivematicaFunctions
 import databaseFunctions
+import elasticSearchFunctions
 import storageService as storage_service
 
 # for unciode sorting support
@@ -48,6 +49,8 @@ ORIGINAL_DIR = os.path.join(SHARED_DIRECTORY_ROOT, 'www', 'AIPsStore', 'transfer
 
 DEFAULT_BACKLOG_PATH = 'originals/'
 DEFAULT_ARRANGE_PATH = '/arrange/'
+# SIPArrange rows inserted, or looked up, per query when copying to arrange
+ARRANGE_BATCH_SIZE = 500
 
 TRANSFER_TYPE_DIRECTORIES = {
     'standard': 'standardTransfer',
@@ -546,13 +549,42 @@ def move_files_within_arrange(sourcepath, destination):
         raise ValueError('You cannot drag and drop onto a file.')
 
 
-def _get_arrange_directory_tree(backlog_uuid, original_path, arrange_path):
+def _get_backlog_file_uuids(sourcepath):
+    """ Returns the file and transfer UUIDs of the files of the backlogged
+    transfer sourcepath is in, by path relative to the backlog.
+
+    They are fetched from the transfers index in one go. If sourcepath isn't
+    within a transfer, or the index can't be searched, nothing is returned
+    and the files are looked up in the storage service one by one instead.
+    """
+    transfer_directory = sourcepath.replace(DEFAULT_BACKLOG_PATH, '', 1).split('/')[0]
+    match = re.search(r'-([\w]{8}(-[\w]{4}){3}-[\w]{12})$', transfer_directory)
+    if match is None:
+        return {}
+    transfer_uuid = match.group(1)
+    try:
+        es_client = elasticSearchFunctions.get_client()
+        file_uuids = elasticSearchFunctions.get_transfer_file_uuids(es_client, transfer_uuid)
+    except Exception:
+        logger.warning('Unable to fetch the files of transfer %s from the index', transfer_uuid, exc_info=True)
+        return {}
+    # Paths from the storage service are UTF-8 encoded
+    return dict((relative_path.encode('utf-8'), (file_uuid, transfer_uuid))
+                for relative_path, file_uuid in file_uuids.items())
+
+
+def _get_arrange_directory_tree(backlog_uuid, original_path, arrange_path, file_uuids=None):
     """ Fetches all the children of original_path from backlog_uuid and creates
     an identical tree in arrange_path.
 
+    file_uuids are the (file UUID, transfer UUID) of files by path relative to
+    the backlog, as returned by _get_backlog_file_uuids; files not in it are
+    looked up in the storage service.
+
     Helper function for copy_to_arrange.
     """
-    # TODO Use ElasticSearch, since that's where we're getting the original info from now?  Could be easier to get file UUID that way
+    if file_uuids is None:
+        file_uuids = _get_backlog_file_uuids(original_path)
     ret = []
     browse = storage_service.browse_location(backlog_uuid, original_path)
 
@@ -562,13 +594,16 @@ def _get_arrange_directory_tree(backlog_uuid, original_path, arrange_path):
         if entry not in ('processingMCP.xml'):
             path = os.path.join(original_path, entry)
             relative_path = path.replace(DEFAULT_BACKLOG_PATH, '', 1)
-            try:
-                file_info = storage_service.get_file_metadata(relative_path=relative_path)[0]
-            except storage_service.ResourceNotFound:
-                logger.warning('No file information returned from the Storage Service for file at relative_path: %s', relative_path)
-                raise
-            file_uuid = file_info['fileuuid']
-            transfer_uuid = file_info['sipuuid']
+            if relative_path in file_uuids:
+                file_uuid, transfer_uuid = file_uuids[relative_path]
+            else:
+                try:
+                    file_info = storage_service.get_file_metadata(relative_path=relative_path)[0]
+                except storage_service.ResourceNotFound:
+                    logger.warning('No file information returned from the Storage Service for file at relative_path: %s', relative_path)
+                    raise
+                file_uuid = file_info['fileuuid']
+                transfer_uuid = file_info['sipuuid']
             ret.append(
                 {'original_path': path,
                  'arrange_path': os.path.join(arrange_path, entry),
@@ -587,11 +622,48 @@ def _get_arrange_directory_tree(backlog_uuid, original_path, arrange_path):
                         'arrange_path': arrange_dir,
                         'file_uuid': None,
                         'transfer_uuid': None})
-            ret.extend(_get_arrange_directory_tree(backlog_uuid, original_dir, arrange_dir))
+            ret.extend(_get_arrange_directory_tree(backlog_uuid, original_dir, arrange_dir, file_uuids))
 
     return ret
 
 
+def _create_arrange_entries(entries):
+    """ Creates a SIPArrange row for each of entries, ARRANGE_BATCH_SIZE at a
+    time.
+
+    Files which were already arranged are left out, since a file can only be
+    in one SIP. """
+    original_paths = [entry['original_path'] for entry in entries if entry['original_path'] is not None]
+    arranged = set()
+    for start in range(0, len(original_paths), ARRANGE_BATCH_SIZE):
+        arranged.update(models.SIPArrange.objects.filter(
+            original_path__in=original_paths[start:start + ARRANGE_BATCH_SIZE]).values_list('original_path', flat=True))
+
+    rows = []
+    for entry in entries:
+        if entry['original_path'] is not None:
+            if entry['original_path'] in arranged:
+                logger.info('Already arranged, not adding: %s', entry)
+                continue
+            arranged.add(entry['original_path'])
+        rows.append(models.SIPArrange(**entry))
+
+    for start in range(0, len(rows), ARRANGE_BATCH_SIZE):
+        batch = rows[start:start + ARRANGE_BATCH_SIZE]
+        try:
+            with transaction.atomic():
+                models.SIPArrange.objects.bulk_create(batch)
+        except IntegrityError:
+            # Some of the files were arranged meanwhile; add the others one
+            # at a time
+            for row in batch:
+                try:
+                    with transaction.atomic():
+                        row.save()
+                except IntegrityError:
+                    logger.exception('Integrity error inserting: %s', row)
+
+
 def copy_files_to_arrange(sourcepath, destination, fetch_children=False, backlog_uuid=None):
     sourcepath = sourcepath.lstrip('/')  # starts with 'originals/', not '/originals/'
     # Insert each file into the DB
@@ -659,20 +731,8 @@ def copy_files_to_arrange(sourcepath, destination, fetch_children=False, backlog
     logger.info('arrange_path: %s', arrange_path)
     logger.debug('files to be added: %s', to_add)
 
-    for entry in to_add:
-        try:
-            # TODO enforce uniqueness on arrange panel?
-            models.SIPArrange.objects.create(
-                original_path=entry['original_path'],
-                arrange_path=entry['arrange_path'],
-                file_uuid=entry['file_uuid'],
-                transfer_uuid=entry['transfer_uuid'],
-            )
-        except IntegrityError:
-            # FIXME Expecting this to catch duplicate original_paths, which
-            # we want to ignore since a file can only be in one SIP.  Needs
-            # to be updated not to ignore other classes of IntegrityErrors.
-            logger.exception('Integrity error inserting: %s', entry)
+    # TODO enforce uniqueness on arrange panel?
+    _create_arrange_entries(to_add)
 
 
 def copy_to_arrange(request, sources=None, destinations=None, fetch_children=False):
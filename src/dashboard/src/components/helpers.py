@@ -147,21 +147,35 @@ def task_duration_in_seconds(task):
         duration = '< 1'
     return duration
 
+JOB_PRIORITIES = {
+    'completedUnsuccessfully': 0,
+    'requiresAprroval': 1,
+    'requiresApproval': 1,
+    'exeCommand': 2,
+    'verificationCommand': 3,
+    'completedSuccessfully': 4,
+    'cleanupSuccessfulCommand': 5,
+}
+
+def _job_priority(job):
+    try: return JOB_PRIORITIES[job.currentstep]
+    except Exception: return 0
+
 def get_jobs_by_sipuuid(uuid):
     jobs = models.Job.objects.filter(sipuuid=uuid,subjobof='').order_by('-createdtime', 'subjobof')
-    priorities = {
-        'completedUnsuccessfully': 0,
-        'requiresAprroval': 1,
-        'requiresApproval': 1,
-        'exeCommand': 2,
-        'verificationCommand': 3,
-        'completedSuccessfully': 4,
-        'cleanupSuccessfulCommand': 5,
-    }
-    def get_priority(job):
-        try: return priorities[job.currentstep]
-        except Exception: return 0
-    return sorted(jobs, key = get_priority) # key = lambda job: priorities[job.currentstep]
+    return sorted(jobs, key = _job_priority) # key = lambda job: priorities[job.currentstep]
+
+def get_jobs_by_sipuuids(uuids, batch_size=500):
+    """
+    Returns the jobs of many units, as get_jobs_by_sipuuid does for one, in a
+    dict by unit UUID, with a query for each batch_size units.
+    """
+    uuids = list(uuids)
+    jobs = {uuid: [] for uuid in uuids}
+    for start in range(0, len(uuids), batch_size):
+        for job in models.Job.objects.filter(sipuuid__in=uuids[start:start + batch_size], subjobof='').order_by('-createdtime', 'subjobof'):
+            jobs[job.sipuuid].append(job)
+    return {uuid: sorted(unit_jobs, key=_job_priority) for uuid, unit_jobs in jobs.items()}
 
 def get_metadata_type_id_by_description(description):
     return models.MetadataAppliesToType.objects.get(description=description)
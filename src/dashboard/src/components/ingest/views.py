@@ -17,11 +17,8 @@
 
 # Standard library, alphabetical by import source
 import base64
-import calendar
 import cPickle
-import json
 import logging
-from lxml import etree
 import os
 import requests
 import shutil
@@ -33,7 +30,6 @@ import uuid
 from django.conf import settings as django_settings
 from django.contrib import messages
 from django.core.urlresolvers import reverse
-from django.db.models import Max
 from django.forms.models import modelformset_factory
 from django.http import Http404, HttpResponse, HttpResponseBadRequest
 from django.shortcuts import render, redirect
@@ -45,12 +41,12 @@ from django.views.generic import View
 
 # This project, alphabetical by import source
 from contrib import utils
-from contrib.mcp.client import MCPClient
 from components import advanced_search
 from components import helpers
 from components import decorators
 from components.ingest import forms as ingest_forms
 from components.ingest.views_NormalizationReport import getNormalizationReportQuery
+from components.unit import status as unit_status
 from main import forms
 from main import models
 
@@ -66,6 +62,7 @@ logger = logging.getLogger('archivematica.dashboard')
 
 def ingest_grid(request):
     polling_interval = django_settings.POLLING_INTERVAL
+    long_poll_timeout = django_settings.STATUS_LONG_POLL_TIMEOUT
     microservices_help = django_settings.MICROSERVICES_HELP
     uid = request.user.id
 
@@ -88,63 +85,7 @@ class SipsView(View):
         })
 
 def ingest_status(request, uuid=None):
-    # Equivalent to: "SELECT SIPUUID, MAX(createdTime) AS latest FROM Jobs WHERE unitType='unitSIP' GROUP BY SIPUUID
-    objects = models.Job.objects.filter(hidden=False, subjobof='').values('sipuuid').annotate(timestamp=Max('createdtime')).exclude(sipuuid__icontains = 'None').filter(unittype__exact = 'unitSIP')
-    mcp_available = False
-    try:
-        client = MCPClient()
-        mcp_status = etree.XML(client.list())
-        mcp_available = True
-    except Exception: pass
-    def encoder(obj):
-        items = []
-        for item in obj:
-            # Check if hidden (TODO: this method is slow)
-            if models.SIP.objects.is_hidden(item['sipuuid']):
-                continue
-            jobs = helpers.get_jobs_by_sipuuid(item['sipuuid'])
-            item['directory'] = utils.get_directory_name_from_job(jobs)
-            item['timestamp'] = calendar.timegm(item['timestamp'].timetuple())
-            item['uuid'] = item['sipuuid']
-            item['id'] = item['sipuuid']
-            del item['sipuuid']
-            item['jobs'] = []
-            for job in jobs:
-                newJob = {}
-                item['jobs'].append(newJob)
-
-                # allow user to know name of file that has failed normalization
-                if job.jobtype == 'Access normalization failed - copying' or job.jobtype == 'Preservation normalization failed - copying' or job.jobtype == 'thumbnail normalization failed - copying':
-                    task = models.Task.objects.get(job=job)
-                    newJob['filename'] = task.filename
-
-                newJob['uuid'] = job.jobuuid
-                newJob['type'] = job.jobtype
-                newJob['microservicegroup'] = job.microservicegroup
-                newJob['subjobof'] = job.subjobof
-                newJob['currentstep'] = job.currentstep
-                newJob['timestamp'] = '%d.%s' % (calendar.timegm(job.createdtime.timetuple()), str(job.createdtimedec).split('.')[-1])
-                try: mcp_status
-                except NameError: pass
-                else:
-                    xml_unit = mcp_status.xpath('choicesAvailableForUnit[UUID="%s"]' % job.jobuuid)
-                    if xml_unit:
-                        xml_unit_choices = xml_unit[0].findall('choices/choice')
-                        choices = {}
-                        for choice in xml_unit_choices:
-                            choices[choice.find("chainAvailable").text] = choice.find("description").text
-                        newJob['choices'] = choices
-            items.append(item)
-        return items
-
-    response = {}
-    response['objects'] = objects
-    response['mcp'] = mcp_available
-
-    return HttpResponse(
-        json.JSONEncoder(default=encoder).encode(response),
-        content_type='application/json'
-    )
+    return helpers.json_response(unit_status.get_status('unitSIP'))
 
 def ingest_sip_metadata_type_id():
     return helpers.get_metadata_type_id_by_description('SIP')
@@ -15,14 +15,11 @@
 # You should have received a copy of the GNU General Public License
 # along with Archivematica.  If not, see <http://www.gnu.org/licenses/>.
 
-import calendar
 import json
 import logging
-from lxml import etree
 import os
 from uuid import uuid4
 
-from django.db.models import Max
 from django.conf import settings as django_settings
 from django.contrib import messages
 from django.core.urlresolvers import reverse
@@ -30,12 +27,12 @@ from django.shortcuts import render, redirect
 from django.http import HttpResponse
 from django.utils.safestring import mark_safe
 
-from contrib.mcp.client import MCPClient
 from contrib import utils
 
 from main import models
 from components import helpers
 from components.ingest.forms import DublinCoreMetadataForm
+from components.unit import status as unit_status
 import components.decorators as decorators
 import storageService as storage_service
 
@@ -47,6 +44,7 @@ logger = logging.getLogger('archivematica.dashboard')
 
 def grid(request):
     polling_interval = django_settings.POLLING_INTERVAL
+    long_poll_timeout = django_settings.STATUS_LONG_POLL_TIMEOUT
     microservices_help = django_settings.MICROSERVICES_HELP
     uid = request.user.id
     hide_features = helpers.hidden_features()
@@ -127,52 +125,7 @@ def component(request, uuid):
     return render(request, 'transfer/component.html', locals())
 
 def status(request, uuid=None):
-    # Equivalent to: "SELECT SIPUUID, MAX(createdTime) AS latest FROM Jobs GROUP BY SIPUUID
-    objects = models.Job.objects.filter(hidden=False, subjobof='', unittype__exact='unitTransfer').values('sipuuid').annotate(timestamp=Max('createdtime')).exclude(sipuuid__icontains = 'None').order_by('-timestamp')
-    mcp_available = False
-    try:
-        client = MCPClient()
-        mcp_status = etree.XML(client.list())
-        mcp_available = True
-    except Exception: pass
-    def encoder(obj):
-        items = []
-        for item in obj:
-            # Check if hidden (TODO: this method is slow)
-            if models.Transfer.objects.is_hidden(item['sipuuid']):
-                continue
-            jobs = helpers.get_jobs_by_sipuuid(item['sipuuid'])
-            item['directory'] = os.path.basename(utils.get_directory_name_from_job(jobs))
-            item['timestamp'] = calendar.timegm(item['timestamp'].timetuple())
-            item['uuid'] = item['sipuuid']
-            item['id'] = item['sipuuid']
-            del item['sipuuid']
-            item['jobs'] = []
-            for job in jobs:
-                newJob = {}
-                item['jobs'].append(newJob)
-                newJob['uuid'] = job.jobuuid
-                newJob['type'] = job.jobtype
-                newJob['microservicegroup'] = job.microservicegroup
-                newJob['subjobof'] = job.subjobof
-                newJob['currentstep'] = job.currentstep
-                newJob['timestamp'] = '%d.%s' % (calendar.timegm(job.createdtime.timetuple()), str(job.createdtimedec).split('.')[-1])
-                try: mcp_status
-                except NameError: pass
-                else:
-                    xml_unit = mcp_status.xpath('choicesAvailableForUnit[UUID="%s"]' % job.jobuuid)
-                    if xml_unit:
-                        xml_unit_choices = xml_unit[0].findall('choices/choice')
-                        choices = {}
-                        for choice in xml_unit_choices:
-                            choices[choice.find("chainAvailable").text] = choice.find("description").text
-                        newJob['choices'] = choices
-            items.append(item)
-        return items
-    response = {}
-    response['objects'] = objects
-    response['mcp'] = mcp_available
-    return HttpResponse(json.JSONEncoder(default=encoder).encode(response), content_type='application/json')
+    return helpers.json_response(unit_status.get_status('unitTransfer', basename=True))
 
 def transfer_metadata_type_id():
     return helpers.get_metadata_type_id_by_description('Transfer')
@@ -0,0 +1,193 @@
+# This file is part of Archivematica.
+#
+# Copyright 2010-2016 Artefactual Systems Inc. <http://artefactual.com>
+#
+# Archivematica is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Archivematica is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Archivematica.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Status of the units in the transfer and ingest grids.
+
+get_status returns every visible unit of a type with its jobs, and
+get_status_delta only the units which changed since a cursor returned by an
+earlier call, optionally waiting for a change first. The choices of jobs
+awaiting decision come from a snapshot of the MCP server's, which is only
+fetched again once the jobs awaiting decision change.
+"""
+
+import calendar
+import datetime
+import logging
+import os
+import threading
+import time
+
+from django.db.models import Max
+from django.utils import timezone
+
+from components import helpers
+from contrib import utils
+from contrib.mcp.client import MCPClient
+from main import models
+
+LOGGER = logging.getLogger('archivematica.dashboard')
+
+# Jobs whose task's filename is shown, so users know which file failed
+FAILED_NORMALIZATION_JOBS = (
+    'Access normalization failed - copying',
+    'Preservation normalization failed - copying',
+    'thumbnail normalization failed - copying',
+)
+# Changes this many seconds older than a cursor are sent again, in case they
+# were committed late, or by a server whose clock is behind
+CURSOR_OVERLAP = 2
+# Seconds between checks for changes while waiting for one
+WAIT_INTERVAL = 1
+# Seconds the choices snapshot is used for at most
+CHOICES_MAX_AGE = 30
+
+_choices = {'time': 0, 'awaiting': None, 'version': None, 'choices': {}}
+_choices_lock = threading.Lock()
+
+
+def get_choices():
+    """
+    Returns the choices available for each job awaiting decision, as a dict
+    of {chain: description} dicts by job UUID, and whether the MCP server
+    could be reached.
+    """
+    awaiting = frozenset(models.UnitStatus.objects.filter(status='USER_INPUT').values_list('job_uuid', flat=True))
+    with _choices_lock:
+        if _choices['awaiting'] == awaiting and time.time() - _choices['time'] < CHOICES_MAX_AGE:
+            return _choices['choices'], True
+        # The MCP server only sends the choices again if they changed since
+        # the version we have, which is only of use for the same jobs
+        version = _choices['version'] if _choices['awaiting'] == awaiting else None
+        try:
+            response = MCPClient().get_choices(job_uuids=sorted(awaiting), version=version)
+        except Exception:
+            LOGGER.debug('Unable to fetch choices from the MCP server', exc_info=True)
+            response = None
+        if not response:
+            _choices['awaiting'] = None
+            return {}, False
+        if not response['notModified']:
+            _choices['choices'] = dict(
+                (job_uuid, dict(job['choices'])) for job_uuid, job in response['choices'].items())
+        _choices.update(time=time.time(), awaiting=awaiting, version=response['version'])
+        return _choices['choices'], True
+
+
+def _items(unit_statuses, choices, basename):
+    """ Returns the grid's items for unit_statuses, with their jobs. """
+    jobs_by_unit = helpers.get_jobs_by_sipuuids(unit_status.unit_uuid for unit_status in unit_statuses)
+    failed_normalization_jobs = [job.jobuuid for jobs in jobs_by_unit.values() for job in jobs
+                                 if job.jobtype in FAILED_NORMALIZATION_JOBS]
+    filenames = dict(models.Task.objects.filter(job__in=failed_normalization_jobs).values_list('job', 'filename'))
+
+    items = []
+    for unit_status in unit_statuses:
+        jobs = jobs_by_unit[unit_status.unit_uuid]
+        directory = utils.get_directory_name_from_job(jobs)
+        item = {
+            'directory': os.path.basename(directory) if basename else directory,
+            'timestamp': calendar.timegm(unit_status.timestamp.timetuple()),
+            'uuid': unit_status.unit_uuid,
+            'id': unit_status.unit_uuid,
+            'jobs': [],
+        }
+        for job in jobs:
+            newJob = {
+                'uuid': job.jobuuid,
+                'type': job.jobtype,
+                'microservicegroup': job.microservicegroup,
+                'subjobof': job.subjobof,
+                'currentstep': job.currentstep,
+                'timestamp': '%d.%s' % (calendar.timegm(job.createdtime.timetuple()), str(job.createdtimedec).split('.')[-1]),
+            }
+            if job.jobuuid in filenames:
+                newJob['filename'] = filenames[job.jobuuid]
+            if job.jobuuid in choices:
+                newJob['choices'] = choices[job.jobuuid]
+            item['jobs'].append(newJob)
+        items.append(item)
+    return items
+
+
+def _visible(unit_type):
+    return models.UnitStatus.objects.filter(unit_type=unit_type, timestamp__isnull=False).exclude(unit_uuid__icontains='None')
+
+
+def _cursor(unit_type):
+    updated = models.UnitStatus.objects.filter(unit_type=unit_type).aggregate(updated=Max('updated'))['updated']
+    if updated is None:
+        return '0'
+    return '%.6f' % (calendar.timegm(updated.utctimetuple()) + updated.microsecond / 1e6)
+
+
+def _parse_cursor(cursor):
+    """ Returns the time of cursor, or None if it isn't a valid cursor. """
+    try:
+        return datetime.datetime.fromtimestamp(float(cursor), timezone.utc)
+    except (TypeError, ValueError, OverflowError):
+        return None
+
+
+def get_status(unit_type, basename=False):
+    """
+    Returns the status of every visible unit of unit_type ('unitTransfer' or
+    'unitSIP'), and a cursor for get_status_delta.
+
+    :param bool basename: Whether to show only the last part of the units' directories.
+    """
+    cursor = _cursor(unit_type)
+    choices, mcp_available = get_choices()
+    unit_statuses = list(_visible(unit_type).filter(hidden=False).order_by('-timestamp'))
+    return {
+        'objects': _items(unit_statuses, choices, basename),
+        'mcp': mcp_available,
+        'cursor': cursor,
+    }
+
+
+def get_status_delta(unit_type, cursor, wait=0, basename=False):
+    """
+    Returns the units of unit_type which changed since cursor, as get_status
+    does, in 'objects', and those which have been hidden since, in
+    'removed'. If cursor isn't valid, every unit is returned, with 'full' set.
+
+    If nothing changed, waits up to wait seconds for a change.
+    """
+    since = _parse_cursor(cursor)
+    if since is None:
+        response = get_status(unit_type, basename=basename)
+        response.update(removed=[], full=True)
+        return response
+
+    deadline = time.time() + wait
+    while not models.UnitStatus.objects.filter(unit_type=unit_type, updated__gt=since).exists():
+        if time.time() >= deadline:
+            choices, mcp_available = get_choices()
+            return {'objects': [], 'removed': [], 'mcp': mcp_available, 'cursor': cursor, 'full': False}
+        time.sleep(WAIT_INTERVAL)
+
+    new_cursor = _cursor(unit_type)
+    choices, mcp_available = get_choices()
+    changed = list(_visible(unit_type).filter(updated__gt=since - datetime.timedelta(seconds=CURSOR_OVERLAP)).order_by('-timestamp'))
+    return {
+        'objects': _items([unit_status for unit_status in changed if not unit_status.hidden], choices, basename),
+        'removed': [unit_status.unit_uuid for unit_status in changed if unit_status.hidden],
+        'mcp': mcp_available,
+        'cursor': new_cursor,
+        'full': False,
+    }
@@ -17,9 +17,12 @@
 import logging
 
 import django.http
+from django.conf import settings
 from django.shortcuts import render
+from django.utils import timezone
 
 from components import helpers
+from components.unit import status as unit_status
 from contrib import utils
 from main import models
 
@@ -83,8 +86,29 @@ def mark_hidden(request, unit_type, unit_uuid):
         unit = unit_model.objects.get(uuid=unit_uuid)
         unit.hidden = True
         unit.save()
+        models.UnitStatus.objects.filter(unit_uuid=unit_uuid).update(hidden=True, updated=timezone.now())
         response = {'removed': True}
         return helpers.json_response(response)
     except Exception:
         LOGGER.debug('Error setting %s %s to hidden', unit_type, unit_uuid, exc_info=True)
         raise django.http.Http404
+
+
+def status_delta(request, unit_type):
+    """
+    Return the units of the transfer or ingest grid which changed since the
+    cursor of an earlier response, waiting for a change for up to the 'wait'
+    seconds requested, or STATUS_LONG_POLL_TIMEOUT. Without a cursor,
+    returns every unit, as the status views do.
+
+    :param unit_type: 'transfer' or 'ingest' for Transfers or SIPs respectively
+    """
+    try:
+        wait = max(0, min(float(request.GET.get('wait', 0)), settings.STATUS_LONG_POLL_TIMEOUT))
+    except ValueError:
+        wait = 0
+    if unit_type == 'transfer':
+        response = unit_status.get_status_delta('unitTransfer', request.GET.get('cursor'), wait=wait, basename=True)
+    else:
+        response = unit_status.get_status_delta('unitSIP', request.GET.get('cursor'), wait=wait)
+    return helpers.json_response(response)
@@ -17,6 +17,7 @@
 
 import gearman
 import cPickle
+import json
 
 try:
     import django.conf.settings as settings
@@ -54,6 +55,23 @@ class MCPClient:
         elif completed_job_request.state == gearman.JOB_FAILED:
             raise RPCError("getJobsAwaitingApproval failed (check MCPServer logs)")
 
+    def get_choices(self, job_uuids=None, version=None):
+        """
+        Returns the choices available for the jobs awaiting decision with
+        UUIDs in job_uuids, or all of them: a dict with their 'version' and,
+        in 'choices', the 'unit' and [chain, description] pairs ('choices')
+        of each job by UUID. If version is still the current one, choices are
+        left out and 'notModified' is True.
+        """
+        gm_client = gearman.GearmanClient([self.server])
+        data = json.dumps({'jobUUIDs': job_uuids, 'version': version})
+        completed_job_request = gm_client.submit_job("getChoices", data, None)
+        gm_client.shutdown()
+        if completed_job_request.state == gearman.JOB_COMPLETE:
+            return json.loads(completed_job_request.result)
+        elif completed_job_request.state == gearman.JOB_FAILED:
+            raise RPCError("getChoices failed (check MCPServer logs)")
+
     def notifications(self):
         gm_client = gearman.GearmanClient([self.server])
         completed_job_request = gm_client.submit_job("getNotifications", "", None)
@@ -62,3 +80,9 @@ class MCPClient:
             return cPickle.loads(completed_job_request.result)
         elif completed_job_request.state == gearman.JOB_FAILED:
             raise RPCError("getNotifications failed (check MCPServer logs)")
+
+    def reload_workflow(self):
+        """Ask the MCP server to reload its copy of the workflow tables. Doesn't wait for it to happen."""
+        gm_client = gearman.GearmanClient([self.server])
+        gm_client.submit_job("reloadWorkflow", "", background=True, wait_until_complete=False)
+        gm_client.shutdown()
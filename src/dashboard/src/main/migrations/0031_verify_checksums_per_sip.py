@@ -0,0 +1,44 @@
+from __future__ import print_function, unicode_literals
+
+from django.db import migrations
+
+
+ONE_INSTANCE_TASK_TYPE = '36b2e239-4a57-4aa5-8ebc-7a29139baca6'
+VERIFY_CHECKSUMS_TC = 'ef024cf9-1737-4161-b48a-13b4a8abddcd'
+VERIFY_CHECKSUMS_STC = '4f400b71-37be-49d0-8da3-125abac2bfd0'
+
+
+def data_migration(apps, schema_editor):
+    """Run the "Verify checksums generated on ingest" micro-service once for
+    the whole SIP instead of once for each file, so verifyPREMISChecksums can
+    hash the files in parallel and write their events in bulk. Essentially,
+    run this SQL::
+
+        UPDATE TasksConfigs
+            SET taskType='36b2e239-4a57-4aa5-8ebc-7a29139baca6'
+            WHERE pk='ef024cf9-1737-4161-b48a-13b4a8abddcd';
+        UPDATE StandardTasksConfigs
+            SET filterSubDir=NULL,
+                arguments='--sipUUID "%SIPUUID%" --sipDirectory "%SIPDirectory%" --date "%date%"'
+            WHERE pk='4f400b71-37be-49d0-8da3-125abac2bfd0';
+    """
+    TaskConfig = apps.get_model('main', 'TaskConfig')
+    StandardTaskConfig = apps.get_model('main', 'StandardTaskConfig')
+    TaskConfig.objects\
+        .filter(id=VERIFY_CHECKSUMS_TC)\
+        .update(tasktype_id=ONE_INSTANCE_TASK_TYPE)
+    StandardTaskConfig.objects\
+        .filter(id=VERIFY_CHECKSUMS_STC)\
+        .update(filter_subdir=None,
+                arguments='--sipUUID "%SIPUUID%" --sipDirectory "%SIPDirectory%" --date "%date%"')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0030_rights_import'),
+    ]
+
+    operations = [
+        migrations.RunPython(data_migration),
+    ]
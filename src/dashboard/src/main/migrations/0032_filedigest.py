@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0031_verify_checksums_per_sip'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FileDigest',
+            fields=[
+                ('id', models.AutoField(serialize=False, primary_key=True, db_column=b'pk')),
+                ('device', models.BigIntegerField()),
+                ('inode', models.BigIntegerField()),
+                ('size', models.BigIntegerField()),
+                ('mtime', models.FloatField()),
+                ('algorithm', models.CharField(max_length=16)),
+                ('checksum', models.CharField(max_length=128)),
+                ('created', models.DateTimeField(auto_now_add=True, db_index=True)),
+            ],
+            options={
+                'db_table': 'FileDigests',
+            },
+            bases=(models.Model,),
+        ),
+        migrations.AlterUniqueTogether(
+            name='filedigest',
+            unique_together=set([('device', 'inode', 'size', 'mtime', 'algorithm')]),
+        ),
+    ]
@@ -0,0 +1,62 @@
+from __future__ import print_function, unicode_literals
+
+from django.db import migrations
+
+
+ONE_INSTANCE_TASK_TYPE = '36b2e239-4a57-4aa5-8ebc-7a29139baca6'
+SCAN_FOR_VIRUSES_TCS = [
+    'fecb3fe4-5c5c-4796-b9dc-c7d7cf33a9f3',  # Scan for viruses in submission documentation
+    '5370a0cb-da97-4983-868a-1376d7737af5',  # Scan for viruses on extracted files
+    '8850aeff-8553-4ff1-ab31-99b5392a458b',  # Scan for viruses in metadata
+    '3c002fb6-a511-461e-ad16-0d2c46649374',  # Scan for viruses
+    '9a0f8eac-6a9d-4b85-8049-74954fbd6594',  # Scan for viruses
+]
+# StandardTaskConfig: the subdirectory of the unit it used to filter files by
+SCAN_FOR_VIRUSES_STCS = {
+    '2fdb8408-8bbb-45d1-846b-5e28bf220d5c': 'objects/submissionDocumentation',
+    '51bce222-4157-427c-aca9-a670083db223': 'objects/',
+    '7316e6ed-1c1a-4bf6-a570-aead6b544e41': 'objects/metadata',
+    'de58249f-9594-439d-8bea-536ce59d70a3': '',
+}
+UNIT_ARGUMENTS = '--unitUUID "%SIPUUID%" --unitType "%unitType%" --unitDirectory "%SIPDirectory%" --date "%date%"'
+
+
+def data_migration(apps, schema_editor):
+    """Run the "Scan for viruses" micro-services once for the whole unit
+    instead of once for each file, so archivematicaClamscan can scan the files
+    with clamd several at a time and write their events in bulk. The
+    subdirectory the files were filtered by is passed to the script instead.
+    Essentially, run this SQL::
+
+        UPDATE TasksConfigs
+            SET taskType='36b2e239-4a57-4aa5-8ebc-7a29139baca6'
+            WHERE pk IN ('fecb3fe4-5c5c-4796-b9dc-c7d7cf33a9f3', ...);
+        UPDATE StandardTasksConfigs
+            SET filterSubDir=NULL,
+                arguments='--unitUUID "%SIPUUID%" --unitType "%unitType%" --unitDirectory "%SIPDirectory%" --date "%date%" --subdirectory "objects/submissionDocumentation"'
+            WHERE pk='2fdb8408-8bbb-45d1-846b-5e28bf220d5c';
+        ...
+    """
+    TaskConfig = apps.get_model('main', 'TaskConfig')
+    StandardTaskConfig = apps.get_model('main', 'StandardTaskConfig')
+    TaskConfig.objects\
+        .filter(id__in=SCAN_FOR_VIRUSES_TCS)\
+        .update(tasktype_id=ONE_INSTANCE_TASK_TYPE)
+    for pk, subdirectory in SCAN_FOR_VIRUSES_STCS.items():
+        arguments = UNIT_ARGUMENTS
+        if subdirectory:
+            arguments += ' --subdirectory "{}"'.format(subdirectory)
+        StandardTaskConfig.objects\
+            .filter(id=pk)\
+            .update(filter_subdir=None, arguments=arguments)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0032_filedigest'),
+    ]
+
+    operations = [
+        migrations.RunPython(data_migration),
+    ]
@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django_extensions.db.fields
+
+
+ONE_INSTANCE_TASK_TYPE = '36b2e239-4a57-4aa5-8ebc-7a29139baca6'
+# StandardTaskConfig: (the subdirectory of the unit it used to filter files by, whether it skips identified files)
+IDENTIFY_FILE_FORMAT_STCS = {
+    '9c3680a5-91cb-413f-af4e-d39c3346f8db': ('objects', True),
+    '02fd0952-4c9c-4da6-9ea3-a1409c87963d': ('objects/attachments', False),
+    '82b08f3a-ca8f-4259-bd92-2fc1ab4f9974': ('objects/submissionDocumentation', False),
+    '866037a3-d99e-4b9c-afb5-6de527a26e35': ('objects/metadata/', False),
+}
+UNIT_ARGUMENTS = '"%IDCommand%" --unitUUID "%SIPUUID%" --unitType "%unitType%" --unitDirectory "%SIPDirectory%"'
+
+
+def data_migration(apps, schema_editor):
+    """Run the "Identify file format" micro-services once for the whole unit
+    instead of once for each file, so identifyFileFormat can look the FPR
+    rules up once, reuse the output of earlier identifications of identical
+    files and write its results in bulk. The subdirectory the files were
+    filtered by is passed to the script instead. Essentially, run this SQL::
+
+        UPDATE TasksConfigs
+            SET taskType='36b2e239-4a57-4aa5-8ebc-7a29139baca6'
+            WHERE taskTypePKReference IN ('9c3680a5-91cb-413f-af4e-d39c3346f8db', ...);
+        UPDATE StandardTasksConfigs
+            SET filterSubDir=NULL,
+                arguments='"%IDCommand%" --unitUUID "%SIPUUID%" --unitType "%unitType%" --unitDirectory "%SIPDirectory%" --subdirectory "objects" --disable-reidentify'
+            WHERE pk='9c3680a5-91cb-413f-af4e-d39c3346f8db';
+        ...
+    """
+    TaskConfig = apps.get_model('main', 'TaskConfig')
+    StandardTaskConfig = apps.get_model('main', 'StandardTaskConfig')
+    TaskConfig.objects\
+        .filter(tasktypepkreference__in=IDENTIFY_FILE_FORMAT_STCS.keys())\
+        .update(tasktype_id=ONE_INSTANCE_TASK_TYPE)
+    for pk, (subdirectory, disable_reidentify) in IDENTIFY_FILE_FORMAT_STCS.items():
+        arguments = UNIT_ARGUMENTS + ' --subdirectory "{}"'.format(subdirectory)
+        if disable_reidentify:
+            arguments += ' --disable-reidentify'
+        StandardTaskConfig.objects\
+            .filter(id=pk)\
+            .update(filter_subdir=None, arguments=arguments)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0033_scan_for_viruses_per_unit'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FormatIdentificationCache',
+            fields=[
+                ('id', models.AutoField(serialize=False, primary_key=True, db_column=b'pk')),
+                ('command_uuid', django_extensions.db.fields.UUIDField(editable=False, max_length=36, db_column=b'commandUUID', blank=True)),
+                ('checksum_type', models.CharField(max_length=16, db_column=b'checksumType')),
+                ('checksum', models.CharField(max_length=128)),
+                ('extension', models.CharField(max_length=32, blank=True)),
+                ('output', models.TextField()),
+                ('created', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'db_table': 'FormatIdentificationCache',
+            },
+            bases=(models.Model,),
+        ),
+        migrations.AlterUniqueTogether(
+            name='formatidentificationcache',
+            unique_together=set([('command_uuid', 'checksum_type', 'checksum', 'extension')]),
+        ),
+        migrations.RunPython(data_migration),
+    ]
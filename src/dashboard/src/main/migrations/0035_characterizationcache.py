@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django_extensions.db.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0034_identify_file_format_per_unit'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CharacterizationCache',
+            fields=[
+                ('id', models.AutoField(serialize=False, primary_key=True, db_column=b'pk')),
+                ('checksum_type', models.CharField(max_length=16, db_column=b'checksumType')),
+                ('checksum', models.CharField(max_length=128)),
+                ('extension', models.CharField(max_length=32, blank=True)),
+                ('rule_uuid', django_extensions.db.fields.UUIDField(editable=False, max_length=36, db_column=b'ruleUUID', blank=True)),
+                ('tool_version', models.CharField(max_length=64, db_column=b'toolVersion')),
+                ('content', models.BinaryField()),
+                ('size', models.BigIntegerField()),
+                ('last_used', models.DateTimeField(db_index=True, db_column=b'lastUsed')),
+            ],
+            options={
+                'db_table': 'CharacterizationCache',
+            },
+            bases=(models.Model,),
+        ),
+        migrations.AlterUniqueTogether(
+            name='characterizationcache',
+            unique_together=set([('checksum_type', 'checksum', 'extension', 'rule_uuid', 'tool_version')]),
+        ),
+    ]
@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+def data_migration(apps, schema_editor):
+    """Record the status of every unit which has jobs, as
+    UnitStatus.objects.refresh does."""
+    Job = apps.get_model('main', 'Job')
+    File = apps.get_model('main', 'File')
+    SIP = apps.get_model('main', 'SIP')
+    Transfer = apps.get_model('main', 'Transfer')
+    UnitStatus = apps.get_model('main', 'UnitStatus')
+
+    hidden = set(SIP.objects.filter(hidden=True).values_list('uuid', flat=True))
+    hidden.update(Transfer.objects.filter(hidden=True).values_list('uuid', flat=True))
+    completed = {}
+    for jobtype in ('Create SIP from transfer objects', 'Move transfer to backlog'):
+        completed[jobtype] = set(Job.objects.filter(jobtype=jobtype).values_list('sipuuid', flat=True))
+
+    unit_statuses = []
+    for unit_uuid, unit_type in Job.objects.values_list('sipuuid', 'unittype').distinct().iterator():
+        jobs = Job.objects.filter(sipuuid=unit_uuid, unittype=unit_type).order_by('-createdtime', '-createdtimedec')
+        job = jobs.first()
+        sip_uuid = None
+        if job.currentstep == 'Awaiting decision':
+            status = 'USER_INPUT'
+        elif 'failed' in job.microservicegroup.lower():
+            status = 'FAILED'
+        elif 'reject' in job.microservicegroup.lower():
+            status = 'REJECTED'
+        elif job.jobtype == 'Remove the processing directory':
+            status = 'COMPLETE'
+        elif unit_uuid in completed['Create SIP from transfer objects']:
+            status = 'COMPLETE'
+            sip_uuid = File.objects.filter(transfer_id=unit_uuid, sip__isnull=False).values_list('sip', flat=True).first()
+        elif unit_uuid in completed['Move transfer to backlog']:
+            status = 'COMPLETE'
+            sip_uuid = 'BACKLOG'
+        else:
+            status = 'PROCESSING'
+        unit_statuses.append(UnitStatus(
+            unit_uuid=unit_uuid,
+            unit_type=unit_type,
+            job_uuid=job.jobuuid,
+            microservice=job.jobtype,
+            status=status,
+            sip_uuid=sip_uuid,
+            directory=job.directory,
+            timestamp=jobs.filter(hidden=False, subjobof='').values_list('createdtime', flat=True).first(),
+            hidden=unit_type in ('unitSIP', 'unitTransfer') and unit_uuid in hidden,
+        ))
+    UnitStatus.objects.bulk_create(unit_statuses, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0035_characterizationcache'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UnitStatus',
+            fields=[
+                ('id', models.AutoField(serialize=False, primary_key=True, db_column=b'pk')),
+                ('unit_uuid', models.CharField(max_length=36, db_column=b'unitUUID')),
+                ('unit_type', models.CharField(max_length=50, db_column=b'unitType')),
+                ('job_uuid', models.CharField(max_length=36, db_column=b'jobUUID')),
+                ('microservice', models.CharField(max_length=250, blank=True)),
+                ('directory', models.TextField(blank=True)),
+                ('status', models.CharField(max_length=16)),
+                ('sip_uuid', models.CharField(max_length=36, null=True, db_column=b'sipUUID', blank=True)),
+                ('timestamp', models.DateTimeField(null=True, blank=True)),
+                ('hidden', models.BooleanField(default=False)),
+            ],
+            options={
+                'db_table': 'UnitStatuses',
+            },
+            bases=(models.Model,),
+        ),
+        migrations.AlterUniqueTogether(
+            name='unitstatus',
+            unique_together=set([('unit_uuid', 'unit_type')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='unitstatus',
+            index_together=set([('unit_type', 'hidden', 'status')]),
+        ),
+        migrations.RunPython(data_migration),
+    ]
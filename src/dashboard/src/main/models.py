@@ -26,7 +26,7 @@ import logging
 # Core Django, alphabetical by import source
 from django import forms
 from django.contrib.auth.models import User
-from django.db import models
+from django.db import IntegrityError, models, transaction
 from django.db.models.signals import post_save
 from django.dispatch import receiver
 
@@ -429,6 +429,96 @@ class Task(models.Model):
         db_table = u'Tasks'
 
 
+class UnitStatusManager(models.Manager):
+    def refresh(self, unit_uuid, unit_type):
+        """
+        Update the status of the unit from its jobs, returning the UnitStatus,
+        or None if the unit has no jobs.
+
+        Status is one of FAILED, REJECTED, USER_INPUT, COMPLETE or PROCESSING,
+        from the most recent job; sip_uuid is the SIP created from a complete
+        transfer, or BACKLOG if it was sent to backlog instead.
+        """
+        jobs = Job.objects.filter(sipuuid=unit_uuid, unittype=unit_type).order_by('-createdtime', '-createdtimedec')
+        job = jobs.first()
+        if job is None:
+            self.filter(unit_uuid=unit_uuid, unit_type=unit_type).delete()
+            return None
+
+        sip_uuid = None
+        if job.currentstep == 'Awaiting decision':
+            status = 'USER_INPUT'
+        elif 'failed' in job.microservicegroup.lower():
+            status = 'FAILED'
+        elif 'reject' in job.microservicegroup.lower():
+            status = 'REJECTED'
+        elif job.jobtype == 'Remove the processing directory':  # Done storing AIP
+            status = 'COMPLETE'
+        elif Job.objects.filter(sipuuid=unit_uuid, jobtype='Create SIP from transfer objects').exists():
+            status = 'COMPLETE'
+            sip_uuid = File.objects.filter(transfer_id=unit_uuid, sip__isnull=False).values_list('sip', flat=True).first()
+        elif Job.objects.filter(sipuuid=unit_uuid, jobtype='Move transfer to backlog').exists():
+            status = 'COMPLETE'
+            sip_uuid = 'BACKLOG'
+        else:
+            status = 'PROCESSING'
+
+        unit_model = {'unitSIP': SIP, 'unitTransfer': Transfer}.get(unit_type)
+        values = {
+            'job_uuid': job.jobuuid,
+            'microservice': job.jobtype,
+            'status': status,
+            'sip_uuid': sip_uuid,
+            'directory': job.directory,
+            # When the unit last appeared in the dashboard's list of jobs
+            'timestamp': jobs.filter(hidden=False, subjobof='').values_list('createdtime', flat=True).first(),
+            'hidden': unit_model is not None and unit_model.objects.is_hidden(unit_uuid),
+        }
+        try:
+            with transaction.atomic():
+                unit_status, _ = self.update_or_create(unit_uuid=unit_uuid, unit_type=unit_type, defaults=values)
+        except IntegrityError:
+            # Created by another thread at the same time
+            unit_status, _ = self.update_or_create(unit_uuid=unit_uuid, unit_type=unit_type, defaults=values)
+        return unit_status
+
+    def refresh_job(self, job_uuid):
+        """ Update the status of the unit of the job with UUID job_uuid. """
+        for unit_uuid, unit_type in Job.objects.filter(jobuuid=job_uuid).values_list('sipuuid', 'unittype'):
+            self.refresh(unit_uuid, unit_type)
+
+
+class UnitStatus(models.Model):
+    """
+    Status of each unit, derived from its jobs by UnitStatus.objects.refresh
+    whenever the MCP server creates or updates one, so the status of units
+    can be read without scanning the Jobs table.
+    """
+    id = models.AutoField(primary_key=True, db_column='pk')
+    unit_uuid = models.CharField(max_length=36, db_column='unitUUID')
+    unit_type = models.CharField(max_length=50, db_column='unitType')
+    # The most recent job
+    job_uuid = models.CharField(max_length=36, db_column='jobUUID')
+    microservice = models.CharField(max_length=250, blank=True)
+    directory = models.TextField(blank=True)
+    status = models.CharField(max_length=16)
+    sip_uuid = models.CharField(max_length=36, db_column='sipUUID', null=True, blank=True)
+    timestamp = models.DateTimeField(null=True, blank=True)
+    hidden = models.BooleanField(default=False)
+    # When the row last changed; see components.unit.status
+    updated = models.DateTimeField(auto_now=True, db_index=True)
+
+    objects = UnitStatusManager()
+
+    class Meta:
+        db_table = u'UnitStatuses'
+        unique_together = ('unit_uuid', 'unit_type')
+        index_together = ('unit_type', 'hidden', 'status')
+
+    def __unicode__(self):
+        return u'{0} {1}: {2}'.format(self.unit_type, self.unit_uuid, self.status)
+
+
 class Agent(models.Model):
     """ PREMIS Agents created for the system.  """
     id = models.AutoField(primary_key=True, db_column='pk', editable=False)
@@ -1010,6 +1100,68 @@ class FileID(models.Model):
     class Meta:
         db_table = 'FilesIDs'
 
+class FileDigest(models.Model):
+    """
+    Digests of files by device, inode, size and modification time, so that a
+    file which hasn't changed isn't read again to compute the same digest.
+    Entries are short-lived; File.checksum is the record of a file's checksum.
+    """
+    id = models.AutoField(primary_key=True, db_column='pk')
+    device = models.BigIntegerField()
+    inode = models.BigIntegerField()
+    size = models.BigIntegerField()
+    mtime = models.FloatField()
+    algorithm = models.CharField(max_length=16)
+    checksum = models.CharField(max_length=128)
+    created = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        db_table = u'FileDigests'
+        unique_together = ('device', 'inode', 'size', 'mtime', 'algorithm')
+
+class FormatIdentificationCache(models.Model):
+    """
+    Output of format identification commands by the checksum and extension of
+    the file they identified, so that files identical to one already
+    identified, in the same unit or another, aren't identified again by the
+    same command. Commands such as FIDO's and Siegfried's take the extension
+    into account, so it is part of the key. The FPR rules are applied to the
+    output each time it is used.
+    """
+    id = models.AutoField(primary_key=True, db_column='pk')
+    command_uuid = UUIDField(auto=False, db_column='commandUUID')
+    checksum_type = models.CharField(max_length=16, db_column='checksumType')
+    checksum = models.CharField(max_length=128)
+    extension = models.CharField(max_length=32, blank=True)
+    output = models.TextField()
+    created = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = u'FormatIdentificationCache'
+        unique_together = ('command_uuid', 'checksum_type', 'checksum', 'extension')
+
+class CharacterizationCache(models.Model):
+    """
+    Compressed XML output of characterization rules by the checksum and
+    extension of the file they characterized and the version of the tool, so
+    that files identical to one already characterized aren't characterized
+    again. The least recently used entries are evicted to bound its size.
+    """
+    id = models.AutoField(primary_key=True, db_column='pk')
+    checksum_type = models.CharField(max_length=16, db_column='checksumType')
+    checksum = models.CharField(max_length=128)
+    extension = models.CharField(max_length=32, blank=True)
+    rule_uuid = UUIDField(auto=False, db_column='ruleUUID')
+    tool_version = models.CharField(max_length=64, db_column='toolVersion')
+    # zlib compressed
+    content = models.BinaryField()
+    size = models.BigIntegerField()
+    last_used = models.DateTimeField(db_index=True, db_column='lastUsed')
+
+    class Meta:
+        db_table = u'CharacterizationCache'
+        unique_together = ('checksum_type', 'checksum', 'extension', 'rule_uuid', 'tool_version')
+
 class LevelOfDescription(models.Model):
     id = UUIDPkField()
     name = models.CharField(max_length='1024')  # seems long, but AtoM allows this much
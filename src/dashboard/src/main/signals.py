@@ -1,7 +1,20 @@
-from django.db.models.signals import post_delete
+import logging
+
+import gearman
+
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
 
+from contrib.mcp.client import MCPClient
 from main.models import RightsStatementRightsGranted, RightsStatement
+from main.models import (MicroServiceChain, MicroServiceChainChoice, MicroServiceChainLink,
+    MicroServiceChainLinkExitCode, StandardTaskConfig, TaskConfig, TaskType)
+
+logger = logging.getLogger('archivematica.dashboard')
+
+# Workflow tables the MCP server keeps a copy of in memory
+WORKFLOW_MODELS = (MicroServiceChain, MicroServiceChainChoice, MicroServiceChainLink,
+                   MicroServiceChainLinkExitCode, StandardTaskConfig, TaskConfig, TaskType)
 
 
 @receiver(post_delete, sender=RightsStatementRightsGranted)
@@ -20,3 +33,19 @@ def delete_rights_statement(sender, **kwargs):
     except RightsStatement.DoesNotExist:
         # The RightsGranted is being deleted as part of a cascasde delete from the RightsStatement
         pass
+
+
+@receiver(post_save)
+@receiver(post_delete)
+def reload_mcp_workflow(sender, **kwargs):
+    """
+    Tell the MCP server the workflow changed, so it stops using its old copy.
+
+    If the MCP server can't be reached the change is only picked up when it restarts.
+    """
+    if sender not in WORKFLOW_MODELS or kwargs.get('raw'):
+        return
+    try:
+        MCPClient().reload_workflow()
+    except gearman.errors.GearmanError:
+        logger.warning('Unable to ask the MCP server to reload the workflow', exc_info=True)
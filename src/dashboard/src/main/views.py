@@ -25,7 +25,6 @@ from django.http import Http404, HttpResponse
 
 from contrib.mcp.client import MCPClient
 from main import models
-from lxml import etree
 from components import helpers
 from archivematicaFunctions import escape
 
@@ -70,13 +69,10 @@ def home(request):
 # TODO: hide removed elements
 def status(request):
     client = MCPClient()
-    xml = etree.XML(client.list())
+    choices = client.get_choices()['choices']
+    unit_types = [job['unit']['type'] for job in choices.values()]
 
-    sip_count = len(xml.xpath('//choicesAvailableForUnits/choicesAvailableForUnit/unit/type[text()="SIP"]'))
-    transfer_count = len(xml.xpath('//choicesAvailableForUnits/choicesAvailableForUnit/unit/type[text()="Transfer"]'))
-    dip_count = len(xml.xpath('//choicesAvailableForUnits/choicesAvailableForUnit/unit/type[text()="DIP"]'))
-
-    response = {'sip': sip_count, 'transfer': transfer_count, 'dip': dip_count}
+    response = {'sip': unit_types.count('SIP'), 'transfer': unit_types.count('Transfer'), 'dip': unit_types.count('DIP')}
 
     return helpers.json_response(response)
 
@@ -840,8 +840,13 @@ BaseAppView = Backbone.View.extend({
 
   initialize: function(options)
     {
-      this.statusUrl = options.statusUrl;
-      this.uid       = options.uid;
+      this.statusUrl      = options.statusUrl;
+      this.deltaUrl       = options.deltaUrl;
+      this.longPollTimeout = options.longPollTimeout || 0;
+      this.uid            = options.uid;
+
+      // Cursor of the last status received, to ask for changes since
+      this.cursor = undefined;
 
       _.bindAll(this, 'add', 'remove');
       Sips.bind('add', this.add);
@@ -1055,23 +1060,39 @@ BaseAppView = Backbone.View.extend({
     {
       this.firstPoll = undefined !== start;
 
+      // Only ask for changes when the grid isn't paged, as pages need all units
+      var delta = this.deltaUrl && !getURLParameter('paged');
+      var url = this.statusUrl + '?' + new Date().getTime();
+      if (delta)
+        {
+          url = this.deltaUrl + '?' + $.param({
+            cursor: this.cursor === undefined ? '' : this.cursor,
+            wait: this.cursor === undefined ? 0 : this.longPollTimeout,
+            _: new Date().getTime()
+          });
+        }
+
       $.ajax({
         context: this,
         dataType: 'json',
         type: 'GET',
-        url: this.statusUrl + '?' + new Date().getTime(),
+        url: url,
         beforeSend: function()
           {
             window.statusWidget.startPoll();
           },
         error: function()
           {
+            this.pollFailed = true;
             window.statusWidget.text('Error trying to connect to database. Trying again...', true);
           },
         success: function(response)
           {
             var objects = response.objects;
 
+            this.pollFailed = false;
+            this.cursor = response.cursor;
+
             if (getURLParameter('paged'))
               {
                 this.updateSips(objects);
@@ -1099,7 +1120,14 @@ BaseAppView = Backbone.View.extend({
               }
 
             // Delete sips
-            if (Sips.length > objects.length)
+            if (delta && !response.full)
+            {
+              Sips.remove(Sips.filter(function(sip)
+                {
+                  return -1 < $.inArray(sip.get('uuid'), response.removed);
+                }));
+            }
+            else if (Sips.length > objects.length)
             {
               var unusedSips = Sips.reject(function(sip)
                   {
@@ -1127,10 +1155,12 @@ BaseAppView = Backbone.View.extend({
 
             if (!self.idle)
             {
+              // Long polls already waited for a change
+              var delay = delta && self.longPollTimeout && !self.pollFailed ? 0 : this.interval;
               setTimeout(function()
                 {
                   self.poll();
-                }, this.interval);
+                }, delay);
             }
           }
       });
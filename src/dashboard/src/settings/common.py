@@ -282,6 +282,10 @@ else:
 MCP_SERVER = ('127.0.0.1', 4730) # localhost:4730
 POLLING_INTERVAL = 5 # Seconds
 STATUS_POLLING_INTERVAL = 5 # Seconds
+# Seconds the transfer and ingest grids' polls wait for a change before
+# returning empty handed. Each waiting poll occupies a worker, so only raise
+# this when the dashboard is served by asynchronous workers.
+STATUS_LONG_POLL_TIMEOUT = 0
 TASKS_PER_PAGE = 10 # for paging in tasks dialog
 UUID_REGEX = '[\w]{8}(-[\w]{4}){3}-[\w]{12}'
 
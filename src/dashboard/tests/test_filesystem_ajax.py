@@ -8,6 +8,7 @@ from django.core.urlresolvers import reverse
 from django.test import TestCase
 from django.test.client import Client
 
+from components.filesystem_ajax import views
 from main import models
 
 THIS_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -147,3 +148,25 @@ class TestSIPArrange(TestCase):
         assert base64.b64encode('subsip') in response_dict['entries']
         assert base64.b64encode('newsip') in response_dict['entries']
         assert len(response_dict['entries']) == 2
+
+    def test_create_arrange_entries(self):
+        count = models.SIPArrange.objects.count()
+        arranged = 'originals/newsip-a29e7e86-eca9-43b6-b059-6f23a9802dc8/objects/evelyn_s_photo.jpg'
+        new = 'originals/newsip-a29e7e86-eca9-43b6-b059-6f23a9802dc8/objects/evelyn_s_fourth_photo.jpg'
+        views._create_arrange_entries([
+            {'original_path': None, 'arrange_path': '/arrange/bulk/', 'file_uuid': None, 'transfer_uuid': None},
+            {'original_path': arranged, 'arrange_path': '/arrange/bulk/evelyn_s_photo.jpg',
+             'file_uuid': '8a5d6f0b-8e4c-4e2a-a9f6-7c5a1b0d2e3f', 'transfer_uuid': 'a29e7e86-eca9-43b6-b059-6f23a9802dc8'},
+            {'original_path': new, 'arrange_path': '/arrange/bulk/evelyn_s_fourth_photo.jpg',
+             'file_uuid': '1c2d3e4f-5a6b-4c7d-8e9f-0a1b2c3d4e5f', 'transfer_uuid': 'a29e7e86-eca9-43b6-b059-6f23a9802dc8'},
+            # The same file twice
+            {'original_path': new, 'arrange_path': '/arrange/bulk/copy.jpg',
+             'file_uuid': '1c2d3e4f-5a6b-4c7d-8e9f-0a1b2c3d4e5f', 'transfer_uuid': 'a29e7e86-eca9-43b6-b059-6f23a9802dc8'},
+        ])
+        # Files can only be arranged once
+        assert models.SIPArrange.objects.count() == count + 2
+        assert models.SIPArrange.objects.get(original_path=arranged).arrange_path != '/arrange/bulk/evelyn_s_photo.jpg'
+        assert models.SIPArrange.objects.get(original_path=new).arrange_path == '/arrange/bulk/evelyn_s_fourth_photo.jpg'
+
+    def test_backlog_file_uuids_outside_transfer(self):
+        assert views._get_backlog_file_uuids('originals/') == {}
@@ -0,0 +1,106 @@
+#!/usr/bin/env python2
+
+import datetime
+import uuid
+
+from django.test import TestCase
+from django.utils import timezone
+
+from components.api import views as api_views
+from components.unit import status as unit_status
+from main import models
+
+TRANSFER_UUID = '3d2d4a59-c6f3-4a6e-9dbd-bd5e0e7f7c8a'
+SIP_UUID = 'f6d1e8d3-1c9b-4a58-b7a4-7f1d4b9e6a1c'
+
+
+class TestUnitStatus(TestCase):
+
+    def setUp(self):
+        self.transfer = models.Transfer.objects.create(uuid=TRANSFER_UUID, currentlocation='%sharedPath%currentlyProcessing/test-' + TRANSFER_UUID + '/')
+        self.time = timezone.now() - datetime.timedelta(hours=1)
+
+    def add_job(self, jobtype, currentstep='Completed successfully', microservicegroup='Verify transfer compliance', unit_uuid=TRANSFER_UUID, unit_type='unitTransfer'):
+        self.time += datetime.timedelta(seconds=1)
+        job = models.Job.objects.create(
+            jobuuid=str(uuid.uuid4()),
+            jobtype=jobtype,
+            createdtime=self.time,
+            directory='%sharedPath%currentlyProcessing/test-' + unit_uuid + '/',
+            sipuuid=unit_uuid,
+            unittype=unit_type,
+            currentstep=currentstep,
+            microservicegroup=microservicegroup,
+        )
+        models.UnitStatus.objects.refresh(unit_uuid, unit_type)
+        return job
+
+    def test_processing_and_awaiting_decision(self):
+        job = self.add_job('Verify transfer compliance')
+        unit_status = models.UnitStatus.objects.get(unit_uuid=TRANSFER_UUID, unit_type='unitTransfer')
+        assert unit_status.status == 'PROCESSING'
+        assert unit_status.job_uuid == job.jobuuid
+        assert unit_status.timestamp == job.createdtime
+        assert not unit_status.hidden
+
+        job = self.add_job('Approve standard transfer', currentstep='Awaiting decision')
+        assert api_views.get_unit_status(TRANSFER_UUID, 'unitTransfer') == {
+            'status': 'USER_INPUT',
+            'microservice': 'Approve standard transfer',
+        }
+
+    def test_completed_transfer(self):
+        models.SIP.objects.create(uuid=SIP_UUID)
+        models.File.objects.create(uuid=str(uuid.uuid4()), transfer=self.transfer, sip_id=SIP_UUID)
+        self.add_job('Create SIP from transfer objects', microservicegroup='Create SIP from Transfer')
+        self.add_job('Move to processing directory', microservicegroup='Create SIP from Transfer')
+        assert api_views.get_unit_status(TRANSFER_UUID, 'unitTransfer') == {
+            'status': 'COMPLETE',
+            'microservice': 'Move to processing directory',
+            'sip_uuid': SIP_UUID,
+        }
+        assert api_views._completed_units('transfer') == [TRANSFER_UUID]
+
+        # Hidden units are left out
+        models.UnitStatus.objects.filter(unit_uuid=TRANSFER_UUID).update(hidden=True)
+        assert api_views._completed_units('transfer') == []
+
+    def test_refresh_job(self):
+        job = self.add_job('Verify transfer compliance')
+        models.Job.objects.filter(jobuuid=job.jobuuid).update(microservicegroup='Failed transfer')
+        models.UnitStatus.objects.refresh_job(job.jobuuid)
+        assert models.UnitStatus.objects.get(unit_uuid=TRANSFER_UUID).status == 'FAILED'
+
+    def test_units_without_jobs(self):
+        assert models.UnitStatus.objects.refresh(TRANSFER_UUID, 'unitTransfer') is None
+        assert api_views.get_unit_status(TRANSFER_UUID, 'unitTransfer')['status'] == 'PROCESSING'
+
+    def test_status_delta(self):
+        self.add_job('Verify transfer compliance')
+        other_uuid = str(uuid.uuid4())
+        self.add_job('Verify transfer compliance', unit_uuid=other_uuid)
+        # Changed long ago
+        models.UnitStatus.objects.filter(unit_uuid=TRANSFER_UUID).update(updated=timezone.now() - datetime.timedelta(hours=1))
+
+        response = unit_status.get_status_delta('unitTransfer', None)
+        assert response['full']
+        assert sorted(item['uuid'] for item in response['objects']) == sorted([TRANSFER_UUID, other_uuid])
+        cursor = response['cursor']
+
+        response = unit_status.get_status_delta('unitTransfer', cursor)
+        assert response['objects'] == []
+        assert response['cursor'] == cursor
+
+        models.UnitStatus.objects.filter(unit_uuid=other_uuid).update(updated=timezone.now() - datetime.timedelta(hours=1))
+        job = self.add_job('Approve standard transfer', currentstep='Awaiting decision')
+        response = unit_status.get_status_delta('unitTransfer', cursor)
+        assert not response['full']
+        assert [item['uuid'] for item in response['objects']] == [TRANSFER_UUID]
+        assert response['objects'][0]['jobs'][0]['uuid'] == job.jobuuid
+        assert float(response['cursor']) > float(cursor)
+
+        models.UnitStatus.objects.filter(unit_uuid=TRANSFER_UUID).update(hidden=True, updated=timezone.now() + datetime.timedelta(seconds=5))
+        response = unit_status.get_status_delta('unitTransfer', response['cursor'])
+        assert response['objects'] == []
+        assert response['removed'] == [TRANSFER_UUID]
+